@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import FacebookAccount, FacebookGroup, ShareCampaign, ShareLog, ObservedPage, HotPost
+from .models import FacebookAccount, FacebookGroup, ShareCampaign, ShareLog, ObservedPage, HotPost, EngagementSnapshot, ScrapeJob
 from .tasks import scrape_page_background_task
 from django.contrib import messages
 
@@ -49,3 +49,16 @@ class HotPostAdmin(admin.ModelAdmin):
     list_display = ('page', 'posted_at', 'total_engagement', 'likes_count', 'comments_count', 'shares_count')
     list_filter = ('page',)
     ordering = ('-total_engagement',)
+
+@admin.register(EngagementSnapshot)
+class EngagementSnapshotAdmin(admin.ModelAdmin):
+    list_display = ('post', 'page', 'measured_at', 'total_engagement', 'likes_count', 'comments_count', 'shares_count')
+    list_filter = ('page',)
+    raw_id_fields = ('post',)
+    ordering = ('-measured_at',)
+
+@admin.register(ScrapeJob)
+class ScrapeJobAdmin(admin.ModelAdmin):
+    list_display = ('job_id', 'page', 'user', 'status', 'progress', 'results_count', 'created_at', 'finished_at')
+    list_filter = ('status', 'user')
+    ordering = ('-created_at',)
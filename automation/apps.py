@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class AutomationConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'automation'
+
+    def ready(self):
+        from automation import signals  # noqa: F401  (đăng ký handler làm mới cache)
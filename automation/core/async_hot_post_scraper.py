@@ -0,0 +1,254 @@
+import asyncio
+import logging
+import time
+
+from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeout
+
+from .browser_pool import ProfileDirLock, context_options, apply_default_timeouts
+from .feed_payloads import FeedCapture
+from .request_policy import RequestStats, attach_request_policy_async
+from .waits import AsyncPageWaiter, WaitLog
+from .hot_post_scraper import HotPostScraper, _LinkCollector, _PostSink, HARVEST_LINKS_JS, POPUP_SNAPSHOT_JS
+
+logger = logging.getLogger(__name__)
+
+
+async def _report_progress(progress_callback, pct):
+    # progress_callback (JobProgress.update) ghi DB đồng bộ → chạy ngoài event loop
+    if progress_callback:
+        await asyncio.to_thread(progress_callback, pct)
+
+
+class AsyncHotPostScraper(HotPostScraper):
+    """
+    Engine async_playwright: cuộn feed giống HotPostScraper, nhưng BƯỚC 2 mở
+    tối đa `concurrency` tab chi tiết song song trong cùng context (giới hạn
+    bằng Semaphore) thay vì goto → go_back từng bài.
+    Kết quả trả về có cùng định dạng với HotPostScraper.scrape_page().
+    Không dùng Chromium pool và không có chế độ dual_tab: mỗi lần scrape tự
+    khởi chạy (và đóng) 1 Chromium riêng.
+    """
+
+    def __init__(self, headless=True, concurrency=4, block_policy=None, intercept_feed=False, use_feed_cards=True):
+        super().__init__(headless=headless, block_policy=block_policy, intercept_feed=intercept_feed,
+                         use_feed_cards=use_feed_cards)
+        self.concurrency = max(1, int(concurrency))
+
+    def scrape_page(self, account_cookies, page_url, progress_callback=None, stop_urls=None, max_days=5, max_posts=50,
+                    on_post=None, should_stop=None, stop_before=None):
+        """Wrapper đồng bộ để gọi từ background task (chạy event loop riêng)."""
+        return asyncio.run(self.scrape_page_async(
+            account_cookies, page_url, progress_callback=progress_callback,
+            stop_urls=stop_urls, max_days=max_days, max_posts=max_posts, on_post=on_post,
+            should_stop=should_stop, stop_before=stop_before,
+        ))
+
+    async def scrape_page_async(self, account_cookies, page_url, progress_callback=None, stop_urls=None, max_days=5,
+                                max_posts=50, on_post=None, should_stop=None, stop_before=None):
+        results = _PostSink(on_post)
+        self.last_cancelled = False
+        self.last_scan_complete = False
+
+        async def cancelled():
+            # should_stop() có thể truy vấn DB (đồng bộ) → chạy ngoài event loop
+            if not self.last_cancelled and should_stop is not None and await asyncio.to_thread(should_stop):
+                logger.info(f"Scrape of {page_url} cancelled, keeping {len(results)} posts parsed so far.")
+                self.last_cancelled = True
+            return self.last_cancelled
+        wait_log = WaitLog()
+        request_stats = RequestStats()
+
+        async with ProfileDirLock() as user_data_dir, async_playwright() as p:
+            context = await p.chromium.launch_persistent_context(
+                **context_options(headless=self.headless, user_data_dir=user_data_dir)
+            )
+            apply_default_timeouts(context)
+            if self.block_policy is not None:
+                # Áp dụng cho mọi tab chi tiết mở trong context
+                await attach_request_policy_async(context, self.block_policy, request_stats)
+
+            cookies = self._prepare_cookies(account_cookies)
+            if cookies:
+                try:
+                    await context.add_cookies(cookies)
+                    logger.info(f"Loaded {len(cookies)} cookies.")
+                except Exception as e:
+                    logger.error(f"Cookie error: {e}")
+
+            page = context.pages[0] if context.pages else await context.new_page()
+            waiter = AsyncPageWaiter(page, wait_log)
+            feed_capture = None
+            if self.intercept_feed:
+                feed_capture = FeedCapture(self)
+                page.on('response', feed_capture.on_response)
+            resolution = {'from_payload': 0, 'from_card': 0, 'detail_visits': 0}
+
+            try:
+                logger.info(f"Navigating to {page_url}")
+                await page.goto(page_url, wait_until='domcontentloaded', timeout=30_000)
+                await waiter.selector('feed_ready', self.LINK_SELECTOR, cap=self.LOAD_WAIT_CAP)
+
+                # Đóng popup login nếu có
+                try:
+                    await page.keyboard.press('Escape')
+                    await waiter.selector('dialog_closed', "div[role='dialog']", cap=self.ESCAPE_WAIT_CAP, state='detached')
+                except Exception:
+                    pass
+
+                # ── BƯỚC 1: Thu thập link ─────────────────────────────────────
+                post_links = await self._collect_post_links_async(
+                    page, progress_callback, stop_urls, max_days=max_days, max_posts=max_posts,
+                    waiter=waiter, feed_capture=feed_capture, should_stop=cancelled, stop_before=stop_before,
+                )
+                if feed_capture is not None:
+                    page.remove_listener('response', feed_capture.on_response)
+                    logger.info(f"Feed payloads: {len(feed_capture)} posts from {feed_capture.responses_parsed} responses.")
+                logger.info(
+                    f"Found {len(post_links)} post links to process "
+                    f"(max_days={max_days}, max_posts={max_posts}, concurrency={self.concurrency})."
+                )
+
+                await _report_progress(progress_callback, 48)
+
+                # ── BƯỚC 2: Mở song song các tab chi tiết ─────────────────────
+                # Bài đã đủ dữ liệu từ payload feed / thẻ bài thì không cần mở
+                to_visit = []
+                for post_url, posted_at, card_post in post_links:
+                    feed_post = self._post_from_feed(feed_capture, post_url) if feed_capture else None
+                    if feed_post:
+                        resolution['from_payload'] += 1
+                        results.append(feed_post)
+                    elif card_post:
+                        resolution['from_card'] += 1
+                        results.append(card_post)
+                    else:
+                        to_visit.append((post_url, posted_at))
+                resolution['detail_visits'] = len(to_visit)
+
+                total = len(to_visit)
+                sem = asyncio.Semaphore(self.concurrency)
+                idle_tabs = [page]
+                done = 0
+
+                async def _visit(post_url, posted_at):
+                    nonlocal done
+                    async with sem:
+                        if await cancelled():
+                            return None
+                        tab = idle_tabs.pop() if idle_tabs else await context.new_page()
+                        try:
+                            post = await self._scrape_post_async(
+                                tab, post_url, posted_at, AsyncPageWaiter(tab, wait_log)
+                            )
+                            if post:
+                                results.append(post)
+                            return post
+                        finally:
+                            idle_tabs.append(tab)
+                            done += 1
+                            await _report_progress(progress_callback, 50 + int((done / max(total, 1)) * 48))
+
+                started = time.monotonic()
+                parsed = await asyncio.gather(
+                    *(_visit(url, posted_at) for url, posted_at in to_visit)
+                )
+                logger.info(
+                    f"Parsed {sum(1 for r in parsed if r)}/{total} posts in {time.monotonic() - started:.1f}s."
+                )
+
+                # ── BƯỚC 3: Sort by engagement & Deduplicate ──────────────────
+                unique_results = self._dedupe_and_sort(results)
+
+                await _report_progress(progress_callback, 100)
+
+                logger.info(
+                    f"Done. {len(unique_results)} posts collected and sorted by engagement."
+                )
+                if self.last_cancelled:
+                    self.last_scan_complete = False
+                return unique_results
+
+            except Exception as e:
+                logger.error(f"Fatal error scraping {page_url}: {e}")
+                self.last_scan_complete = False
+                return results
+            finally:
+                self.last_wait_stats = wait_log.summary()
+                self.last_request_stats = request_stats.summary()
+                self.last_resolution_stats = resolution
+                logger.info(f"Resolution stats: {resolution}")
+                logger.info(f"Wait stats: {self.last_wait_stats}")
+                logger.info(f"Request stats: {self.last_request_stats}")
+                await context.close()
+
+    # ──────────────────────────────────────────────────────────────────────────
+    # STEP 1 (async)
+    # ──────────────────────────────────────────────────────────────────────────
+    async def _collect_post_links_async(self, page, progress_callback=None, stop_urls=None, max_days=5, max_posts=50, waiter=None, feed_capture=None,
+                                        should_stop=None, stop_before=None):
+        collector = _LinkCollector(self, stop_urls, max_days=max_days, stop_before=stop_before)
+        waiter = waiter or AsyncPageWaiter(page)
+
+        async def _scan_links():
+            try:
+                collector.feed(await page.evaluate(HARVEST_LINKS_JS, self._harvest_args()))
+            except Exception as e:
+                logger.debug(f"_scan_links error: {e}")
+
+        for i in range(self.MAX_SCROLLS):
+            if should_stop is not None and await should_stop():
+                logger.info("Scrape cancelled, stopping scroll.")
+                break
+            await waiter.arm_feed_growth(self.LINK_SELECTOR, cap=self.SCROLL_PAUSE)
+            await page.mouse.wheel(0, self.SCROLL_STEP)
+            await waiter.feed_growth(cap=self.SCROLL_PAUSE)
+
+            await _report_progress(progress_callback, min(45, int((i / self.MAX_SCROLLS) * 45)))
+
+            await _scan_links()
+            if feed_capture is not None:
+                await feed_capture.drain_async()
+            if collector.done_scrolling(i, max_posts):
+                break
+
+        self.last_scan_complete = collector.complete(max_posts)
+        return collector.results(max_posts)
+
+    # ──────────────────────────────────────────────────────────────────────────
+    # STEP 2 (async): 1 tab chi tiết
+    # ──────────────────────────────────────────────────────────────────────────
+    async def _scrape_post_async(self, tab, post_url, posted_at, waiter):
+        logger.info(f"Opening {post_url}")
+        try:
+            await tab.goto(post_url, wait_until='domcontentloaded', timeout=20_000)
+
+            post_data = await self._parse_popup_async(tab, known_posted_at=posted_at, waiter=waiter)
+            if not post_data:
+                logger.warning(f"Could not parse popup for {post_url}")
+                return None
+
+            post_data['post_url'] = post_url
+            logger.info(
+                f"  ✓ time={post_data.get('time_raw')} "
+                f"likes={post_data['likes']} "
+                f"comments={post_data['comments']} "
+                f"shares={post_data['shares']}"
+            )
+            return post_data
+
+        except PlaywrightTimeout:
+            logger.warning(f"Timeout navigating {post_url}, skipping.")
+        except Exception as e:
+            logger.warning(f"Error on {post_url}: {e}")
+        return None
+
+    async def _parse_popup_async(self, page, known_posted_at=None, waiter=None):
+        """Bản async của HotPostScraper._parse_popup (cùng snapshot + parser)."""
+        await (waiter or AsyncPageWaiter(page)).post_ready(cap=self.POST_READY_CAP)
+
+        try:
+            snapshot = await page.evaluate(POPUP_SNAPSHOT_JS)
+        except Exception as e:
+            logger.debug(f"Popup snapshot error: {e}")
+            snapshot = {}
+        return self._parse_snapshot(snapshot, known_posted_at=known_posted_at)
@@ -0,0 +1,422 @@
+import itertools
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from playwright.sync_api import sync_playwright
+
+try:
+    import fcntl
+except ImportError:  # Windows: chỉ khoá trong process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Cấu hình Chromium dùng chung cho scraper (one-shot) và pool
+# ──────────────────────────────────────────────────────────────────────────────
+BROWSER_ARGS = [
+    '--disable-notifications',
+    '--no-sandbox',
+    '--disable-dev-shm-usage',
+    '--disable-blink-features=AutomationControlled',
+    '--disable-gpu',
+    '--disable-software-rasterizer',
+    '--disable-extensions',
+    '--js-flags=--max-old-space-size=512',  # Tăng lên 512MB vì RAM đã đủ 2GB
+    '--disable-background-networking',
+    '--blink-settings=imagesEnabled=false',  # Tắt tải ảnh → tăng tốc, giảm RAM
+]
+
+USER_AGENT = (
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) '
+    'AppleWebKit/537.36 (KHTML, like Gecko) '
+    'Chrome/122.0.0.0 Safari/537.36'
+)
+
+
+def default_profile_dir():
+    # Profile cố định để tránh bị Facebook chặn (Không dùng ẩn danh)
+    return os.path.join(os.getcwd(), 'fb_browser_profile')
+
+
+_held_profiles = set()
+_held_profiles_lock = threading.Lock()
+
+
+class ProfileDirLock:
+    """
+    Mượn 1 thư mục profile chưa có Chromium nào dùng. Chromium khoá user_data_dir
+    nên các worker / thread scrape chạy song song không dùng chung được 1 profile:
+    thử lần lượt <base>, <base>-1, <base>-2... và giữ khoá file <thư mục>.lock
+    (fcntl, tự nhả khi process chết) tới khi release(). <base> (profile có
+    session đăng nhập từ fb_login) luôn được ưu tiên.
+    """
+
+    def __init__(self, base=None):
+        self.base = base or default_profile_dir()
+        self.path = None
+        self._fd = None
+
+    def acquire(self):
+        for slot in itertools.count():
+            path = self.base if slot == 0 else f'{self.base}-{slot}'
+            with _held_profiles_lock:
+                if path in _held_profiles:
+                    continue
+                fd = self._lock_file(path)
+                if fd is None:
+                    continue
+                _held_profiles.add(path)
+            self.path, self._fd = path, fd
+            if slot:
+                logger.info(f"Profile {self.base} is in use, using {path}.")
+            return path
+
+    @staticmethod
+    def _lock_file(path):
+        """fd đã khoá của <path>.lock, None nếu process khác đang giữ."""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        fd = os.open(path + '.lock', os.O_RDWR | os.O_CREAT, 0o644)
+        if fcntl is None:
+            return fd
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return None
+        return fd
+
+    def release(self):
+        if self.path is None:
+            return
+        with _held_profiles_lock:
+            _held_profiles.discard(self.path)
+        try:
+            os.close(self._fd)  # nhả khoá fcntl
+        except OSError:
+            pass
+        self.path, self._fd = None, None
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc):
+        self.release()
+
+    # acquire() không chờ nên dùng được trực tiếp trong `async with`
+    async def __aenter__(self):
+        return self.acquire()
+
+    async def __aexit__(self, *exc):
+        self.release()
+
+
+def context_options(headless=True, user_data_dir=None):
+    """Tham số launch_persistent_context() dùng chung cho Playwright sync/async."""
+    return dict(
+        user_data_dir=user_data_dir or default_profile_dir(),
+        headless=headless,
+        args=BROWSER_ARGS,
+        user_agent=USER_AGENT,
+        viewport={'width': 1366, 'height': 900},
+        locale='vi-VN',
+    )
+
+
+def apply_default_timeouts(context):
+    # ── Đặt timeout TOÀN CỤC cho mọi hành động Playwright ──────────
+    # Mọi page.goto(), page.locator().all(), page.wait_for_selector()
+    # đều tự động abort sau 20 giây → không bao giờ bị block vô thời hạn
+    context.set_default_navigation_timeout(20_000)  # 20s cho navigation
+    context.set_default_timeout(10_000)             # 10s cho các selector
+
+
+def launch_scrape_context(playwright, headless=True, user_data_dir=None):
+    """Khởi chạy persistent context với cấu hình chuẩn của scraper."""
+    context = playwright.chromium.launch_persistent_context(
+        **context_options(headless=headless, user_data_dir=user_data_dir)
+    )
+    apply_default_timeouts(context)
+    return context
+
+
+def _proc_table():
+    """
+    Đọc /proc: trả về (children, rss_kb) – children[ppid] = [pid...], rss_kb[pid] = RSS (KB).
+    Raise OSError nếu không đọc được /proc (không phải Linux).
+    """
+    children = {}
+    rss_kb = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/status') as fh:
+                ppid = None
+                rss = 0
+                for line in fh:
+                    if line.startswith('PPid:'):
+                        ppid = int(line.split()[1])
+                    elif line.startswith('VmRSS:'):
+                        rss = int(line.split()[1])
+        except (OSError, ValueError):
+            continue
+        pid = int(entry)
+        rss_kb[pid] = rss
+        if ppid is not None:
+            children.setdefault(ppid, []).append(pid)
+    return children, rss_kb
+
+
+def descendant_pids(root_pid):
+    """Mọi process con/cháu của root_pid (rỗng nếu không đọc được /proc)."""
+    try:
+        children, _ = _proc_table()
+    except OSError:
+        return []
+    found = []
+    stack = list(children.get(root_pid, []))
+    while stack:
+        pid = stack.pop()
+        found.append(pid)
+        stack.extend(children.get(pid, []))
+    return found
+
+
+def _process_tree_rss_mb(root_pid):
+    """
+    Tổng RSS (MB) của mọi process con/cháu của root_pid (driver Playwright + Chromium).
+    Trả về None nếu không đọc được /proc (không phải Linux).
+    """
+    try:
+        children, rss_kb = _proc_table()
+    except OSError:
+        return None
+
+    total = 0
+    stack = list(children.get(root_pid, []))
+    while stack:
+        pid = stack.pop()
+        total += rss_kb.get(pid, 0)
+        stack.extend(children.get(pid, []))
+    return total / 1024
+
+
+class BrowserLease:
+    """Context ấm được pool cho mượn trong thời gian 1 job."""
+
+    def __init__(self, pool, context):
+        self._pool = pool
+        self.context = context
+
+    def ensure_cookies(self, cookies_json_str, loader):
+        """Chỉ nạp cookies khi khác bộ cookies đã nạp cho context hiện tại."""
+        if not cookies_json_str or cookies_json_str == self._pool._cookies_loaded:
+            return
+        loader(self.context, cookies_json_str)
+        self._pool._cookies_loaded = cookies_json_str
+
+    def new_page(self):
+        return self.context.new_page()
+
+
+class BrowserPool:
+    """
+    Giữ 1 Chromium persistent context sống lâu trong process worker
+    (`manage.py process_tasks`) và cho các job scrape mượn lần lượt.
+
+    Sync Playwright chỉ dùng được trên thread đã khởi tạo nó, nên mọi job đều
+    được chạy trên 1 thread riêng của pool; `run()` chỉ gửi job vào hàng đợi và
+    chờ kết quả. Context được tái tạo sau `max_jobs` job, khi RSS vượt
+    `max_memory_mb`, hoặc đóng hẳn sau `idle_seconds` không có việc.
+    """
+
+    def __init__(self, headless=True, max_jobs=20, max_memory_mb=900,
+                 idle_seconds=300, user_data_dir=None):
+        self.headless = headless
+        self.max_jobs = max_jobs
+        self.max_memory_mb = max_memory_mb
+        self.idle_seconds = idle_seconds
+        self.user_data_dir = user_data_dir
+
+        self._jobs = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._playwright_cm = None
+        self._playwright = None
+        self._context = None
+        self._profile_lock = None
+        self._cookies_loaded = None
+
+        self._stats = {
+            'launches': 0,
+            'recycles': 0,
+            'jobs_total': 0,
+            'jobs_failed': 0,
+            'jobs_on_current_context': 0,
+            'last_rss_mb': None,
+            'last_launch_seconds': None,
+            'context_started_at': None,
+        }
+
+    # ──────────────────────────────────────────────────────────────────────────
+    # Public API
+    # ──────────────────────────────────────────────────────────────────────────
+    def run(self, fn):
+        """
+        Chạy fn(lease) trên thread của pool với 1 context ấm và trả về kết quả.
+        Exception trong fn được raise lại ở thread gọi.
+        """
+        future = Future()
+        self._ensure_thread()
+        self._jobs.put((fn, future))
+        return future.result()
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+        data['alive'] = self._context is not None
+        data['queued'] = self._jobs.qsize()
+        return data
+
+    def close(self):
+        """Dừng thread của pool và đóng Chromium."""
+        if self._thread and self._thread.is_alive():
+            self._jobs.put(None)
+            self._thread.join(timeout=30)
+
+    # ──────────────────────────────────────────────────────────────────────────
+    # Thread của pool
+    # ──────────────────────────────────────────────────────────────────────────
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._loop, name='hot-post-browser-pool', daemon=True
+                )
+                self._thread.start()
+
+    def _loop(self):
+        try:
+            while True:
+                try:
+                    item = self._jobs.get(timeout=self.idle_seconds)
+                except queue.Empty:
+                    if self._context is not None:
+                        logger.info("Browser pool idle, closing Chromium to free memory.")
+                        self._shutdown_context()
+                    continue
+                if item is None:
+                    break
+
+                fn, future = item
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    lease = BrowserLease(self, self._acquire_context())
+                    future.set_result(fn(lease))
+                except BaseException as e:
+                    with self._lock:
+                        self._stats['jobs_failed'] += 1
+                    future.set_exception(e)
+                    # Context có thể đã hỏng (crash, target closed) → dựng lại ở job sau
+                    self._shutdown_context()
+                finally:
+                    with self._lock:
+                        self._stats['jobs_total'] += 1
+                        self._stats['jobs_on_current_context'] += 1
+                    self._maybe_recycle()
+        finally:
+            self._shutdown_context()
+            self._stop_playwright()
+
+    def _acquire_context(self):
+        if self._context is not None:
+            return self._context
+
+        if self._playwright is None:
+            self._playwright_cm = sync_playwright()
+            self._playwright = self._playwright_cm.start()
+
+        started = time.monotonic()
+        self._profile_lock = ProfileDirLock(self.user_data_dir)
+        try:
+            self._context = launch_scrape_context(
+                self._playwright, headless=self.headless, user_data_dir=self._profile_lock.acquire()
+            )
+        except BaseException:
+            self._profile_lock.release()
+            raise
+        self._cookies_loaded = None
+        with self._lock:
+            self._stats['launches'] += 1
+            self._stats['jobs_on_current_context'] = 0
+            self._stats['last_launch_seconds'] = round(time.monotonic() - started, 2)
+            self._stats['context_started_at'] = time.time()
+        logger.info(f"Browser pool launched Chromium in {self._stats['last_launch_seconds']}s.")
+        return self._context
+
+    def _maybe_recycle(self):
+        if self._context is None:
+            return
+        rss = _process_tree_rss_mb(os.getpid())
+        with self._lock:
+            self._stats['last_rss_mb'] = round(rss, 1) if rss is not None else None
+            jobs = self._stats['jobs_on_current_context']
+
+        reason = None
+        if self.max_jobs and jobs >= self.max_jobs:
+            reason = f"{jobs} jobs"
+        elif self.max_memory_mb and rss is not None and rss >= self.max_memory_mb:
+            reason = f"RSS {rss:.0f}MB >= {self.max_memory_mb}MB"
+
+        if reason:
+            logger.info(f"Recycling browser context ({reason}).")
+            with self._lock:
+                self._stats['recycles'] += 1
+            self._shutdown_context()
+
+    def _shutdown_context(self):
+        if self._context is None:
+            return
+        try:
+            self._context.close()
+        except Exception as e:
+            logger.debug(f"Error closing pooled context: {e}")
+        self._profile_lock.release()
+        self._context = None
+        self._cookies_loaded = None
+
+    def _stop_playwright(self):
+        if self._playwright_cm is None:
+            return
+        try:
+            self._playwright_cm.__exit__(None, None, None)
+        except Exception:
+            pass
+        self._playwright_cm = None
+        self._playwright = None
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_browser_pool():
+    """Pool dùng chung cho cả process (khởi tạo lười theo settings)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            from django.conf import settings
+            _pool = BrowserPool(
+                headless=True,
+                max_jobs=getattr(settings, 'HOT_POST_POOL_MAX_JOBS', 20),
+                max_memory_mb=getattr(settings, 'HOT_POST_POOL_MAX_MEMORY_MB', 900),
+                idle_seconds=getattr(settings, 'HOT_POST_POOL_IDLE_SECONDS', 300),
+            )
+        return _pool
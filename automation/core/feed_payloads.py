@@ -0,0 +1,236 @@
+"""
+Đọc số liệu bài viết từ các response JSON/GraphQL mà trình duyệt đã nhận khi
+cuộn feed. Phần parse thuần Python (không cần trình duyệt) để có thể chạy với
+payload ghi sẵn.
+"""
+import json
+import logging
+import re
+from datetime import datetime, timezone as dt_timezone
+
+logger = logging.getLogger(__name__)
+
+
+# Chỉ đọc body của các response có thể chứa dữ liệu feed
+FEED_RESPONSE_PATTERN = re.compile(r'/api/graphql|/ajax/.*(timeline|feed|pagelet)', re.IGNORECASE)
+
+# URL trỏ tới chính bài viết (không phải trang / ảnh đính kèm)
+_POST_URL_PATTERN = re.compile(r'facebook\.com/.*(/posts/|permalink|story_fbid=|/videos/|fbid=)')
+
+# Độ sâu tối đa khi tìm field trong 1 story (comet_sections lồng rất sâu)
+_MAX_FIELD_DEPTH = 14
+
+POST_FIELDS = ('posted_at', 'caption', 'likes', 'comments', 'shares')
+
+
+def parse_payload_text(text):
+    """
+    Tách body response thành list object JSON. Facebook trả về có thể có tiền
+    tố 'for (;;);', nhiều object JSON nối nhau theo từng dòng, hoặc body
+    multipart (dòng boundary / header xen giữa các phần JSON).
+    """
+    if not text:
+        return []
+    text = text.strip()
+    if text.startswith('for (;;);'):
+        text = text[len('for (;;);'):]
+
+    objects = []
+    decoder = json.JSONDecoder()
+    idx = 0
+    length = len(text)
+    while idx < length:
+        while idx < length and text[idx] in ' \t\r\n':
+            idx += 1
+        if idx >= length:
+            break
+        try:
+            obj, end = decoder.raw_decode(text, idx)
+        except ValueError:
+            # Dòng không phải JSON (boundary, header multipart...) → sang dòng sau
+            end = text.find('\n', idx)
+            if end < 0:
+                break
+            idx = end + 1
+            continue
+        if isinstance(obj, dict):
+            objects.append(obj)
+        idx = end
+    return objects
+
+
+def _iter_dicts(node):
+    stack = [node]
+    while stack:
+        cur = stack.pop()
+        if isinstance(cur, dict):
+            yield cur
+            stack.extend(cur.values())
+        elif isinstance(cur, list):
+            stack.extend(cur)
+
+
+def _find(node, keys, depth=0, own_post_id=None):
+    """Tìm giá trị đầu tiên của 1 trong `keys` trong cây con (không đi vào story khác)."""
+    if depth > _MAX_FIELD_DEPTH:
+        return None
+    if isinstance(node, dict):
+        if depth and own_post_id and node.get('post_id') not in (None, own_post_id):
+            return None  # attached_story / bài được share
+        for k in keys:
+            if k in node and node[k] is not None:
+                return node[k]
+        for v in node.values():
+            if isinstance(v, (dict, list)):
+                found = _find(v, keys, depth + 1, own_post_id)
+                if found is not None:
+                    return found
+    elif isinstance(node, list):
+        for v in node:
+            found = _find(v, keys, depth + 1, own_post_id)
+            if found is not None:
+                return found
+    return None
+
+
+def _count(value, parse_number):
+    """reaction_count / share_count có thể là {'count': n}, {'total_count': n}, số, hoặc chuỗi '1,2K'."""
+    if value is None:
+        return None
+    if isinstance(value, dict):
+        for k in ('count', 'total_count'):
+            if isinstance(value.get(k), (int, float)):
+                return int(value[k])
+        return None
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str):
+        return parse_number(value)
+    return None
+
+
+def extract_posts(obj, parse_number):
+    """
+    Trả về list dict {post_id, url, posted_at, caption, likes, comments, shares}
+    cho mọi story có 'post_id' trong object JSON. Field không tìm thấy để None.
+    """
+    posts = {}
+    for node in _iter_dicts(obj):
+        post_id = node.get('post_id')
+        if not isinstance(post_id, str) or not post_id:
+            continue
+
+        found = posts.setdefault(post_id, {'post_id': post_id, 'url': None,
+                                           **{f: None for f in POST_FIELDS}})
+
+        if found['url'] is None:
+            for url in (node.get('permalink_url'), node.get('url'), node.get('wwwURL'),
+                        _find(node, ('permalink_url',), own_post_id=post_id)):
+                if isinstance(url, str) and _POST_URL_PATTERN.search(url):
+                    found['url'] = url
+                    break
+
+        if found['posted_at'] is None:
+            ts = _find(node, ('creation_time', 'publish_time'), own_post_id=post_id)
+            if isinstance(ts, (int, float)) and ts > 0:
+                found['posted_at'] = datetime.fromtimestamp(int(ts), tz=dt_timezone.utc)
+
+        if found['caption'] is None:
+            message = node.get('message')
+            if not isinstance(message, dict):
+                message = _find(node, ('message',), own_post_id=post_id)
+            if isinstance(message, dict) and isinstance(message.get('text'), str):
+                found['caption'] = message['text']
+
+        if found['likes'] is None:
+            found['likes'] = _count(
+                _find(node, ('reaction_count', 'reactors', 'i18n_reaction_count'), own_post_id=post_id),
+                parse_number,
+            )
+        if found['comments'] is None:
+            found['comments'] = _count(
+                _find(node, ('total_comment_count', 'comment_count'), own_post_id=post_id),
+                parse_number,
+            )
+            if found['comments'] is None:
+                comments = _find(node, ('comments',), own_post_id=post_id)
+                if isinstance(comments, dict):
+                    found['comments'] = _count(comments.get('total_count'), parse_number)
+        if found['shares'] is None:
+            found['shares'] = _count(
+                _find(node, ('share_count', 'i18n_share_count'), own_post_id=post_id),
+                parse_number,
+            )
+    return list(posts.values())
+
+
+def is_complete(post):
+    return post is not None and all(post.get(f) is not None for f in POST_FIELDS)
+
+
+class FeedCapture:
+    """
+    Gom dữ liệu bài viết từ response feed trong lúc cuộn. Handler của
+    page.on('response') chỉ xếp response vào hàng đợi (không gọi Playwright);
+    body được đọc ở drain()/drain_async() giữa các lần cuộn.
+    """
+
+    def __init__(self, scraper):
+        self.scraper = scraper
+        self.pending = []
+        self.by_id = {}
+        self.responses_parsed = 0
+
+    def on_response(self, response):
+        try:
+            if response.request.resource_type in ('xhr', 'fetch') and FEED_RESPONSE_PATTERN.search(response.url):
+                self.pending.append(response)
+        except Exception:
+            pass
+
+    def take_pending(self):
+        pending, self.pending = self.pending, []
+        return pending
+
+    def drain(self):
+        for response in self.take_pending():
+            try:
+                self.ingest(response.text())
+            except Exception as e:
+                logger.debug(f"Feed payload read error: {e}")
+
+    async def drain_async(self):
+        for response in self.take_pending():
+            try:
+                self.ingest(await response.text())
+            except Exception as e:
+                logger.debug(f"Feed payload read error: {e}")
+
+    def ingest(self, text):
+        """Parse 1 body response và gộp dữ liệu vào các bài đã biết."""
+        self.responses_parsed += 1
+        for obj in parse_payload_text(text):
+            for post in extract_posts(obj, self.scraper._parse_number):
+                self._merge(post)
+
+    def _merge(self, post):
+        keys = {post['post_id']}
+        if post.get('url'):
+            keys.add(self.scraper._get_post_id(self.scraper._normalize_url(post['url'])))
+        existing = next((self.by_id[k] for k in keys if k in self.by_id), None)
+        if existing is None:
+            existing = post
+        else:
+            for f, v in post.items():
+                if existing.get(f) is None and v is not None:
+                    existing[f] = v
+        for k in keys:
+            self.by_id[k] = existing
+
+    def lookup(self, post_url):
+        return self.by_id.get(self.scraper._get_post_id(post_url))
+
+    def __len__(self):
+        return len({id(p) for p in self.by_id.values()})
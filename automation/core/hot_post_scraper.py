@@ -1,32 +1,181 @@
 import json
 import logging
-import os
-import time
+import queue
 import re
-from datetime import timedelta
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
 from django.utils import timezone
 from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeout
 
+from .browser_pool import ProfileDirLock, launch_scrape_context
+from .feed_payloads import FeedCapture, is_complete
+from .request_policy import RequestStats, attach_request_policy
+from .waits import PageWaiter
+
 logger = logging.getLogger(__name__)
 
 
+# time_raw của bài không đọc được thời gian đăng (posted_at = lúc scrape)
+FALLBACK_TIME_RAW = "Unknown (Fallback to now)"
+
+# 1 số đếm trong text thô: "64", "1.200", "1,2K", "3 N", "1,5 triệu"
+_COUNT_TOKEN = r'\d[\d.,]*(?:\s?(?:triệu|nghìn|[kKmMN])(?![^\W\d_]))?'
+
+
+# Hàm JS chụp snapshot 1 hoặc nhiều vùng DOM (popup, trang bài, hay 1 thẻ bài
+# trên feed) – dùng chung cho POPUP_SNAPSHOT_JS và HARVEST_LINKS_JS.
+_SNAPSHOT_FN_JS = """
+const hpSnapshot = (scopes) => {
+    const all = (sel) => scopes.flatMap(s => Array.from(s.querySelectorAll(sel)));
+    const text = (el) => (el.innerText || '').trim();
+
+    const utimeEl = all('abbr[data-utime]')[0];
+    const messageEl = all("div[data-ad-preview='message'], div[data-ad-comet-preview='message']")[0];
+
+    return {
+        utime: utimeEl ? utimeEl.getAttribute('data-utime') : null,
+        time_texts: all("a[role='link'] span, span[role='tooltip'], abbr")
+            .map(text).filter(t => t && t.length < 25),
+        message: messageEl ? text(messageEl) : '',
+        auto_texts: all("div[dir='auto'], span[dir='auto']")
+            .map(text).filter(t => t.length > 5),
+        reactions: all(
+            "span[class*='reactions'], div[class*='reactions'], " +
+            "span[aria-label*='cảm xúc'], span[aria-label*='like'], " +
+            "div[aria-label*='lượt thích']"
+        ).map(el => ({
+            text: (el.textContent || '').trim(),
+            label: el.getAttribute('aria-label') || '',
+        })),
+        // Thanh hành động (Thích / Bình luận) đã render → các số đếm cũng đã render
+        has_actions: all(
+            "div[role='button'][aria-label='Thích'], div[role='button'][aria-label='Like'], " +
+            "[aria-label='Viết bình luận'], [aria-label='Leave a comment']"
+        ).length > 0,
+        full_text: scopes.map(s => s.innerText || '').join('\\n'),
+    };
+};
+"""
+
+# Snapshot DOM của popup/bài viết trong 1 round-trip. Phạm vi: mọi
+# div[role='dialog'] (nếu có) hoặc toàn bộ body khi đã navigate sang trang bài.
+POPUP_SNAPSHOT_JS = """
+() => {
+""" + _SNAPSHOT_FN_JS + """
+    const dialogs = Array.from(document.querySelectorAll("div[role='dialog']"));
+    const snap = hpSnapshot(dialogs.length ? dialogs : [document.body]);
+    snap.scope = dialogs.length ? 'dialog' : 'body';
+    return snap;
+}
+"""
+
+
+# Thu hoạch link bài viết trong 1 lần evaluate mỗi lần cuộn. Anchor đã báo về
+# được đánh dấu bằng HARVEST_MARKER nên mỗi lần cuộn chỉ trả về anchor mới,
+# chi phí không tăng theo độ dài feed. Text chỉ gửi kèm khi đủ ngắn để là mốc thời gian.
+# Kèm snapshot của thẻ bài (article) chứa link để đọc số liệu ngay trên feed.
+# Thẻ chụp lúc số đếm chưa render (chưa có thanh hành động / reaction) mang
+# CARD_PENDING_MARKER = số lần chụp còn lại, và được chụp lại ở các lần cuộn
+# sau: link của thẻ được trả về kèm recheck=true.
+HARVEST_MARKER = 'data-hp-seen'
+CARD_PENDING_MARKER = 'data-hp-card-pending'
+
+FEED_CARD_SELECTOR = "div[role='article'], div[aria-posinset]"
+
+HARVEST_LINKS_JS = """
+({selector, marker, maxText, cardSelector, pendingSelector, pendingMarker, linkSelector, cardTries}) => {
+""" + _SNAPSHOT_FN_JS + """
+    const links = [];
+    const cards = [];
+    const cardIndex = new Map();
+    const snapCard = (cardEl) => {
+        const snap = hpSnapshot([cardEl]);
+        const complete = snap.has_actions && snap.reactions.some(r => r.text || r.label);
+        const left = cardEl.hasAttribute(pendingMarker)
+            ? Number(cardEl.getAttribute(pendingMarker)) - 1 : cardTries;
+        snap.pending = !complete && left > 0;
+        if (snap.pending) {
+            cardEl.setAttribute(pendingMarker, String(left));
+        } else {
+            cardEl.removeAttribute(pendingMarker);
+        }
+        cardIndex.set(cardEl, cards.length);
+        cards.push(snap);
+    };
+    for (const a of document.querySelectorAll(selector)) {
+        a.setAttribute(marker, '1');
+        const text = (a.innerText || '').trim();
+        let card = null;
+        const cardEl = cardSelector ? a.closest(cardSelector) : null;
+        if (cardEl) {
+            if (!cardIndex.has(cardEl)) {
+                snapCard(cardEl);
+            }
+            card = cardIndex.get(cardEl);
+        }
+        links.push({
+            href: a.getAttribute('href') || '',
+            text: text.length < maxText ? text : '',
+            card: card,
+        });
+    }
+    if (pendingSelector) {
+        for (const cardEl of document.querySelectorAll(pendingSelector)) {
+            if (cardIndex.has(cardEl)) continue;
+            snapCard(cardEl);
+            const card = cardIndex.get(cardEl);
+            for (const a of cardEl.querySelectorAll(linkSelector)) {
+                if (a.closest(cardSelector) !== cardEl) continue;
+                links.push({href: a.getAttribute('href') || '', text: '', card: card, recheck: true});
+            }
+        }
+    }
+    return {links, cards};
+}
+"""
+
+
 class HotPostScraper:
-    def __init__(self, headless=True):
+    def __init__(self, headless=True, pool=None, block_policy=None, intercept_feed=False, use_feed_cards=True,
+                 dual_tab=True):
         self.headless = headless
+        # BrowserPool (tuỳ chọn): tái sử dụng Chromium ấm giữa các lần scrape
+        self.pool = pool
+        # RequestBlockPolicy (tuỳ chọn): chặn ảnh/video/font/beacon ở tầng mạng
+        self.block_policy = block_policy
+        # Đọc số liệu từ response GraphQL khi cuộn feed, bỏ qua bước mở bài nếu đủ field
+        self.intercept_feed = intercept_feed
+        # Đọc số liệu ngay trên thẻ bài của feed, chỉ mở bài khi thẻ thiếu dữ liệu
+        self.use_feed_cards = use_feed_cards
+        # Giữ feed ở 1 tab, mở bài chi tiết ở tab thứ 2 (không goto / go_back trên feed)
+        self.dual_tab = dual_tab
+        # Thời gian chờ thực tế của lần scrape gần nhất (WaitLog.summary())
+        self.last_wait_stats = {}
+        # Số request cho qua / bị chặn của lần scrape gần nhất (RequestStats.summary())
+        self.last_request_stats = {}
+        # Số bài lấy đủ dữ liệu từ feed vs số bài phải mở trang chi tiết
+        self.last_resolution_stats = {}
+        # Lần scrape gần nhất bị dừng sớm do should_stop()
+        self.last_cancelled = False
+        # Lần scrape gần nhất đi hết phần feed mới (xem _LinkCollector.complete) và
+        # không lỗi / bị huỷ giữa chừng → được phép dời mốc quét nối tiếp
+        self.last_scan_complete = False
 
     # ──────────────────────────────────────────────────────────────────────────
     # Cookie helpers
     # ──────────────────────────────────────────────────────────────────────────
-    def _load_cookies(self, context, cookies_json_str):
+    def _prepare_cookies(self, cookies_json_str):
+        """Chuẩn hoá chuỗi JSON cookie → list cookie hợp lệ cho context.add_cookies()."""
         if not cookies_json_str:
-            return
+            return []
         try:
             cookies = json.loads(cookies_json_str)
             if isinstance(cookies, dict):
                 cookies = [cookies]
             if not isinstance(cookies, list):
                 logger.error(f"Expected list of cookies, got {type(cookies)}")
-                return
+                return []
             valid = []
             for c in cookies:
                 if isinstance(c, dict) and 'name' in c and 'value' in c:
@@ -35,11 +184,20 @@ class HotPostScraper:
                     if 'sameSite' in c and c['sameSite'] not in ['Strict', 'Lax', 'None']:
                         del c['sameSite']
                     valid.append(c)
-            if valid:
-                context.add_cookies(valid)
-                logger.info(f"Loaded {len(valid)} cookies.")
-            else:
+            if not valid:
                 logger.warning("No valid cookies found.")
+            return valid
+        except Exception as e:
+            logger.error(f"Cookie error: {e}")
+            return []
+
+    def _load_cookies(self, context, cookies_json_str):
+        valid = self._prepare_cookies(cookies_json_str)
+        if not valid:
+            return
+        try:
+            context.add_cookies(valid)
+            logger.info(f"Loaded {len(valid)} cookies.")
         except Exception as e:
             logger.error(f"Cookie error: {e}")
 
@@ -51,20 +209,21 @@ class HotPostScraper:
             return 0
         s = str(text).strip()
 
-        # Dấu phẩy dạng thập phân (1,2K) → chấm
-        s = re.sub(r',(?=\d{1,2}\s*[kKmMtT])', '.', s)
+        # Dấu phẩy dạng thập phân (1,2K / 1,2 N / 1,5 triệu) → chấm
+        s = re.sub(r',(?=\d{1,2}\s*(?:[kKmMtT]|[nN](?![^\W\d_])))', '.', s)
         # Dấu chấm phân hàng nghìn (1.200) → xóa (chỉ khi KHÔNG theo sau bởi K/M)
         s = re.sub(r'\.(?=\d{3}(?!\d)(?!\s*[kKmMtT]))', '', s)
         # Còn lại dấu phẩy là phân hàng nghìn
         s = s.replace(',', '')
 
-        m = re.search(r'([\d.]+)\s*(k|m|b|tr|triệu|nghìn)?', s, re.IGNORECASE)
+        # Đơn vị phải đứng riêng: "3 N" là 3 nghìn nhưng "3 người", "12 bình luận" thì không
+        m = re.search(r'([\d.]+)\s*(triệu|nghìn|tr|k|m|b|n)?(?![^\W\d_])', s, re.IGNORECASE)
         if not m:
             return 0
         try:
             val = float(m.group(1).rstrip('.'))
             unit = (m.group(2) or '').lower()
-            if unit in ('k', 'nghìn'):
+            if unit in ('k', 'n', 'nghìn'):
                 val *= 1_000
             elif unit in ('m', 'tr', 'triệu'):
                 val *= 1_000_000
@@ -151,340 +310,327 @@ class HotPostScraper:
     # ──────────────────────────────────────────────────────────────────────────
     # STEP 1: Collect post links from the page feed
     # ──────────────────────────────────────────────────────────────────────────
-    def _collect_post_links(self, page, progress_callback=None, stop_urls=None, max_days=5, max_posts=50):
+    MAX_SCROLLS = 80   # Tăng để cuộn đủ 5 ngày
+    SCROLL_STEP = 2500
+    SCROLL_PAUSE = 2.5   # Chờ tối đa sau mỗi lần cuộn (thường trả về sớm khi feed có bài mới)
+
+    # Thời gian chờ TỐI ĐA (giây) của các điểm chờ theo sự kiện – chỉ là chốt an toàn
+    LOAD_WAIT_CAP = 2        # feed render sau goto trang
+    ESCAPE_WAIT_CAP = 0.5    # popup login đóng sau Escape
+    POST_READY_CAP = 3.5     # popup / bài viết render sau goto bài
+    BACK_WAIT_CAP = 1        # feed hiện lại sau go_back
+    MAX_OLD_STREAK = 8   # Tăng để tránh dừng sớm với feed dày
+    # Số bài đã biết (mốc quét lần trước) liên tiếp cần gặp để dừng cuộn – 1 bài
+    # ghim cũ ở đầu feed không làm dừng sớm
+    WATERMARK_STOP_HITS = 2
+    # Bài đăng trước stop_before quá khoảng này mới tính là bài đã biết (giờ
+    # đăng đọc từ chữ "3 giờ", "Hôm qua"... chỉ là ước tính)
+    WATERMARK_TIME_GRACE = timedelta(hours=1)
+    VISITS_PER_SCROLL = 2    # dual_tab: số bài mở ở tab chi tiết trong lúc feed tải lô mới
+    CARD_SNAPSHOT_TRIES = 3  # số lần chụp tối đa 1 thẻ feed chưa render đủ số đếm
+
+    # Selector link bài viết
+    LINK_SELECTOR = (
+        "a[href*='/posts/'], a[href*='/videos/'], "
+        "a[href*='/photos/'], a[href*='fbid='], a[href*='/permalink/']"
+    )
+
+    def _harvest_args(self):
+        # Thêm :not([data-hp-seen]) vào từng selector để trình duyệt tự bỏ qua anchor đã báo về
+        selector = ', '.join(
+            f"{part.strip()}:not([{HARVEST_MARKER}])" for part in self.LINK_SELECTOR.split(',')
+        )
+        args = {
+            'selector': selector, 'marker': HARVEST_MARKER, 'maxText': 20,
+            'cardSelector': None, 'pendingSelector': None, 'pendingMarker': CARD_PENDING_MARKER,
+            'linkSelector': self.LINK_SELECTOR, 'cardTries': self.CARD_SNAPSHOT_TRIES,
+        }
+        if self.use_feed_cards:
+            args['cardSelector'] = FEED_CARD_SELECTOR
+            args['pendingSelector'] = ', '.join(
+                f"{part.strip()}[{CARD_PENDING_MARKER}]" for part in FEED_CARD_SELECTOR.split(',')
+            )
+        return args
+
+    def _get_post_id(self, url):
+        return canonical_post_id(url)
+
+    def _normalize_url(self, url):
+        if not url:
+            return url
+        if url.startswith('/'):
+            url = 'https://www.facebook.com' + url
+        if '?' in url and 'fbid=' not in url:
+            url = url.split('?')[0]
+        for tracking_param in ['__cft__', '__tn__', 'mibextid=', 'eav=', 'paipv=']:
+            if f'&{tracking_param}' in url:
+                url = url.split(f'&{tracking_param}')[0]
+            if f'?{tracking_param}' in url:
+                url = url.split(f'?{tracking_param}')[0]
+        return url.rstrip('/')
+
+    def _collect_post_links(self, page, progress_callback=None, stop_urls=None, max_days=5, max_posts=50, waiter=None,
+                            feed_capture=None, between_scrolls=None, should_stop=None, stop_before=None):
         """
         Scroll qua feed, thu thập các link bài viết POST trong max_days ngày gần đây.
-        Trả về list[str] – danh sách URL bài viết không trùng (tối đa max_posts).
-        """
-        post_links = {}   # url → posted_at  (hoặc None nếu chưa parse được time)
-        seen = set()
-
-        MAX_SCROLLS = 80   # Tăng để cuộn đủ 5 ngày
-        SCROLL_STEP  = 2500
-        SCROLL_PAUSE = 2.5
-        MAX_OLD_STREAK = 8   # Tăng để tránh dừng sớm với feed dày
-        no_new_count = 0
-        last_count = 0
-        old_streak = 0
-
-        # Selector link bài viết
-        LINK_SELECTOR = (
-            "a[href*='/posts/'], a[href*='/videos/'], "
-            "a[href*='/photos/'], a[href*='fbid='], a[href*='/permalink/']"
-        )
+        Trả về list[(url, posted_at, card_post)] – URL bài viết không trùng (tối đa
+        max_posts); card_post là kết quả đọc đủ từ thẻ bài trên feed, hoặc None.
 
-        def _get_post_id(url):
-            import re
-            m = re.search(r'(?:story_fbid=|fbid=|v=|/posts/|/permalink/|/videos/|/photos/a\.\d+/|/photo/\?fbid=)(pfbid[a-zA-Z0-9]+|\d+)', url)
-            if m:
-                return m.group(1)
-            clean = url.split('?')[0].rstrip('/')
-            return clean.split('/')[-1]
-
-        def _normalize(url):
-            if not url:
-                return url
-            if url.startswith('/'):
-                url = 'https://www.facebook.com' + url
-            if '?' in url and 'fbid=' not in url:
-                url = url.split('?')[0]
-            for tracking_param in ['__cft__', '__tn__', 'mibextid=', 'eav=', 'paipv=']:
-                if f'&{tracking_param}' in url:
-                    url = url.split(f'&{tracking_param}')[0]
-                if f'?{tracking_param}' in url:
-                    url = url.split(f'?{tracking_param}')[0]
-            return url.rstrip('/')
-
-        seen_ids = set()
-        
-        stop_ids = set()
-        if stop_urls:
-            for u in stop_urls:
-                stop_ids.add(_get_post_id(u))
+        between_scrolls(collector) (tuỳ chọn) được gọi ngay sau mỗi lần cuộn, trong
+        lúc feed đang tải lô bài mới. should_stop() (tuỳ chọn) trả về True → dừng
+        cuộn ngay, giữ các link đã thu thập.
+
+        stop_urls (URL hoặc post id) / stop_before (datetime) là mốc của lần quét
+        trước: gặp WATERMARK_STOP_HITS bài đã biết liên tiếp thì dừng cuộn.
+        """
+        collector = _LinkCollector(self, stop_urls, max_days=max_days, stop_before=stop_before)
+        waiter = waiter or PageWaiter(page)
 
         def _scan_links():
-            """Thu thập link & time từ DOM hiện tại."""
-            nonlocal old_streak
-            new_found = 0
-            should_stop = False
+            """Thu thập link & time từ DOM hiện tại (chỉ các anchor chưa báo về)."""
             try:
-                links = page.locator(LINK_SELECTOR).all()
-                for link_el in links:
-                    try:
-                        href = link_el.get_attribute('href') or ''
-                        url = _normalize(href)
-                        post_id = _get_post_id(url)
-                        
-                        if post_id in stop_ids:
-                            logger.info(f"Gặp bài cũ ({post_id}), dừng quét nối tiếp.")
-                            should_stop = True
-                            break
-
-                        if not url or url in seen or post_id in seen_ids:
-                            continue
-                        
-                        seen.add(url)
-                        seen_ids.add(post_id)
-
-                        # Thử parse time từ text ngắn kế link
-                        text = link_el.inner_text().strip()
-                        posted_at = None
-                        if text and len(text) < 20:
-                            dt, ok = self._parse_time_string(text, max_days=max_days)
-                            if ok:
-                                posted_at = dt
-                                old_streak = 0
-                            elif dt is not None:
-                                # Bài cũ hơn max_days → tăng streak
-                                old_streak += 1
-                                continue  # bỏ qua bài cũ
-                        # Nếu không lấy được time từ text, vẫn thu thập URL để click sau
-                        post_links[url] = posted_at
-                        new_found += 1
-                    except Exception:
-                        pass
+                collector.feed(page.evaluate(HARVEST_LINKS_JS, self._harvest_args()))
             except Exception as e:
                 logger.debug(f"_scan_links error: {e}")
-            return new_found, should_stop
-
-        for i in range(MAX_SCROLLS):
-            page.mouse.wheel(0, SCROLL_STEP)
-            time.sleep(SCROLL_PAUSE)
-
-            if progress_callback:
-                progress_callback(min(45, int((i / MAX_SCROLLS) * 45)))
 
-            new, should_stop = _scan_links()
-            if should_stop:
+        for i in range(self.MAX_SCROLLS):
+            if should_stop is not None and should_stop():
+                logger.info("Scrape cancelled, stopping scroll.")
                 break
-                
-            current_count = len(post_links)
-
-            if current_count == last_count:
-                no_new_count += 1
-                if no_new_count >= 3:
-                    logger.info("No new links after 3 scrolls, stopping.")
-                    break
-            else:
-                no_new_count = 0
-                last_count = current_count
+            # Chờ tới khi feed append bài mới (tối đa SCROLL_PAUSE giây)
+            waiter.arm_feed_growth(self.LINK_SELECTOR, cap=self.SCROLL_PAUSE)
+            page.mouse.wheel(0, self.SCROLL_STEP)
+            if between_scrolls is not None:
+                between_scrolls(collector)
+            waiter.feed_growth(cap=self.SCROLL_PAUSE)
 
-            if old_streak >= MAX_OLD_STREAK:
-                logger.info(f"Hit {old_streak} old posts in a row, stopping scroll.")
-                break
+            if progress_callback:
+                progress_callback(min(45, int((i / self.MAX_SCROLLS) * 45)))
 
-            if len(post_links) >= max_posts:
-                logger.info(f"Reached max posts limit ({max_posts}), stopping scroll.")
+            _scan_links()
+            if feed_capture is not None:
+                feed_capture.drain()
+            if collector.done_scrolling(i, max_posts):
                 break
 
-            logger.debug(f"Scroll {i+1}: total links={current_count}, old_streak={old_streak}")
-
-        all_links_info = list(post_links.items())[:max_posts]
-        logger.info(f"Collected {len(all_links_info)} post links (limited to {max_posts}).")
-        return all_links_info
+        self.last_scan_complete = collector.complete(max_posts)
+        return collector.results(max_posts)
 
     # ──────────────────────────────────────────────────────────────────────────
     # STEP 2: Click từng link → mở popup → parse chi tiết
     # ──────────────────────────────────────────────────────────────────────────
-    def _parse_popup(self, page, known_posted_at=None):
+    def _parse_popup(self, page, known_posted_at=None, waiter=None, require_actions=False):
         """
         Đọc các thông tin (Thời gian, Reaction, Comment, Share, Đoạn text snippet).
+        Chỉ 1 lần page.evaluate() lấy snapshot DOM, phần parse chạy thuần Python.
+        require_actions: bài chưa render thanh hành động (trang lỗi, tường đăng
+        nhập) → None thay vì số liệu 0.
         """
-        # Popup load check (giảm timeout xuống để mượt hơn khi là trang web nguyên bản)
-        POPUP_SELECTOR = "div[role='dialog'], div[data-pagelet='MediaViewerPhoto']"
+        # Chờ popup / bài viết render (trả về ngay khi xuất hiện)
+        (waiter or PageWaiter(page)).post_ready(cap=self.POST_READY_CAP)
+
         try:
-            page.wait_for_selector(POPUP_SELECTOR, timeout=2000)
-        except Exception:
-            pass
+            snapshot = page.evaluate(POPUP_SNAPSHOT_JS)
+        except Exception as e:
+            logger.debug(f"Popup snapshot error: {e}")
+            snapshot = {}
+        if require_actions and not (snapshot or {}).get('has_actions'):
+            return None
+        return self._parse_snapshot(snapshot, known_posted_at=known_posted_at)
 
-        # Lấy container chính của popup
-        dialog = page.locator("div[role='dialog']")
-        if dialog.count() == 0:
-            # Không có dialog, đọc từ toàn trang (đã navigate)
-            dialog = page.locator("body")
+    def _parse_snapshot(self, snapshot, known_posted_at=None):
+        """
+        Chạy toàn bộ heuristic trên snapshot trả về từ POPUP_SNAPSHOT_JS:
+          utime, time_texts, message, auto_texts, reactions [{text, label}], full_text
+        """
+        snapshot = snapshot or {}
+        full_text = snapshot.get('full_text') or ''
 
         posted_at = known_posted_at
         time_raw = ""
-        caption = ""
-        likes = 0
-        comments = 0
-        shares = 0
 
         # ── Thời gian ────────────────────────────────────────────────────────
+        # data-utime (chính xác nhất)
         if not posted_at:
-            # Thử data-utime (chính xác nhất)
-            try:
-                utime_el = dialog.locator("abbr[data-utime]").first
-                if utime_el.count() > 0:
-                    utime = utime_el.get_attribute("data-utime")
-                    time_raw = utime  # sẽ parse bên dưới
-                    if utime:
-                        from datetime import datetime
-                        import pytz
-                        dt = datetime.fromtimestamp(int(utime), tz=pytz.UTC)
-                        posted_at = dt
-            except Exception:
-                pass
+            utime = snapshot.get('utime')
+            if utime:
+                time_raw = utime
+                try:
+                    posted_at = datetime.fromtimestamp(int(utime), tz=dt_timezone.utc)
+                except (TypeError, ValueError, OverflowError):
+                    pass
 
         # Fallback: tìm text dạng "15 giờ ·" gần tên trang
         if not posted_at:
-            try:
-                time_candidates = dialog.locator("a[role='link'] span, span[role='tooltip'], abbr").all()
-                for el in time_candidates:
-                    txt = el.inner_text().strip()
-                    if txt and len(txt) < 25:
-                        dt, ok = self._parse_time_string(txt, max_days=5)
-                        if ok and dt:
-                            posted_at = dt
-                            time_raw = txt
-                            break
-            except Exception:
-                pass
-
-        # Fallback cuối: quét inner_text tìm pattern "X giờ" hoặc "X phút"
-        if not posted_at:
-            try:
-                full_text = dialog.inner_text()
-                for m in re.finditer(
-                    r'(\d+)\s*(phút|giờ|ngày|mins?|hrs?|days?|h)\b', full_text, re.IGNORECASE
-                ):
-                    dt, ok = self._parse_time_string(m.group(0), max_days=5)
+            for txt in snapshot.get('time_texts') or []:
+                txt = (txt or '').strip()
+                if txt and len(txt) < 25:
+                    dt, ok = self._parse_time_string(txt, max_days=5)
                     if ok and dt:
                         posted_at = dt
-                        time_raw = m.group(0)
+                        time_raw = txt
                         break
-            except Exception:
-                pass
 
-        # ── Caption ──────────────────────────────────────────────────────────
-        try:
-            # Thử selector chuẩn
-            msg_el = dialog.locator("div[data-ad-preview='message']")
-            if msg_el.count() > 0:
-                caption = msg_el.first.inner_text().strip()
-        except Exception:
-            pass
+        # Fallback cuối: quét inner_text tìm pattern "X giờ" hoặc "X phút"
+        if not posted_at:
+            posted_at, time_raw = self._find_time_in_text(full_text, time_raw)
 
+        # ── Caption ──────────────────────────────────────────────────────────
+        caption = (snapshot.get('message') or '').strip()
         if not caption:
-            try:
-                # div[dir='auto'] dài nhất
-                nodes = dialog.locator("div[dir='auto'], span[dir='auto']").all()
-                skip_kw = ['bình luận', 'chia sẻ', 'thích', 'comment', 'share', 'like', 'reactions']
-                best = ""
-                for node in nodes:
-                    t = node.inner_text().strip()
-                    if (len(t) > len(best)
-                            and not any(kw in t.lower() for kw in skip_kw)
-                            and len(t) > 5):
-                        best = t
-                caption = best
-            except Exception:
-                pass
-
-        caption = caption[:500] + ('...' if len(caption) > 500 else '')
+            # div[dir='auto'] dài nhất
+            caption = self._pick_caption(snapshot.get('auto_texts') or [])
+        caption = self._trim_caption(caption)
 
         # ── Likes / Reactions ────────────────────────────────────────────────
         # Popup Facebook hiển thị count reactions dạng:
         #  <span aria-label="1,2K người bày tỏ cảm xúc">  hoặc text gọn "1,2K"
-        # try:
-        #     labeled = dialog.locator("[aria-label]").all()
-        #     for el in labeled:
-        #         label = (el.get_attribute("aria-label") or "").lower()
-        #         if any(x in label for x in ['cảm xúc', 'react', 'lượt thích', 'likes', 'người thích']):
-        #             n = self._parse_number(label)
-        #             if n > likes:
-        #                 likes = n
-        # except Exception:
-        #     pass
-
-        # Fallback: số nhỏ cạnh emoji reactions
+        likes = self._max_number(
+            (r.get('text') or r.get('label')) for r in snapshot.get('reactions') or []
+        )
+        # Đọc text thô: tìm số ngay trước "bình luận"
         if likes == 0:
-            try:
-                # Tìm span chứa số ngay sau khu vực emoji reactions
-                # Facebook thường dùng: <span>1,2K</span> hoặc aria-label trực tiếp
-                reaction_spans = dialog.locator(
-                    "span[class*='reactions'], div[class*='reactions'], "
-                    "span[aria-label*='cảm xúc'], span[aria-label*='like'], "
-                    "div[aria-label*='lượt thích']"
-                ).all()
-                for sp in reaction_spans:
-                    txt = sp.text_content() or ""
-                    n = self._parse_number(txt)
-                    if n > likes:
-                        likes = n
-
-                # Đọc text thô: tìm số ngay trước "bình luận"
-                if likes == 0:
-                    raw_text = dialog.inner_text()
-                    # Pattern: "😍❤️ 1,2K    64 bình luận   130 lượt chia sẻ"
-                    m = re.search(
-                        r'([\d.,]+[kKmM]?)\s+[\d.,]+[kKmM]?\s+bình luận', raw_text
-                    )
-                    if m:
-                        likes = self._parse_number(m.group(1))
-            except Exception:
-                pass
+            likes = self._likes_from_text(full_text)
 
-        # ── Comments ─────────────────────────────────────────────────────────
-        # try:
-        #     # aria-label
-        #     labeled = dialog.locator("[aria-label]").all()
-        #     for el in labeled:
-        #         label = (el.get_attribute("aria-label") or "").lower()
-        #         if 'bình luận' in label or 'comment' in label:
-        #             if label not in ['bình luận', 'viết bình luận', 'comment', 'write a comment']:
-        #                 n = self._parse_number(label)
-        #                 if n > comments:
-        #                     comments = n
-        # except Exception:
-        #     pass
-
-        if comments == 0:
-            try:
-                raw_text = dialog.inner_text()
-                m = re.search(r'([\d.,]+[kKmM]?)\s*bình luận', raw_text, re.IGNORECASE)
-                if m:
-                    comments = self._parse_number(m.group(1))
-                else:
-                    m = re.search(r'([\d.,]+[kKmM]?)\s*comment', raw_text, re.IGNORECASE)
-                    if m:
-                        comments = self._parse_number(m.group(1))
-            except Exception:
-                pass
+        # ── Comments / Shares ────────────────────────────────────────────────
+        comments = self._comments_from_text(full_text)
+        shares = self._shares_from_text(full_text)
+
+        return self._build_post(posted_at, time_raw, caption, likes, comments, shares)
+
+    def _dedupe_and_sort(self, results):
+        seen_urls = set()
+        seen_captions = set()
+        unique_results = [r for r in results if _remember_unique(r, seen_urls, seen_captions)]
+
+        unique_results.sort(
+            key=lambda r: (r['comments'] or 0) * 5 + (r['shares'] or 0) * 2 + (r['likes'] or 0) * 1,
+            reverse=True,
+        )
+        return unique_results
+
+    # ──────────────────────────────────────────────────────────────────────────
+    # Heuristic thuần (không gọi Playwright) – dùng chung cho engine sync/async
+    # ──────────────────────────────────────────────────────────────────────────
+    def _find_time_in_text(self, full_text, time_raw=""):
+        """Tìm pattern "X giờ" / "X phút" đầu tiên trong đoạn text → (datetime|None, time_raw)."""
+        for m in re.finditer(
+            r'(\d+)\s*(phút|giờ|ngày|mins?|hrs?|days?|h)\b', full_text or '', re.IGNORECASE
+        ):
+            dt, ok = self._parse_time_string(m.group(0), max_days=5)
+            if ok and dt:
+                return dt, m.group(0)
+        return None, time_raw
+
+    def _pick_caption(self, texts):
+        """div[dir='auto'] dài nhất, bỏ qua các nhãn nút like/comment/share."""
+        skip_kw = ['bình luận', 'chia sẻ', 'thích', 'comment', 'share', 'like', 'reactions']
+        best = ""
+        for t in texts:
+            t = (t or '').strip()
+            if (len(t) > len(best)
+                    and not any(kw in t.lower() for kw in skip_kw)
+                    and len(t) > 5):
+                best = t
+        return best
+
+    def _trim_caption(self, caption):
+        return caption[:500] + ('...' if len(caption) > 500 else '')
+
+    def _max_number(self, texts):
+        best = 0
+        for txt in texts:
+            n = self._parse_number(txt or "")
+            if n > best:
+                best = n
+        return best
+
+    def _likes_from_text(self, raw_text):
+        # Pattern: "😍❤️ 1,2K    64 bình luận   130 lượt chia sẻ"
+        m = re.search(
+            rf'({_COUNT_TOKEN})\s+{_COUNT_TOKEN}\s+bình luận', raw_text or ''
+        )
+        return self._parse_number(m.group(1)) if m else 0
+
+    def _comments_from_text(self, raw_text, default=0):
+        m = re.search(rf'({_COUNT_TOKEN})\s*bình luận', raw_text or '', re.IGNORECASE)
+        if m:
+            return self._parse_number(m.group(1))
+        m = re.search(rf'({_COUNT_TOKEN})\s*comment', raw_text or '', re.IGNORECASE)
+        if m:
+            return self._parse_number(m.group(1))
+        return default
+
+    def _shares_from_text(self, raw_text, default=0):
+        for pattern in [
+            rf'({_COUNT_TOKEN})\s*lượt chia sẻ',
+            rf'({_COUNT_TOKEN})\s*chia sẻ',
+            rf'({_COUNT_TOKEN})\s*share',
+        ]:
+            m = re.search(pattern, raw_text or '', re.IGNORECASE)
+            if m:
+                shares = self._parse_number(m.group(1))
+                if shares > 0:
+                    return shares
+        return default
+
+    def _post_from_feed(self, feed_capture, post_url):
+        """Kết quả dựng từ payload feed nếu đủ mọi field, ngược lại None (cần mở bài)."""
+        known = feed_capture.lookup(post_url)
+        if not is_complete(known):
+            return None
+        post = self._build_post(
+            known['posted_at'], 'feed payload', self._trim_caption(known['caption'].strip()),
+            known['likes'], known['comments'], known['shares'],
+        )
+        post['post_url'] = post_url
+        return post
 
-        # ── Shares ───────────────────────────────────────────────────────────
-        # try:
-        #     labeled = dialog.locator("[aria-label]").all()
-        #     for el in labeled:
-        #         label = (el.get_attribute("aria-label") or "").lower()
-        #         if ('chia sẻ' in label or 'share' in label):
-        #             if label not in ['chia sẻ', 'share', 'chia sẻ bài viết', 'share post']:
-        #                 n = self._parse_number(label)
-        #                 if n > shares:
-        #                     shares = n
-        # except Exception:
-        #     pass
-
-        if shares == 0:
+    def _parse_card(self, card, post_url, known_posted_at=None, max_days=5):
+        """
+        Đọc số liệu từ snapshot 1 thẻ bài trên feed. Chỉ trả về kết quả khi thẻ đã
+        đủ dữ liệu: biết thời gian đăng, thanh hành động đã render và có số reaction.
+        Comment / share không hiện trên thẻ để None (có thể là 0 hoặc chưa render;
+        upsert giữ số đã lưu). Thiếu → None (cần mở bài).
+        """
+        if not card or not card.get('has_actions'):
+            return None
+
+        posted_at = known_posted_at
+        time_raw = 'feed card'
+        if not posted_at and card.get('utime'):
             try:
-                raw_text = dialog.inner_text()
-                for pattern in [
-                    r'([\d.,]+[kKmM]?)\s*lượt chia sẻ',
-                    r'([\d.,]+[kKmM]?)\s*chia sẻ',
-                    r'([\d.,]+[kKmM]?)\s*share',
-                ]:
-                    m = re.search(pattern, raw_text, re.IGNORECASE)
-                    if m:
-                        shares = self._parse_number(m.group(1))
-                        if shares > 0:
-                            break
-            except Exception:
+                posted_at = datetime.fromtimestamp(int(card['utime']), tz=dt_timezone.utc)
+            except (TypeError, ValueError, OverflowError):
                 pass
+        if not posted_at:
+            for txt in card.get('time_texts') or []:
+                dt, ok = self._parse_time_string((txt or '').strip(), max_days=max_days)
+                if ok and dt:
+                    posted_at = dt
+                    break
+        if not posted_at:
+            return None
+
+        full_text = card.get('full_text') or ''
+        likes = self._max_number(
+            (r.get('text') or r.get('label')) for r in card.get('reactions') or []
+        ) or self._likes_from_text(full_text)
+        if not likes:
+            return None
+
+        post = self._build_post(
+            posted_at, time_raw, self._trim_caption((card.get('message') or '').strip()),
+            likes, self._comments_from_text(full_text, default=None),
+            self._shares_from_text(full_text, default=None),
+        )
+        post['post_url'] = post_url
+        return post
 
+    def _build_post(self, posted_at, time_raw, caption, likes, comments, shares):
         if not posted_at:
-            from django.utils import timezone
             posted_at = timezone.now()
-            time_raw = "Unknown (Fallback to now)"
+            time_raw = FALLBACK_TIME_RAW
 
         return {
             'posted_at': posted_at,
@@ -498,155 +644,589 @@ class HotPostScraper:
     # ──────────────────────────────────────────────────────────────────────────
     # MAIN: scrape_page
     # ──────────────────────────────────────────────────────────────────────────
-    def scrape_page(self, account_cookies, page_url, progress_callback=None, stop_urls=None, max_days=5, max_posts=50):
+    def scrape_page(self, account_cookies, page_url, progress_callback=None, stop_urls=None, max_days=5, max_posts=50,
+                    on_post=None, should_stop=None, stop_before=None):
         """
         Luồng:
           1. Load trang, cuộn để lấy hết link bài viết trong max_days ngày gần đây
           2. Với mỗi link: click → popup → parse chi tiết
           3. Trả về list[dict] đã sort theo tương tác (likes + comments + shares)
+
+        Nếu scraper được tạo với `pool`, dùng context ấm của pool (mở tab mới
+        cho job và đóng tab khi xong); ngược lại khởi chạy Chromium riêng.
+        on_post(post) (tuỳ chọn) được gọi cho mỗi bài không trùng ngay khi parse xong.
+        should_stop() (tuỳ chọn) được kiểm tra giữa các lần cuộn và giữa các bài;
+        trả về True → dừng sớm và trả về các bài đã parse (self.last_cancelled = True).
+        stop_urls / stop_before: mốc của lần quét trước, xem _collect_post_links().
         """
-        results = []
+        return self._run_with_page(
+            account_cookies, self._scrape_in_page, page_url,
+            progress_callback=progress_callback, stop_urls=stop_urls, stop_before=stop_before,
+            max_days=max_days, max_posts=max_posts, on_post=on_post, should_stop=should_stop,
+        )
 
-        with sync_playwright() as p:
-            # Sửa đổi: Sử dụng Chrome của máy và thư mục Profile cố định để tránh bị Facebook chặn (Không dùng ẩn danh)
-            user_data_dir = os.path.join(os.getcwd(), 'fb_browser_profile')
-            
-            # Khởi chạy một trình duyệt cố định thay vì incognito
-            context = p.chromium.launch_persistent_context(
-                user_data_dir=user_data_dir,
-                headless=True,
-                args=[
-                    '--disable-notifications',
-                    '--no-sandbox',
-                    '--disable-dev-shm-usage',
-                    '--disable-blink-features=AutomationControlled',
-                    '--disable-gpu',
-                    '--disable-software-rasterizer',
-                    '--disable-extensions',
-                    '--js-flags=--max-old-space-size=512',  # Tăng lên 512MB vì RAM đã đủ 2GB
-                    '--disable-background-networking',
-                    '--blink-settings=imagesEnabled=false',  # Tắt tải ảnh → tăng tốc, giảm RAM
-                ],
-                user_agent=(
-                    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) '
-                    'AppleWebKit/537.36 (KHTML, like Gecko) '
-                    'Chrome/122.0.0.0 Safari/537.36'
-                ),
-                viewport={'width': 1366, 'height': 900},
-                locale='vi-VN',
-            )
+    def _run_with_page(self, account_cookies, fn, *args, **kwargs):
+        """Gọi fn(page, *args, **kwargs) trên 1 tab đã nạp cookies (tab của pool hoặc Chromium riêng)."""
+        if self.pool is not None:
+            def job(lease):
+                lease.ensure_cookies(account_cookies, self._load_cookies)
+                page = lease.new_page()
+                try:
+                    return fn(page, *args, **kwargs)
+                finally:
+                    try:
+                        page.close()
+                    except Exception:
+                        pass
 
-            # ── Đặt timeout TOÀN CỤC cho mọi hành động Playwright ──────────
-            # Mọi page.goto(), page.locator().all(), page.wait_for_selector()
-            # đều tự động abort sau 20 giây → không bao giờ bị block vô thời hạn
-            context.set_default_navigation_timeout(20_000)  # 20s cho navigation
-            context.set_default_timeout(10_000)             # 10s cho các selector
+            results = self.pool.run(job)
+            logger.info(f"Browser pool stats: {self.pool.stats()}")
+            return results
+
+        with ProfileDirLock() as user_data_dir, sync_playwright() as p:
+            # Khởi chạy một trình duyệt cố định thay vì incognito
+            context = launch_scrape_context(p, headless=self.headless, user_data_dir=user_data_dir)
 
             # Vẫn nạp cookies dự phòng nếu có (tuỳ chọn vì profile đã lưu session)
             self._load_cookies(context, account_cookies)
             page = context.pages[0] if context.pages else context.new_page()
 
             try:
-                logger.info(f"Navigating to {page_url}")
-                page.goto(page_url, wait_until='domcontentloaded', timeout=30_000)
-                time.sleep(2)  # Giảm từ 4s xuống 2s - đủ render JS cơ bản
+                return fn(page, *args, **kwargs)
+            finally:
+                context.close()
+
+    def scrape_page_iter(self, account_cookies, page_url, progress_callback=None, stop_urls=None, max_days=5,
+                         max_posts=50, timeout=None, should_stop=None, stop_before=None):
+        """
+        Như scrape_page() nhưng yield từng bài (đã bỏ trùng, chưa sort) ngay khi
+        parse xong. Scrape chạy trên thread riêng; lỗi của scrape được raise lại
+        sau bài cuối. Quá `timeout` giây → báo thread scrape dừng (như huỷ), chờ
+        nó thoát hẳn rồi raise TimeoutError (các bài đã yield vẫn giữ nguyên).
+        """
+        return self._iter_on_thread(
+            lambda on_post, stopped: self.scrape_page(
+                account_cookies, page_url, progress_callback=progress_callback, stop_urls=stop_urls,
+                stop_before=stop_before, max_days=max_days, max_posts=max_posts, on_post=on_post, should_stop=stopped,
+            ),
+            timeout, should_stop=should_stop, name='hot-post-scrape-iter',
+        )
+
+    def _iter_on_thread(self, target, timeout=None, should_stop=None, name='hot-post-scrape-iter'):
+        """
+        Chạy target(on_post, should_stop) trên thread riêng và yield từng bài
+        target đưa vào on_post. Khi quá hạn hoặc consumer dừng sớm, cờ dừng
+        (OR với should_stop) được bật và thread được chờ thoát hẳn, để lần scrape
+        sau không chạy chồng lên (profile, Chromium pool).
+        """
+        stream = queue.Queue()
+        failure = []
+        stop = threading.Event()
+        ended = False
+
+        def stopped():
+            return stop.is_set() or (should_stop is not None and should_stop())
+
+        def run():
+            try:
+                target(stream.put, stopped)
+            except BaseException as e:
+                failure.append(e)
+            finally:
+                stream.put(_STREAM_END)
 
-                # Đóng popup login nếu có
+        worker = threading.Thread(target=run, name=name, daemon=True)
+        worker.start()
+
+        deadline = time.monotonic() + timeout if timeout else None
+        try:
+            while True:
                 try:
-                    page.keyboard.press('Escape')
-                    time.sleep(0.5)
-                except Exception:
-                    pass
+                    remaining = deadline - time.monotonic() if deadline else None
+                    item = stream.get(timeout=max(remaining, 0) if remaining is not None else None)
+                except queue.Empty:
+                    raise TimeoutError(f"Scrape timed out after {timeout}s")
+                if item is _STREAM_END:
+                    ended = True
+                    break
+                yield item
+        finally:
+            if not ended:
+                stop.set()
+                logger.info(f"Waiting for scrape thread {name} to stop...")
+            worker.join()
+
+        if failure:
+            raise failure[0]
+
+    def _scrape_in_page(self, page, page_url, progress_callback=None, stop_urls=None, max_days=5, max_posts=50,
+                        on_post=None, should_stop=None, stop_before=None):
+        results = _PostSink(on_post)
+        self.last_cancelled = False
+        self.last_scan_complete = False
+
+        def cancelled():
+            if not self.last_cancelled and should_stop is not None and should_stop():
+                logger.info(f"Scrape of {page_url} cancelled, keeping {len(results)} posts parsed so far.")
+                self.last_cancelled = True
+            return self.last_cancelled
+
+        waiter = PageWaiter(page)
+        request_stats = RequestStats()
+        if self.block_policy is not None:
+            attach_request_policy(page, self.block_policy, request_stats)
+        feed_capture = None
+        if self.intercept_feed:
+            feed_capture = FeedCapture(self)
+            page.on('response', feed_capture.on_response)
+        resolution = {'from_payload': 0, 'from_card': 0, 'detail_visits': 0}
+
+        # dual_tab: tab chi tiết dùng lại cho mọi bài, feed không bị điều hướng đi
+        detail_tab = None
+        detail_waiter = None
+        resolved = set()
+        between_scrolls = None
+        if self.dual_tab:
+            detail_tab = page.context.new_page()
+            if self.block_policy is not None:
+                attach_request_policy(detail_tab, self.block_policy, request_stats)
+            detail_waiter = PageWaiter(detail_tab, waiter.log)
+
+            def between_scrolls(collector):
+                # Mở vài bài đã thu thập trong lúc feed tải lô mới
+                visits = 0
+                for post_url, posted_at, card_post in collector.links(max_posts):
+                    if visits >= self.VISITS_PER_SCROLL or cancelled():
+                        break
+                    if post_url in resolved or post_url in collector.pending_cards:
+                        # Thẻ còn được chụp lại ở lần cuộn sau → chưa mở bài vội
+                        continue
+                    resolved.add(post_url)
+                    before = resolution['detail_visits']
+                    post = self._resolve_link(
+                        post_url, posted_at, card_post, feed_capture, resolution,
+                        lambda url, known: self._visit_in_tab(detail_tab, url, known, detail_waiter),
+                    )
+                    if post:
+                        results.append(post)
+                    visits += resolution['detail_visits'] - before
+
+        try:
+            logger.info(f"Navigating to {page_url}")
+            page.goto(page_url, wait_until='domcontentloaded', timeout=30_000)
+            waiter.selector('feed_ready', self.LINK_SELECTOR, cap=self.LOAD_WAIT_CAP)
+
+            # Đóng popup login nếu có
+            try:
+                page.keyboard.press('Escape')
+                waiter.selector('dialog_closed', "div[role='dialog']", cap=self.ESCAPE_WAIT_CAP, state='detached')
+            except Exception:
+                pass
+
+            # ── BƯỚC 1: Thu thập link ─────────────────────────────────────
+            post_links = self._collect_post_links(
+                page, progress_callback, stop_urls, max_days=max_days, max_posts=max_posts,
+                waiter=waiter, feed_capture=feed_capture, between_scrolls=between_scrolls,
+                should_stop=cancelled, stop_before=stop_before,
+            )
+            if feed_capture is not None:
+                page.remove_listener('response', feed_capture.on_response)
+                logger.info(f"Feed payloads: {len(feed_capture)} posts from {feed_capture.responses_parsed} responses.")
+            logger.info(f"Found {len(post_links)} post links to process (max_days={max_days}, max_posts={max_posts}).")
+
+            if progress_callback:
+                progress_callback(48)
 
-                # ── BƯỚC 1: Thu thập link ─────────────────────────────────────
-                post_links = self._collect_post_links(page, progress_callback, stop_urls, max_days=max_days, max_posts=max_posts)
-                logger.info(f"Found {len(post_links)} post links to process (max_days={max_days}, max_posts={max_posts}).")
+            total = len(post_links)
 
+            if detail_tab is not None:
+                def visit(post_url, posted_at):
+                    return self._visit_in_tab(detail_tab, post_url, posted_at, detail_waiter)
+            else:
+                def visit(post_url, posted_at):
+                    return self._visit_and_return(page, page_url, post_url, posted_at, waiter)
+
+            # ── BƯỚC 2: Mở từng link chưa đủ dữ liệu → parse popup ────────
+            for idx, (post_url, posted_at, card_post) in enumerate(post_links):
+                if cancelled():
+                    break
                 if progress_callback:
-                    progress_callback(48)
+                    pct = 50 + int((idx / max(total, 1)) * 48)
+                    progress_callback(pct)
+                if post_url in resolved:
+                    continue
+                resolved.add(post_url)
 
-                total = len(post_links)
+                post = self._resolve_link(post_url, posted_at, card_post, feed_capture, resolution, visit)
+                if post:
+                    results.append(post)
 
-                # ── BƯỚC 2: Click từng link → parse popup ─────────────────────
-                for idx, (post_url, posted_at) in enumerate(post_links):
-                    if progress_callback:
-                        pct = 50 + int((idx / max(total, 1)) * 48)
-                        progress_callback(pct)
+            # ── BƯỚC 3: Sort by engagement & Deduplicate ──────────────────
+            unique_results = self._dedupe_and_sort(results)
 
-                    logger.info(f"[{idx+1}/{total}] Opening {post_url}")
-                    try:
-                        # Điều hướng đến link bài viết
-                        page.goto(post_url, wait_until='domcontentloaded', timeout=20_000)
-                        time.sleep(1.5)  # Giảm từ 3s xuống 1.5s
-
-                        post_data = self._parse_popup(page, known_posted_at=posted_at)
-                        if not post_data:
-                            logger.warning(f"Could not parse popup for {post_url}")
-                            continue
-
-                        post_data['post_url'] = post_url
-                        results.append(post_data)
-
-                        logger.info(
-                            f"  ✓ time={post_data.get('time_raw')} "
-                            f"likes={post_data['likes']} "
-                            f"comments={post_data['comments']} "
-                            f"shares={post_data['shares']}"
-                        )
-
-                        # Quay lại trang fanpage
-                        page.go_back(wait_until='domcontentloaded', timeout=15_000)
-                        time.sleep(1)  # Giảm từ 2s xuống 1s
-
-                    except PlaywrightTimeout:
-                        logger.warning(f"Timeout navigating {post_url}, skipping.")
-                        # Không cascade thêm goto() nữa - chỉ continue để tránh treo
-                        continue
-                    except Exception as e:
-                        logger.warning(f"Error on {post_url}: {e}")
-                        try:
-                            page.goto(page_url, wait_until='domcontentloaded', timeout=20_000)
-                            time.sleep(2)
-                        except Exception:
-                            pass
-                        continue
+            if progress_callback:
+                progress_callback(100)
+
+            logger.info(
+                f"Done. {len(unique_results)} posts collected and sorted by engagement."
+            )
+            if self.last_cancelled:
+                self.last_scan_complete = False
+            return unique_results
+
+        except Exception as e:
+            logger.error(f"Fatal error scraping {page_url}: {e}")
+            self.last_scan_complete = False
+            return results
+        finally:
+            self.last_wait_stats = waiter.log.summary()
+            self.last_request_stats = request_stats.summary()
+            self.last_resolution_stats = resolution
+            logger.info(f"Resolution stats: {resolution}")
+            logger.info(f"Wait stats: {self.last_wait_stats}")
+            logger.info(f"Request stats: {self.last_request_stats}")
+            if detail_tab is not None:
+                try:
+                    detail_tab.close()
+                except Exception:
+                    pass
+
+    def _resolve_link(self, post_url, posted_at, card_post, feed_capture, resolution, visit):
+        """
+        Lấy kết quả cho 1 link theo thứ tự: payload feed → thẻ bài → mở trang chi
+        tiết bằng visit(post_url, posted_at). Cập nhật bộ đếm `resolution`.
+        """
+        feed_post = self._post_from_feed(feed_capture, post_url) if feed_capture else None
+        if feed_post:
+            resolution['from_payload'] += 1
+            return feed_post
+        if card_post:
+            resolution['from_card'] += 1
+            return card_post
+
+        resolution['detail_visits'] += 1
+        return visit(post_url, posted_at)
+
+    def _visit_in_tab(self, tab, post_url, posted_at, waiter, require_actions=False):
+        """Mở bài trong tab chi tiết riêng (feed ở tab khác giữ nguyên)."""
+        logger.info(f"Opening {post_url}")
+        try:
+            tab.goto(post_url, wait_until='domcontentloaded', timeout=20_000)
+            return self._finish_visit(tab, post_url, posted_at, waiter, require_actions=require_actions)
+        except PlaywrightTimeout:
+            logger.warning(f"Timeout navigating {post_url}, skipping.")
+        except Exception as e:
+            logger.warning(f"Error on {post_url}: {e}")
+        return None
+
+    def _visit_and_return(self, page, page_url, post_url, posted_at, waiter):
+        """Chế độ 1 tab: điều hướng feed sang bài viết rồi go_back về feed."""
+        logger.info(f"Opening {post_url}")
+        try:
+            # Điều hướng đến link bài viết
+            page.goto(post_url, wait_until='domcontentloaded', timeout=20_000)
+            post_data = self._finish_visit(page, post_url, posted_at, waiter)
+
+            # Quay lại trang fanpage
+            page.go_back(wait_until='domcontentloaded', timeout=15_000)
+            waiter.selector('feed_restored', self.LINK_SELECTOR, cap=self.BACK_WAIT_CAP)
+            return post_data
+
+        except PlaywrightTimeout:
+            logger.warning(f"Timeout navigating {post_url}, skipping.")
+            # Không cascade thêm goto() nữa - chỉ continue để tránh treo
+        except Exception as e:
+            logger.warning(f"Error on {post_url}: {e}")
+            try:
+                page.goto(page_url, wait_until='domcontentloaded', timeout=20_000)
+                waiter.selector('feed_ready', self.LINK_SELECTOR, cap=self.LOAD_WAIT_CAP)
+            except Exception:
+                pass
+        return None
+
+    def _finish_visit(self, page, post_url, posted_at, waiter, require_actions=False):
+        post_data = self._parse_popup(page, known_posted_at=posted_at, waiter=waiter, require_actions=require_actions)
+        if not post_data:
+            logger.warning(f"Could not parse popup for {post_url}")
+            return None
+
+        post_data['post_url'] = post_url
+        logger.info(
+            f"  ✓ time={post_data.get('time_raw')} "
+            f"likes={post_data['likes']} "
+            f"comments={post_data['comments']} "
+            f"shares={post_data['shares']}"
+        )
+        return post_data
+
+    # ──────────────────────────────────────────────────────────────────────────
+    # REFRESH: đọc lại số liệu của các bài đã biết, không cuộn feed
+    # ──────────────────────────────────────────────────────────────────────────
+    def refresh_posts(self, account_cookies, posts, progress_callback=None, on_post=None, should_stop=None):
+        """
+        Mở thẳng từng link bài trong `posts` (list[(post_url, posted_at)]) và
+        parse lại likes / comments / shares. Không mở trang fanpage nên không
+        cuộn feed; giờ đăng đã biết được giữ nguyên. Trả về list[dict] như
+        scrape_page() (bài không parse được hoặc chưa render thanh hành động bị bỏ qua).
+        """
+        return self._run_with_page(
+            account_cookies, self._refresh_in_page, posts,
+            progress_callback=progress_callback, on_post=on_post, should_stop=should_stop,
+        )
+
+    def refresh_posts_iter(self, account_cookies, posts, progress_callback=None, timeout=None, should_stop=None):
+        """Như refresh_posts() nhưng yield từng bài ngay khi parse xong (xem scrape_page_iter())."""
+        return self._iter_on_thread(
+            lambda on_post, stopped: self.refresh_posts(
+                account_cookies, posts, progress_callback=progress_callback, on_post=on_post, should_stop=stopped,
+            ),
+            timeout, should_stop=should_stop, name='hot-post-refresh-iter',
+        )
 
-                # ── BƯỚC 3: Sort by engagement & Deduplicate ──────────────────
-                seen_urls = set()
-                seen_captions = set()
-                unique_results = []
-                for r in results:
-                    _url = r['post_url']
-                    _cap = r.get('caption', '').strip()
-                    
-                    is_duplicate = False
-                    if _url in seen_urls:
-                        is_duplicate = True
-                        
-                    if _cap and len(_cap) > 10 and _cap in seen_captions:
-                        is_duplicate = True
-                        
-                    if not is_duplicate:
-                        seen_urls.add(_url)
-                        if _cap:
-                            seen_captions.add(_cap)
-                        unique_results.append(r)
-
-                unique_results.sort(
-                    key=lambda r: r['comments'] * 5 + r['shares'] * 2 + r['likes'] * 1,
-                    reverse=True,
-                )
+    def _refresh_in_page(self, page, posts, progress_callback=None, on_post=None, should_stop=None):
+        # Link đã là duy nhất → không bỏ trùng theo caption như _PostSink
+        results = []
+        self.last_cancelled = False
+        waiter = PageWaiter(page)
+        request_stats = RequestStats()
+        if self.block_policy is not None:
+            attach_request_policy(page, self.block_policy, request_stats)
+        resolution = {'from_payload': 0, 'from_card': 0, 'detail_visits': 0}
 
+        try:
+            for idx, (post_url, posted_at) in enumerate(posts):
+                if should_stop is not None and should_stop():
+                    logger.info(f"Refresh cancelled, keeping {len(results)} posts re-measured so far.")
+                    self.last_cancelled = True
+                    break
                 if progress_callback:
-                    progress_callback(100)
+                    progress_callback(int(idx / max(len(posts), 1) * 100))
+                resolution['detail_visits'] += 1
+                # Trang bài không render (lỗi, tường đăng nhập) → bỏ qua, giữ số đã lưu
+                post = self._visit_in_tab(page, post_url, posted_at, waiter, require_actions=True)
+                if post:
+                    results.append(post)
+                    if on_post is not None:
+                        on_post(post)
+
+            if progress_callback:
+                progress_callback(100)
+            logger.info(f"Refreshed {len(results)}/{len(posts)} posts.")
+            return results
+        finally:
+            self.last_wait_stats = waiter.log.summary()
+            self.last_request_stats = request_stats.summary()
+            self.last_resolution_stats = resolution
+
+
+_STREAM_END = object()
+
+_POST_ID_RE = re.compile(
+    r'(?:story_fbid=|fbid=|v=|multi_permalinks=|/posts/|/permalink/|/videos/|/reel/|/photos/a\.[\d.]+/|/photo/\?fbid=)'
+    r'(pfbid[a-zA-Z0-9]+|\d+)'
+)
+
+
+def canonical_post_id(url):
+    """
+    Id bài viết dùng để so khớp giữa các lần quét (mốc quét, stop_urls): pfbid…
+    hoặc id số lấy từ mọi dạng URL bài viết / video / ảnh / reel. Không khớp dạng
+    nào thì lấy đoạn cuối của path; truyền vào 1 id sẵn thì trả về nguyên id đó.
+    """
+    m = _POST_ID_RE.search(url or '')
+    if m:
+        return m.group(1)
+    clean = (url or '').split('?')[0].rstrip('/')
+    return clean.split('/')[-1]
+
+
+def _remember_unique(post, seen_urls, seen_captions):
+    """True nếu bài chưa gặp (theo URL, hoặc caption dài > 10 ký tự); ghi nhớ bài đó."""
+    _url = post['post_url']
+    _cap = (post.get('caption') or '').strip()
+    if _url in seen_urls or (_cap and len(_cap) > 10 and _cap in seen_captions):
+        return False
+    seen_urls.add(_url)
+    if _cap:
+        seen_captions.add(_cap)
+    return True
+
+
+class _PostSink(list):
+    """
+    List kết quả của 1 lần scrape. Mỗi bài append vào mà chưa trùng được đẩy
+    ngay cho on_post (stream của scrape_page_iter) thay vì chờ hết lần scrape.
+    """
+
+    def __init__(self, on_post=None):
+        super().__init__()
+        self.on_post = on_post
+        self.seen_urls = set()
+        self.seen_captions = set()
+
+    def append(self, post):
+        super().append(post)
+        if self.on_post is not None and _remember_unique(post, self.seen_urls, self.seen_captions):
+            self.on_post(post)
+
+    def extend(self, posts):
+        for post in posts:
+            self.append(post)
+
+
+class _LinkCollector:
+    """
+    Trạng thái thu thập link qua các lần cuộn feed. Không đụng tới Playwright
+    nên dùng chung cho engine sync (HotPostScraper) và async (AsyncHotPostScraper).
+    """
+
+    def __init__(self, scraper, stop_urls=None, max_days=5, stop_before=None):
+        self.scraper = scraper
+        self.max_days = max_days
+        self.post_links = {}   # url → posted_at  (hoặc None nếu chưa parse được time)
+        self.card_posts = {}   # url → kết quả đọc đủ từ thẻ bài trên feed (hoặc None)
+        self.pending_cards = set()  # url có thẻ chưa đủ dữ liệu, còn được chụp lại
+        self.seen = set()
+        self.seen_ids = set()
+        self.stop_ids = {scraper._get_post_id(u) for u in (stop_urls or [])}
+        self.stop_before = stop_before - scraper.WATERMARK_TIME_GRACE if stop_before else None
+        self.watermark_hits = 0
+        self.stopped = False
+        self.stop_reason = None
+        self.old_streak = 0
+        self.no_new_count = 0
+        self.last_count = 0
+
+    def accept(self, href):
+        """
+        Chuẩn hoá href. Trả về (url, post_id) nếu là link mới, None nếu trùng
+        hoặc là bài đã biết (trong stop_urls).
+        """
+        url = self.scraper._normalize_url(href)
+        post_id = self.scraper._get_post_id(url)
+
+        if post_id in self.stop_ids:
+            if post_id not in self.seen_ids:
+                self.seen_ids.add(post_id)
+                self._known_post(post_id)
+            return None
+
+        if not url or url in self.seen or post_id in self.seen_ids:
+            return None
+
+        self.seen.add(url)
+        self.seen_ids.add(post_id)
+        return url, post_id
+
+    def feed(self, harvest):
+        """Nhận {links: [{href, text, card, recheck}], cards: [snapshot]} từ HARVEST_LINKS_JS."""
+        harvest = harvest or {}
+        cards = harvest.get('cards') or []
+        for item in harvest.get('links') or []:
+            if item.get('recheck'):
+                self._recheck_card(item.get('href') or '', cards, item.get('card'))
+                continue
+            accepted = self.accept(item.get('href') or '')
+            if self.stopped:
+                break
+            if accepted and self.add(*accepted, item.get('text')):
+                url = accepted[0]
+                self._read_card(url, cards, item.get('card'))
+
+    def _recheck_card(self, href, cards, card):
+        """Snapshot chụp lại của thẻ đã gặp: đọc lại nếu lần trước thẻ chưa đủ dữ liệu."""
+        url = self.scraper._normalize_url(href)
+        if url in self.post_links and self.card_posts.get(url) is None:
+            self._read_card(url, cards, card)
+
+    def _read_card(self, url, cards, card):
+        if card is None or card >= len(cards):
+            return
+        self.card_posts[url] = self.scraper._parse_card(
+            cards[card], url, self.post_links[url], max_days=self.max_days
+        )
+        # Thẻ chưa đủ dữ liệu nhưng sẽ được chụp lại ở lần cuộn sau
+        if self.card_posts[url] is None and cards[card].get('pending'):
+            self.pending_cards.add(url)
+        else:
+            self.pending_cards.discard(url)
+
+    def _known_post(self, post_id):
+        """Gặp bài đã quét ở lần trước; đủ WATERMARK_STOP_HITS bài liên tiếp → dừng cuộn."""
+        self.watermark_hits += 1
+        if self.watermark_hits >= self.scraper.WATERMARK_STOP_HITS:
+            logger.info(f"Gặp bài cũ ({post_id}), đã qua mốc quét lần trước – dừng quét nối tiếp.")
+            self.stopped = True
+
+    def add(self, url, post_id, text):
+        """Thử parse time từ text ngắn kế link rồi ghi nhận link (bỏ qua bài cũ)."""
+        text = (text or '').strip()
+        posted_at = None
+        if text and len(text) < 20:
+            dt, ok = self.scraper._parse_time_string(text, max_days=self.max_days)
+            if ok:
+                posted_at = dt
+                self.old_streak = 0
+            elif dt is not None:
+                # Bài cũ hơn max_days → tăng streak
+                self.old_streak += 1
+                return False  # bỏ qua bài cũ
+        if posted_at is not None and self.stop_before is not None and posted_at < self.stop_before:
+            # Đăng trước mốc quét lần trước → bài đã biết
+            self._known_post(post_id)
+            return False
+        self.watermark_hits = 0
+        # Nếu không lấy được time từ text, vẫn thu thập URL để click sau
+        self.post_links[url] = posted_at
+        return True
+
+    def done_scrolling(self, i, max_posts):
+        """Gọi sau mỗi lần cuộn; True nếu nên dừng cuộn (lý do ghi ở stop_reason)."""
+        if self.stopped:
+            self.stop_reason = 'watermark'
+            return True
+
+        current_count = len(self.post_links)
+        if current_count == self.last_count:
+            self.no_new_count += 1
+            if self.no_new_count >= 3:
+                logger.info("No new links after 3 scrolls, stopping.")
+                self.stop_reason = 'exhausted'
+                return True
+        else:
+            self.no_new_count = 0
+            self.last_count = current_count
+
+        if self.old_streak >= self.scraper.MAX_OLD_STREAK:
+            logger.info(f"Hit {self.old_streak} old posts in a row, stopping scroll.")
+            self.stop_reason = 'exhausted'
+            return True
+
+        if current_count >= max_posts:
+            logger.info(f"Reached max posts limit ({max_posts}), stopping scroll.")
+            self.stop_reason = 'max_posts'
+            return True
+
+        logger.debug(f"Scroll {i+1}: total links={current_count}, old_streak={self.old_streak}")
+        return False
+
+    def complete(self, max_posts):
+        """
+        True nếu lần cuộn đã đi hết phần feed mới: gặp mốc quét lần trước hoặc
+        feed tự hết (không còn link mới / toàn bài quá max_days), và không link
+        nào bị cắt bởi max_posts. Dừng vì max_posts, hết MAX_SCROLLS hay bị huỷ
+        → có thể còn bài mới chưa quét.
+        """
+        return self.stop_reason in ('watermark', 'exhausted') and len(self.post_links) <= max_posts
 
-                logger.info(
-                    f"Done. {len(unique_results)} posts collected and sorted by engagement."
-                )
-                return unique_results
+    def links(self, max_posts):
+        """list[(url, posted_at, card_post)] đã thu thập tới lúc này (tối đa max_posts)."""
+        return [
+            (url, posted_at, self.card_posts.get(url))
+            for url, posted_at in list(self.post_links.items())[:max_posts]
+        ]
 
-            except Exception as e:
-                logger.error(f"Fatal error scraping {page_url}: {e}")
-                return results
-            finally:
-                context.close()
+    def results(self, max_posts):
+        all_links_info = self.links(max_posts)
+        logger.info(f"Collected {len(all_links_info)} post links (limited to {max_posts}).")
+        return all_links_info
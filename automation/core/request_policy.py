@@ -0,0 +1,171 @@
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+
+# Loại tài nguyên không cần cho việc đọc feed / số liệu bài viết.
+# 'stylesheet' không chặn mặc định: feed ảo hoá của Facebook cần layout để cuộn đúng.
+DEFAULT_BLOCKED_TYPES = ('image', 'media', 'font', 'ping')
+
+DEFAULT_BLOCKED_PATTERNS = (
+    r'\.(mp4|m4s|m4a|webm|m3u8|mpd)(\?|$)',   # video / media segment
+    r'video.*\.fbcdn\.net',
+    r'/ajax/bz',                              # beacon log của Facebook
+    r'/ajax/bnzai',
+    r'/logging/',
+    r'facebook\.com/tr[/?]',
+    r'google-analytics\.com',
+    r'googletagmanager\.com',
+    r'doubleclick\.net',
+)
+
+
+class RequestBlockPolicy:
+    """
+    Chính sách chặn request cho context scrape (gắn bằng page.route).
+    Thứ tự: khớp allow_patterns → cho qua; khớp blocked_types hoặc
+    blocked_patterns → chặn; còn lại cho qua.
+    """
+
+    def __init__(self, blocked_types=DEFAULT_BLOCKED_TYPES,
+                 blocked_patterns=DEFAULT_BLOCKED_PATTERNS, allow_patterns=()):
+        self.blocked_types = frozenset(blocked_types or ())
+        self.blocked_patterns = [re.compile(p, re.IGNORECASE) for p in blocked_patterns or ()]
+        self.allow_patterns = [re.compile(p, re.IGNORECASE) for p in allow_patterns or ()]
+
+    @classmethod
+    def from_settings(cls):
+        """Đọc HOT_POST_BLOCK_* trong settings; None nếu tắt chặn request."""
+        from django.conf import settings
+        if not getattr(settings, 'HOT_POST_BLOCK_REQUESTS', True):
+            return None
+        return cls(
+            blocked_types=getattr(settings, 'HOT_POST_BLOCK_RESOURCE_TYPES', DEFAULT_BLOCKED_TYPES),
+            blocked_patterns=getattr(settings, 'HOT_POST_BLOCK_URL_PATTERNS', DEFAULT_BLOCKED_PATTERNS),
+            allow_patterns=getattr(settings, 'HOT_POST_ALLOW_URL_PATTERNS', ()),
+        )
+
+    def should_block(self, resource_type, url):
+        if any(p.search(url) for p in self.allow_patterns):
+            return False
+        if resource_type in self.blocked_types:
+            return True
+        return any(p.search(url) for p in self.blocked_patterns)
+
+
+# Kích thước ước tính (byte) của 1 response theo loại tài nguyên, dùng để ước
+# tính lượng byte tiết kiệm được khi chưa đo được response cùng loại nào
+DEFAULT_BYTES_ESTIMATE = {
+    'image': 30_000,
+    'media': 300_000,
+    'font': 40_000,
+    'stylesheet': 20_000,
+    'ping': 500,
+}
+
+
+class RequestStats:
+    """
+    Bộ đếm request của 1 lần scrape, theo loại tài nguyên. Byte đo được cho
+    request được cho qua (theo header content-length). Request bị chặn không
+    tải nên byte tiết kiệm chỉ là ước tính: trung bình các response cùng loại
+    đã đo trong lần scrape này (vd. ảnh trong allow-list), nếu không có thì
+    theo DEFAULT_BYTES_ESTIMATE; loại không có ước tính được đếm riêng.
+    """
+
+    def __init__(self, bytes_estimate=None):
+        self.allowed = 0
+        self.blocked = 0
+        self.allowed_bytes = 0
+        self.allowed_by_type = {}
+        self.blocked_by_type = {}
+        # loại → [số response có content-length, tổng byte]
+        self.measured_by_type = {}
+        self.bytes_estimate = DEFAULT_BYTES_ESTIMATE if bytes_estimate is None else bytes_estimate
+
+    def on_route(self, resource_type, blocked):
+        counts = self.blocked_by_type if blocked else self.allowed_by_type
+        counts[resource_type] = counts.get(resource_type, 0) + 1
+        if blocked:
+            self.blocked += 1
+        else:
+            self.allowed += 1
+
+    def on_response(self, response):
+        try:
+            size = int(response.headers.get('content-length') or 0)
+        except (TypeError, ValueError):
+            return
+        self.allowed_bytes += size
+        if not size:
+            return
+        try:
+            resource_type = response.request.resource_type
+        except Exception:
+            return
+        measured = self.measured_by_type.setdefault(resource_type, [0, 0])
+        measured[0] += 1
+        measured[1] += size
+
+    def estimated_size(self, resource_type):
+        """Kích thước ước tính 1 response của loại này, None nếu không có cơ sở ước tính."""
+        count, total = self.measured_by_type.get(resource_type, (0, 0))
+        if count:
+            return total / count
+        return self.bytes_estimate.get(resource_type)
+
+    def summary(self):
+        blocked_bytes = 0
+        unestimated = 0
+        for resource_type, count in self.blocked_by_type.items():
+            size = self.estimated_size(resource_type)
+            if size is None:
+                unestimated += count
+            else:
+                blocked_bytes += int(size * count)
+        return {
+            'allowed': self.allowed,
+            'blocked': self.blocked,
+            'allowed_bytes': self.allowed_bytes,
+            'allowed_by_type': dict(self.allowed_by_type),
+            'blocked_by_type': dict(self.blocked_by_type),
+            'blocked_bytes_estimate': blocked_bytes,
+            'blocked_unestimated': unestimated,
+        }
+
+
+def attach_request_policy(target, policy, stats):
+    """Gắn policy vào 1 page hoặc context (sync Playwright)."""
+    def handle(route):
+        request = route.request
+        blocked = policy.should_block(request.resource_type, request.url)
+        stats.on_route(request.resource_type, blocked)
+        try:
+            if blocked:
+                route.abort()
+            else:
+                route.continue_()
+        except Exception as e:
+            logger.debug(f"Route error: {e}")
+
+    target.route('**/*', handle)
+    target.on('response', stats.on_response)
+
+
+async def attach_request_policy_async(target, policy, stats):
+    """Gắn policy vào 1 page hoặc context (async Playwright)."""
+    async def handle(route):
+        request = route.request
+        blocked = policy.should_block(request.resource_type, request.url)
+        stats.on_route(request.resource_type, blocked)
+        try:
+            if blocked:
+                await route.abort()
+            else:
+                await route.continue_()
+        except Exception as e:
+            logger.debug(f"Route error: {e}")
+
+    await target.route('**/*', handle)
+    target.on('response', stats.on_response)
@@ -0,0 +1,178 @@
+"""
+Chạy 1 lần scrape trong process con riêng (`manage.py run_scrape_job`) thay vì
+thread trong worker. Process con có session / process group riêng; kết quả
+được stream về qua stdout (mỗi dòng 1 JSON). Khi quá hạn hoặc bị huỷ, chỉ cây
+process của đúng job đó (Python + driver Playwright + Chromium) bị kill, bộ
+nhớ được trả lại ngay và worker vẫn chạy tiếp các job khác.
+"""
+import json
+import logging
+import os
+import queue
+import signal
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+
+from .browser_pool import descendant_pids
+
+logger = logging.getLogger(__name__)
+
+
+# Thời gian chờ process tự thoát sau SIGTERM trước khi SIGKILL
+KILL_GRACE_SECONDS = 3
+
+
+class ScrapeProcessError(RuntimeError):
+    """Process con kết thúc bất thường (lỗi, bị kill, hoặc không báo 'done')."""
+
+
+def kill_process_tree(pid, grace=KILL_GRACE_SECONDS):
+    """
+    Kết thúc pid và mọi process con/cháu. Playwright khởi chạy Chromium ở
+    process group riêng (detached), nên ngoài killpg còn phải duyệt cây /proc.
+    """
+    pids = [pid] + descendant_pids(pid)
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        for target in pids:
+            try:
+                os.kill(target, sig)
+            except ProcessLookupError:
+                pass
+            except PermissionError as e:
+                logger.warning(f"Cannot signal pid {target}: {e}")
+        try:
+            os.killpg(pid, sig)
+        except (ProcessLookupError, PermissionError):
+            pass
+        if sig == signal.SIGKILL:
+            break
+        deadline = time.monotonic() + grace
+        while time.monotonic() < deadline and any(_alive(p) for p in pids):
+            time.sleep(0.1)
+        if not any(_alive(p) for p in pids):
+            break
+        # Có thể đã sinh thêm process mới trong lúc chờ
+        pids = [p for p in pids if _alive(p)] + descendant_pids(pid)
+
+
+def _alive(pid):
+    try:
+        with open(f'/proc/{pid}/stat') as fh:
+            # Zombie (đã chết, chờ được reap) coi như đã kết thúc
+            return fh.read().split(') ', 1)[1][:1] != 'Z'
+    except (OSError, IndexError):
+        try:
+            os.kill(pid, 0)
+            return True
+        except OSError:
+            return False
+
+
+def is_scrape_job_process(pid):
+    """True nếu pid vẫn là process `run_scrape_job` (pid file cũ có thể trỏ tới process khác)."""
+    try:
+        with open(f'/proc/{pid}/cmdline', 'rb') as fh:
+            return b'run_scrape_job' in fh.read()
+    except OSError:
+        return False
+
+
+def decode_post(post):
+    post = dict(post)
+    if post.get('posted_at'):
+        post['posted_at'] = datetime.fromisoformat(post['posted_at'])
+    return post
+
+
+def encode_post(post):
+    post = dict(post)
+    if post.get('posted_at') is not None:
+        post['posted_at'] = post['posted_at'].isoformat()
+    return post
+
+
+def iter_scrape_process(job, manage_py, timeout=None, pid_file=None, progress_callback=None, on_done=None):
+    """
+    Chạy job (dict tham số cho scrape_page_iter) trong process con và yield
+    từng bài ngay khi process con gửi về. Quá `timeout` giây → kill cây process
+    rồi raise TimeoutError. pid_file (tuỳ chọn) ghi pid của process con để nơi
+    khác (vd. API huỷ) kill đúng job này. on_done(stats) (tuỳ chọn) nhận thống
+    kê process con gửi kèm 'done'.
+    """
+    proc = subprocess.Popen(
+        [sys.executable, manage_py, 'run_scrape_job'],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=None,
+        start_new_session=True, text=True,
+    )
+    if pid_file:
+        os.makedirs(os.path.dirname(pid_file), exist_ok=True)
+        with open(pid_file, 'w') as fh:
+            fh.write(str(proc.pid))
+
+    lines = queue.Queue()
+
+    def read_stdout():
+        for line in proc.stdout:
+            lines.put(line)
+        lines.put(None)
+
+    threading.Thread(target=read_stdout, name=f'scrape-job-{proc.pid}', daemon=True).start()
+
+    finished = False
+    try:
+        proc.stdin.write(json.dumps(job))
+        proc.stdin.close()
+
+        deadline = time.monotonic() + timeout if timeout else None
+        while True:
+            try:
+                remaining = deadline - time.monotonic() if deadline else None
+                line = lines.get(timeout=max(remaining, 0) if remaining is not None else None)
+            except queue.Empty:
+                raise TimeoutError(f"Scrape timed out after {timeout}s")
+            if line is None:
+                break
+            try:
+                event = json.loads(line)
+            except ValueError:
+                logger.debug(f"Ignoring non-protocol output from scrape job: {line.strip()[:200]}")
+                continue
+
+            kind = event.get('event')
+            if kind == 'post':
+                yield decode_post(event['post'])
+            elif kind == 'progress':
+                if progress_callback:
+                    progress_callback(event.get('percent', 0))
+            elif kind == 'done':
+                finished = True
+                logger.info(f"Scrape job {proc.pid} stats: {event.get('stats')}")
+                if on_done is not None:
+                    on_done(event.get('stats') or {})
+                # Không chờ EOF: process cháu còn giữ stdout có thể làm EOF đến rất muộn
+                break
+            elif kind == 'error':
+                raise ScrapeProcessError(event.get('message') or 'scrape job failed')
+
+        if not finished:
+            raise ScrapeProcessError(f"Scrape job exited with code {proc.returncode} before finishing")
+    finally:
+        try:
+            # Job đã báo 'done' → cho process con tự đóng Chromium và thoát
+            proc.wait(timeout=KILL_GRACE_SECONDS if finished else 0)
+        except subprocess.TimeoutExpired:
+            pass
+        if proc.poll() is None:
+            kill_process_tree(proc.pid)
+            try:
+                proc.wait(timeout=KILL_GRACE_SECONDS)
+            except subprocess.TimeoutExpired:
+                pass
+        if pid_file:
+            try:
+                os.remove(pid_file)
+            except OSError:
+                pass
@@ -0,0 +1,178 @@
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+# Gắn MutationObserver TRƯỚC khi cuộn: promise resolve khi có node mới chứa
+# link bài viết được append vào DOM (chờ thêm settleMs cho lô render xong),
+# hoặc khi hết timeoutMs (chốt an toàn).
+ARM_FEED_GROWTH_JS = """
+({selector, settleMs, timeoutMs}) => {
+    window.__hpFeedGrowth = new Promise(resolve => {
+        let added = 0;
+        let settleTimer = null;
+        const finish = (grew) => {
+            observer.disconnect();
+            clearTimeout(capTimer);
+            clearTimeout(settleTimer);
+            resolve({grew, added});
+        };
+        const observer = new MutationObserver(mutations => {
+            for (const m of mutations) {
+                for (const n of m.addedNodes) {
+                    if (n.nodeType === 1 && (n.matches(selector) || n.querySelector(selector))) {
+                        added += 1;
+                    }
+                }
+            }
+            if (added && !settleTimer) {
+                settleTimer = setTimeout(() => finish(true), settleMs);
+            }
+        });
+        const capTimer = setTimeout(() => finish(false), timeoutMs);
+        observer.observe(document.body, {childList: true, subtree: true});
+    });
+    return true;
+}
+"""
+
+AWAIT_FEED_GROWTH_JS = "() => window.__hpFeedGrowth || {grew: false, added: 0}"
+
+# Trang bài viết / popup đã render đủ để parse
+POST_READY_SELECTOR = (
+    "div[role='dialog'], div[data-pagelet='MediaViewerPhoto'], "
+    "div[role='article'], div[data-ad-preview='message']"
+)
+
+
+class WaitLog:
+    """Ghi lại thời gian thực tế của từng lần chờ (theo tên) cho 1 lần scrape."""
+
+    def __init__(self):
+        self.records = []   # (name, seconds, satisfied)
+
+    def record(self, name, started, satisfied):
+        self.records.append((name, time.monotonic() - started, satisfied))
+
+    def summary(self):
+        """{name: {count, total_s, max_s, capped}} – capped = số lần phải chờ hết hạn."""
+        out = {}
+        for name, seconds, satisfied in self.records:
+            s = out.setdefault(name, {'count': 0, 'total_s': 0.0, 'max_s': 0.0, 'capped': 0})
+            s['count'] += 1
+            s['total_s'] += seconds
+            s['max_s'] = max(s['max_s'], seconds)
+            if not satisfied:
+                s['capped'] += 1
+        for s in out.values():
+            s['total_s'] = round(s['total_s'], 2)
+            s['max_s'] = round(s['max_s'], 2)
+        return out
+
+
+class PageWaiter:
+    """
+    Các điểm chờ của scraper (sync Playwright): mỗi hàm trả về ngay khi điều
+    kiện đúng, tối đa `cap` giây, và ghi thời gian đã chờ vào WaitLog.
+    """
+
+    def __init__(self, page, log=None):
+        self.page = page
+        self.log = log if log is not None else WaitLog()
+        self._armed_at = None
+
+    def arm_feed_growth(self, selector, cap, settle=0.3):
+        """Gọi trước khi cuộn; chờ bằng feed_growth() sau khi cuộn."""
+        self._armed_at = time.monotonic()
+        try:
+            self.page.evaluate(ARM_FEED_GROWTH_JS, {
+                'selector': selector, 'settleMs': int(settle * 1000), 'timeoutMs': int(cap * 1000),
+            })
+            return True
+        except Exception as e:
+            logger.debug(f"arm_feed_growth error: {e}")
+            self._armed_at = None
+            return False
+
+    def feed_growth(self, cap):
+        started = self._armed_at
+        self._armed_at = None
+        grew = False
+        try:
+            if started is None:
+                started = time.monotonic()
+                raise RuntimeError("feed growth observer not armed")
+            result = self.page.evaluate(AWAIT_FEED_GROWTH_JS)
+            grew = bool(result and result.get('grew'))
+        except Exception as e:
+            logger.debug(f"feed_growth error: {e}")
+            # Không chờ được theo sự kiện → giữ nhịp cũ
+            remaining = cap - (time.monotonic() - started)
+            if remaining > 0:
+                time.sleep(remaining)
+        self.log.record('feed_growth', started, grew)
+        return grew
+
+    def selector(self, name, selector, cap, state='attached'):
+        started = time.monotonic()
+        ok = False
+        try:
+            self.page.wait_for_selector(selector, state=state, timeout=int(cap * 1000))
+            ok = True
+        except Exception:
+            pass
+        self.log.record(name, started, ok)
+        return ok
+
+    def post_ready(self, cap):
+        return self.selector('post_ready', POST_READY_SELECTOR, cap)
+
+
+class AsyncPageWaiter(PageWaiter):
+    """Bản async_playwright của PageWaiter (dùng chung WaitLog)."""
+
+    async def arm_feed_growth(self, selector, cap, settle=0.3):
+        self._armed_at = time.monotonic()
+        try:
+            await self.page.evaluate(ARM_FEED_GROWTH_JS, {
+                'selector': selector, 'settleMs': int(settle * 1000), 'timeoutMs': int(cap * 1000),
+            })
+            return True
+        except Exception as e:
+            logger.debug(f"arm_feed_growth error: {e}")
+            self._armed_at = None
+            return False
+
+    async def feed_growth(self, cap):
+        started = self._armed_at
+        self._armed_at = None
+        grew = False
+        try:
+            if started is None:
+                started = time.monotonic()
+                raise RuntimeError("feed growth observer not armed")
+            result = await self.page.evaluate(AWAIT_FEED_GROWTH_JS)
+            grew = bool(result and result.get('grew'))
+        except Exception as e:
+            logger.debug(f"feed_growth error: {e}")
+            remaining = cap - (time.monotonic() - started)
+            if remaining > 0:
+                await asyncio.sleep(remaining)
+        self.log.record('feed_growth', started, grew)
+        return grew
+
+    async def selector(self, name, selector, cap, state='attached'):
+        started = time.monotonic()
+        ok = False
+        try:
+            await self.page.wait_for_selector(selector, state=state, timeout=int(cap * 1000))
+            ok = True
+        except Exception:
+            pass
+        self.log.record(name, started, ok)
+        return ok
+
+    async def post_ready(self, cap):
+        return await self.selector('post_ready', POST_READY_SELECTOR, cap)
@@ -0,0 +1,115 @@
+import logging
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from automation.models import EngagementSnapshot, HotPost
+from automation.snapshots import build_snapshots
+
+logger = logging.getLogger(__name__)
+
+
+# Field được ghi đè khi post_url đã tồn tại (created_at giữ nguyên)
+HOT_POST_UPDATE_FIELDS = [
+    'page', 'content_snippet', 'posted_at', 'posted_date',
+    'likes_count', 'comments_count', 'shares_count', 'total_engagement',
+    'measured_at', 'engagement_velocity',
+]
+
+# 2 lần đo cách nhau ít hơn khoảng này → giữ tốc độ cũ (chênh lệch quá nhỏ để tính)
+MIN_VELOCITY_SPAN = timedelta(minutes=5)
+
+
+# Khoá số liệu trong kết quả scrape, cùng thứ tự với các cột *_count của HotPost
+COUNT_KEYS = ('likes', 'comments', 'shares')
+
+
+def _build_hot_post(page, p, measured_at=None, known_counts=None):
+    """
+    Số liệu None (không đọc được, vd. thẻ feed chưa hiện số bình luận) → giữ
+    số đã lưu `known_counts` (likes, comments, shares) thay vì ghi đè bằng 0.
+    """
+    likes, comments, shares = (
+        p[key] if p.get(key) is not None else known
+        for key, known in zip(COUNT_KEYS, known_counts or (0, 0, 0))
+    )
+    return HotPost(
+        page=page,
+        post_url=p['post_url'],
+        content_snippet=p.get('caption', ''),
+        posted_at=p['posted_at'],
+        posted_date=HotPost.compute_posted_date(p['posted_at']),
+        likes_count=likes,
+        comments_count=comments,
+        shares_count=shares,
+        # bulk_create không gọi HotPost.save() → tự tính ngày đăng & điểm tương tác
+        total_engagement=HotPost.compute_engagement(likes, comments, shares),
+        measured_at=measured_at,
+    )
+
+
+def _engagement_velocity(post, previous):
+    """
+    Tương tác / giờ của bài: chênh lệch so với lần đo trước `previous`
+    (total_engagement, measured_at, engagement_velocity) nếu có, ngược lại
+    trung bình từ lúc đăng.
+    """
+    if previous and previous[1]:
+        prev_total, prev_measured_at, prev_velocity = previous
+        span = post.measured_at - prev_measured_at
+        if span < MIN_VELOCITY_SPAN:
+            return prev_velocity
+        return max(post.total_engagement - prev_total, 0) / (span.total_seconds() / 3600)
+    age_hours = (post.measured_at - post.posted_at).total_seconds() / 3600
+    return post.total_engagement / max(age_hours, 1)
+
+
+def upsert_hot_posts(page, posts):
+    """
+    Ghi 1 lô kết quả scrape vào HotPost trong 1 transaction: 1 SELECT lấy lần
+    đo trước của các bài đã có (để tính engagement_velocity) + 1 INSERT ...
+    ON CONFLICT(post_url) DO UPDATE cho cả lô + 1 INSERT EngagementSnapshot
+    cho lần đo này (automation/snapshots.py). Số liệu None giữ giá trị đã lưu.
+    Trả về {'inserted', 'updated', 'skipped'}.
+    """
+    now = timezone.now()
+    rows = {}
+    skipped = 0
+    for p in posts:
+        if not p.get('post_url') or not p.get('posted_at'):
+            logger.error(f"Skipping hotpost without post_url/posted_at: {p!r:.200}")
+            skipped += 1
+            continue
+        # Trùng post_url trong cùng lô → giữ bản sau cùng
+        rows[p['post_url']] = p
+
+    if not rows:
+        return {'inserted': 0, 'updated': 0, 'skipped': skipped}
+
+    with transaction.atomic():
+        existing = {
+            url: (previous[:3], previous[3:])
+            for url, *previous in HotPost.objects.filter(post_url__in=list(rows)).values_list(
+                'post_url', 'total_engagement', 'measured_at', 'engagement_velocity',
+                'likes_count', 'comments_count', 'shares_count',
+            )
+        }
+        for url, p in rows.items():
+            previous, known_counts = existing.get(url, (None, None))
+            post = rows[url] = _build_hot_post(page, p, measured_at=now, known_counts=known_counts)
+            post.engagement_velocity = _engagement_velocity(post, previous)
+        saved = HotPost.objects.bulk_create(
+            list(rows.values()),
+            update_conflicts=True,
+            unique_fields=['post_url'],
+            update_fields=HOT_POST_UPDATE_FIELDS,
+        )
+        if any(post.pk is None for post in saved):
+            # Backend không trả pk cho INSERT ... ON CONFLICT → đọc lại theo post_url
+            ids = dict(HotPost.objects.filter(post_url__in=list(rows)).values_list('post_url', 'id'))
+            for post in saved:
+                post.pk = ids.get(post.post_url)
+        EngagementSnapshot.objects.bulk_create(build_snapshots(saved), ignore_conflicts=True)
+
+    return {'inserted': len(rows) - len(existing), 'updated': len(existing), 'skipped': skipped}
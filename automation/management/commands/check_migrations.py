@@ -0,0 +1,117 @@
+import glob
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+def _find_pg_binary(name):
+    """initdb / pg_ctl: trong PATH hoặc thư mục cài mặc định của Debian/Ubuntu."""
+    found = shutil.which(name)
+    if found:
+        return found
+    candidates = sorted(glob.glob(f'/usr/lib/postgresql/*/bin/{name}'))
+    return candidates[-1] if candidates else None
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = (
+        'Chạy toàn bộ migration (lên rồi về zero) trên database TẠM: 1 file SQLite '
+        'mới và, nếu máy có initdb/pg_ctl + psycopg, 1 cụm PostgreSQL dựng tạm '
+        '(không cần Docker). Không đụng tới database đang cấu hình.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--skip-postgres', action='store_true')
+
+    def handle(self, *args, **options):
+        results = {'sqlite': self._check_sqlite()}
+        if options['skip_postgres']:
+            results['postgres'] = 'skipped (--skip-postgres)'
+        else:
+            results['postgres'] = self._check_postgres()
+
+        failed = False
+        for backend, outcome in results.items():
+            if outcome == 'ok':
+                self.stdout.write(self.style.SUCCESS(f"{backend}: ok"))
+            elif outcome.startswith('skipped'):
+                self.stdout.write(self.style.WARNING(f"{backend}: {outcome}"))
+            else:
+                failed = True
+                self.stdout.write(self.style.ERROR(f"{backend}: {outcome}"))
+        if failed:
+            raise CommandError("Migration check failed.")
+
+    # ──────────────────────────────────────────────────────────────────────────
+    def _migrate_roundtrip(self, env):
+        """migrate → migrate automation zero → migrate, mỗi bước 1 process riêng."""
+        manage = os.path.join(settings.BASE_DIR, 'manage.py')
+        env = {**os.environ, **env}
+        for step in (['migrate', '--noinput'],
+                     ['migrate', 'automation', 'zero', '--noinput'],
+                     ['migrate', '--noinput']):
+            proc = subprocess.run(
+                [sys.executable, manage, *step, '-v', '0'],
+                env=env, capture_output=True, text=True,
+            )
+            if proc.returncode != 0:
+                return f"failed at `{' '.join(step)}`:\n{proc.stderr.strip()[-2000:]}"
+        return 'ok'
+
+    def _check_sqlite(self):
+        with tempfile.TemporaryDirectory(prefix='fb_tool_sqlite_') as tmp:
+            return self._migrate_roundtrip({
+                'FB_TOOL_DB_ENGINE': 'sqlite',
+                'FB_TOOL_SQLITE_PATH': os.path.join(tmp, 'check.sqlite3'),
+            })
+
+    def _check_postgres(self):
+        initdb, pg_ctl = _find_pg_binary('initdb'), _find_pg_binary('pg_ctl')
+        if not (initdb and pg_ctl):
+            return 'skipped (initdb / pg_ctl not found)'
+        try:
+            import psycopg  # noqa: F401
+        except ImportError:
+            return 'skipped (psycopg not installed)'
+
+        tmp = tempfile.mkdtemp(prefix='fb_tool_pg_')
+        data_dir = os.path.join(tmp, 'data')
+        port = _free_port()
+        started = False
+        try:
+            subprocess.run(
+                [initdb, '-D', data_dir, '-U', 'fb_tool', '-A', 'trust', '--no-sync'],
+                check=True, capture_output=True,
+            )
+            subprocess.run(
+                [pg_ctl, '-D', data_dir, '-l', os.path.join(tmp, 'postgres.log'), '-w',
+                 '-o', f"-p {port} -k {tmp} -c listen_addresses=''", 'start'],
+                check=True, capture_output=True,
+            )
+            started = True
+            return self._migrate_roundtrip({
+                'FB_TOOL_DB_ENGINE': 'postgres',
+                'POSTGRES_DB': 'postgres',
+                'POSTGRES_USER': 'fb_tool',
+                'POSTGRES_PASSWORD': '',
+                'POSTGRES_HOST': tmp,   # unix socket trong thư mục tạm
+                'POSTGRES_PORT': str(port),
+            })
+        except subprocess.CalledProcessError as e:
+            return f"failed to start throwaway postgres: {(e.stderr or b'').decode(errors='replace')[-1000:]}"
+        finally:
+            if started:
+                subprocess.run([pg_ctl, '-D', data_dir, '-m', 'immediate', 'stop'], capture_output=True)
+            shutil.rmtree(tmp, ignore_errors=True)
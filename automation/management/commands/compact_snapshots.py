@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from automation.snapshots import compact_snapshots
+
+
+class Command(BaseCommand):
+    help = (
+        'Thưa và xoá điểm đo EngagementSnapshot theo HOT_POST_SNAPSHOT_* (bài cũ chỉ giữ '
+        'điểm đo thưa, điểm đo quá RETENTION_DAYS ngày bị xoá). Duyệt lại mọi bài còn trong thời hạn giữ.'
+    )
+
+    def handle(self, *args, **options):
+        stats = compact_snapshots()
+        self.stdout.write(self.style.SUCCESS(
+            f"Đã xoá {stats['expired']} điểm đo hết hạn, {stats['downsampled']} điểm đo thừa "
+            f"của {stats['posts']} bài."
+        ))
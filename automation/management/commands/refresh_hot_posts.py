@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from automation.refresh import enqueue_refresh, refresh_priority
+
+
+class Command(BaseCommand):
+    help = (
+        'Đưa vào hàng đợi việc đọc lại số liệu tương tác của các bài còn trẻ '
+        '(HOT_POST_REFRESH_MAX_AGE_HOURS), tối đa HOT_POST_REFRESH_BUDGET bài, không cuộn feed.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--budget', type=int, default=None, help='Số bài tối đa cho lần chạy này')
+        parser.add_argument('--dry-run', action='store_true', help='Chỉ in danh sách bài, không đưa vào hàng đợi')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        stats = enqueue_refresh(now=now, budget=options['budget'], dry_run=options['dry_run'])
+        action = 'Sẽ làm mới' if options['dry_run'] else 'Đã đưa vào hàng đợi'
+
+        for user_id, posts in stats['enqueued']:
+            self.stdout.write(f"{action} {len(posts)} bài của user #{user_id}.")
+            if options['verbosity'] > 1:
+                for post in posts:
+                    self.stdout.write(
+                        f"  [{refresh_priority(post, now):.0f}] {post.page.name}: {post.post_url} "
+                        f"({post.engagement_velocity:.1f}/giờ)"
+                    )
+        for user_id, reason in stats['skipped']:
+            self.stdout.write(f"Bỏ qua user #{user_id}: {reason}")
+
+        self.stdout.write(self.style.SUCCESS(f"Làm mới số liệu: {stats['selected']} bài được chọn."))
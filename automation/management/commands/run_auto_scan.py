@@ -1,49 +1,53 @@
+from django.conf import settings
+from django.core.management import call_command
 from django.core.management.base import BaseCommand
-from automation.models import ObservedPage, FacebookAccount
-from automation.tasks import scrape_page_background_task
-from django.contrib.auth.models import User
+from django.utils import timezone
+
+from automation.models import ObservedPage
+from automation.scheduler import enqueue_due_pages, is_adaptive, next_auto_scan_at
+from automation.snapshots import compact_snapshots_if_due
 
 
 class Command(BaseCommand):
-    help = 'Quét HotPosts cho tất cả Page của mỗi User (chạy như thủ công).'
+    help = (
+        'Đưa các Fanpage bật Tự Động Quét đã tới giờ quét (auto_scan_time hoặc giờ mặc định '
+        'HOT_POST_AUTO_SCAN_SLOTS) vào hàng đợi. Nên chạy vài phút 1 lần (cron hoặc Task lặp lại).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Chỉ in lịch, không đưa vào hàng đợi')
 
     def handle(self, *args, **options):
+        dry_run = options['dry_run']
         self.stdout.write("Bắt đầu Auto Scan (Background Task)...")
-        users = User.objects.all()
-
-        for user in users:
-            account = FacebookAccount.objects.filter(user=user, status='live').first()
-            if not account:
-                self.stdout.write(f"User {user.username} - Bỏ qua (không có tài khoản FB Live).")
-                continue
-
-            pages = ObservedPage.objects.filter(user=user)
-            if not pages.exists():
-                self.stdout.write(f"User {user.username} - Bỏ qua (không có page nào).")
-                continue
-
-            # KIỂM TRA: Nếu user đang có bất kỳ page nào đang queued/running
-            has_active = pages.filter(scrape_status__in=['queued', 'running']).exists()
-            if has_active:
-                from background_task.models import Task
-                # Nếu không có background task nào đang chờ trong hệ thống, nghĩa là trạng thái kia bị kẹt
-                if Task.objects.count() == 0:
-                    self.stdout.write(f"User {user.username} - Phát hiện trạng thái bị kẹt, đang reset lại trạng thái.")
-                    pages.filter(scrape_status__in=['queued', 'running']).update(scrape_status='idle')
-                else:
-                    self.stdout.write(f"User {user.username} - Bỏ qua (đang có tiến trình quét diễn ra trong hàng đợi).")
-                    continue
-
-            # Đưa TẤT CẢ page vào hàng đợi
-            page_ids = list(pages.values_list('id', flat=True))
-
-            self.stdout.write(f"User {user.username} - Đưa {len(page_ids)} page vào hàng đợi: {page_ids}")
-
-            for pid in page_ids:
-                scrape_page_background_task(pid, user.id)
-
-            pages.update(scrape_status='queued')
-
-            self.stdout.write(self.style.SUCCESS(f"User {user.username} - Đã lên lịch thành công!"))
 
-        self.stdout.write(self.style.SUCCESS("Auto Scan hoàn tất!"))
+        stats = enqueue_due_pages(dry_run=dry_run)
+        if stats['reset']:
+            self.stdout.write(f"Phát hiện {stats['reset']} page bị kẹt trạng thái (không còn task), đã reset về idle.")
+
+        for page, due_at in stats['enqueued']:
+            action = 'Sẽ đưa' if dry_run else 'Đã đưa'
+            self.stdout.write(f"{action} vào hàng đợi: {page.name} (tới hạn {timezone.localtime(due_at):%d/%m %H:%M})")
+        for page, reason in stats['skipped']:
+            self.stdout.write(f"Bỏ qua {page.name}: {reason}")
+
+        if options['verbosity'] > 1:
+            for page in ObservedPage.objects.filter(is_auto_scan=True, user__isnull=False).order_by('name'):
+                mode = f"mỗi {page.scan_interval_minutes or '-'} phút" if is_adaptive(page) else "giờ cố định"
+                self.stdout.write(f"  {page.name} ({mode}): lần quét kế tiếp {timezone.localtime(next_auto_scan_at(page)):%d/%m %H:%M}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Auto Scan hoàn tất! {stats['due']} page tới hạn, {len(stats['enqueued'])} được đưa vào hàng đợi."
+        ))
+
+        if getattr(settings, 'HOT_POST_REFRESH_ENABLED', True):
+            call_command(
+                'refresh_hot_posts', dry_run=dry_run, verbosity=options['verbosity'], stdout=self.stdout,
+            )
+
+        if not dry_run:
+            compacted = compact_snapshots_if_due()
+            if compacted:
+                self.stdout.write(
+                    f"Thưa điểm đo tương tác: xoá {compacted['expired']} hết hạn, {compacted['downsampled']} thừa."
+                )
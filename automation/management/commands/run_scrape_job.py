@@ -0,0 +1,67 @@
+import json
+import os
+import sys
+import threading
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+
+from automation.core.scrape_executor import encode_post
+
+
+class Command(BaseCommand):
+    help = (
+        'Process con của scrape executor (automation/core/scrape_executor.py): đọc '
+        'tham số job (JSON) từ stdin, ghi từng bài / tiến độ ra stdout dạng JSON lines. '
+        'Không gọi trực tiếp.'
+    )
+
+    def handle(self, *args, **options):
+        # Giữ stdout gốc cho giao thức, mọi output khác (print, log) đẩy sang stderr
+        out = os.fdopen(os.dup(sys.stdout.fileno()), 'w', buffering=1)
+        os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+        lock = threading.Lock()
+
+        def emit(event, **data):
+            # progress_callback chạy trên thread scrape, bài viết trên thread chính
+            with lock:
+                out.write(json.dumps({'event': event, **data}) + '\n')
+
+        from automation.tasks import _make_scraper, page_cancel_check
+
+        job = json.loads(sys.stdin.read())
+        progress_callback = lambda pct: emit('progress', percent=pct)
+        if job.get('refresh_posts') is not None:
+            # Làm mới số liệu: chỉ mở trang chi tiết của các bài đã biết
+            scraper = _make_scraper(pooled=False, sync=True)
+            posts = scraper.refresh_posts_iter(
+                job['account_cookies'],
+                [(url, datetime.fromisoformat(posted_at) if posted_at else None) for url, posted_at in job['refresh_posts']],
+                progress_callback=progress_callback,
+            )
+        else:
+            # Process con sống 1 job → không giữ Chromium pool ấm
+            scraper = _make_scraper(pooled=False)
+            posts = scraper.scrape_page_iter(
+                job['account_cookies'], job['page_url'],
+                progress_callback=progress_callback,
+                stop_urls=job.get('stop_urls'),
+                stop_before=datetime.fromisoformat(job['stop_before']) if job.get('stop_before') else None,
+                max_days=job.get('max_days', 5),
+                max_posts=job.get('max_posts', 50),
+                should_stop=page_cancel_check(job['page_id']) if job.get('page_id') else None,
+            )
+        try:
+            for post in posts:
+                emit('post', post=encode_post(post))
+        except Exception as e:
+            emit('error', message=str(e))
+            sys.exit(1)
+
+        emit('done', stats={
+            'resolution': scraper.last_resolution_stats,
+            'requests': scraper.last_request_stats,
+            'cancelled': scraper.last_cancelled,
+            'scan_complete': scraper.last_scan_complete,
+        })
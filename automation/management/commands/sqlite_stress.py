@@ -0,0 +1,116 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, connections, transaction, OperationalError
+from django.utils import timezone
+
+from automation.models import HotPost, ObservedPage
+
+# Bảng nháp cho luồng ghi – không đụng tới dữ liệu HotPost thật
+STRESS_TABLE = 'automation_sqlite_stress'
+
+
+class Command(BaseCommand):
+    help = (
+        'Kiểm tra tải SQLite: nhiều luồng đọc (giống UI poll api_scrape_status / '
+        'api_get_posts) song song với luồng ghi theo lô (giống worker scrape), '
+        'dùng đúng cấu hình DATABASES hiện tại. Báo số lỗi "database is locked" và độ trễ.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--seconds', type=float, default=10)
+        parser.add_argument('--batch', type=int, default=50, help='Số dòng mỗi transaction ghi')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            self.stdout.write(f"Database đang dùng là {connection.vendor}, lệnh này chỉ dành cho SQLite.")
+            return
+
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            journal_mode = cursor.fetchone()[0]
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS {STRESS_TABLE} '
+                '(id INTEGER PRIMARY KEY AUTOINCREMENT, worker INTEGER, payload TEXT, created_at TEXT)'
+            )
+        self.stdout.write(f"journal_mode={journal_mode}, readers={options['readers']}, "
+                          f"writers={options['writers']}, seconds={options['seconds']}")
+
+        stop_at = time.monotonic() + options['seconds']
+        stats = {}
+        lock = threading.Lock()
+
+        def record(kind, started, error=None):
+            with lock:
+                s = stats.setdefault(kind, {'ops': 0, 'locked': 0, 'errors': 0, 'latencies': []})
+                if error is None:
+                    s['ops'] += 1
+                    s['latencies'].append(time.monotonic() - started)
+                elif 'locked' in str(error):
+                    s['locked'] += 1
+                else:
+                    s['errors'] += 1
+
+        def reader():
+            try:
+                while time.monotonic() < stop_at:
+                    started = time.monotonic()
+                    try:
+                        ObservedPage.objects.filter(scrape_status__in=['queued', 'running', 'cancelling']).count()
+                        list(HotPost.objects.order_by('-posted_date', '-total_engagement')
+                             .values_list('id', flat=True)[:13])
+                        with connection.cursor() as cursor:
+                            cursor.execute(f'SELECT COUNT(*) FROM {STRESS_TABLE}')
+                        record('read', started)
+                    except OperationalError as e:
+                        record('read', started, e)
+            finally:
+                connections.close_all()
+
+        def writer(worker):
+            try:
+                while time.monotonic() < stop_at:
+                    started = time.monotonic()
+                    now = timezone.now().isoformat()
+                    try:
+                        with transaction.atomic():
+                            with connection.cursor() as cursor:
+                                cursor.executemany(
+                                    f'INSERT INTO {STRESS_TABLE} (worker, payload, created_at) VALUES (%s, %s, %s)',
+                                    [(worker, 'x' * 200, now)] * options['batch'],
+                                )
+                        record('write', started)
+                    except OperationalError as e:
+                        record('write', started, e)
+                    time.sleep(0.01)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=reader) for _ in range(options['readers'])]
+        threads += [threading.Thread(target=writer, args=(i,)) for i in range(options['writers'])]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {STRESS_TABLE}')
+
+        failed = False
+        for kind, s in sorted(stats.items()):
+            lat = sorted(s['latencies']) or [0]
+            p50 = lat[len(lat) // 2] * 1000
+            p99 = lat[min(len(lat) - 1, int(len(lat) * 0.99))] * 1000
+            self.stdout.write(
+                f"{kind}: {s['ops']} ok, {s['locked']} locked, {s['errors']} errors, "
+                f"p50={p50:.1f}ms p99={p99:.1f}ms max={lat[-1] * 1000:.1f}ms"
+            )
+            failed = failed or s['locked'] or s['errors']
+
+        if failed:
+            self.stdout.write(self.style.ERROR("Có lỗi lock / lỗi DB trong lúc chạy song song."))
+        else:
+            self.stdout.write(self.style.SUCCESS("Không có lỗi \"database is locked\"."))
@@ -0,0 +1,33 @@
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def drop_duplicate_post_urls(apps, schema_editor):
+    # Trước đây chỉ unique theo (page, post_url): giữ bản ghi mới nhất cho mỗi post_url
+    HotPost = apps.get_model('automation', 'HotPost')
+    dupes = (
+        HotPost.objects.values('post_url')
+        .annotate(keep_id=Max('id'), n=models.Count('id'))
+        .filter(n__gt=1)
+    )
+    for row in dupes:
+        HotPost.objects.filter(post_url=row['post_url']).exclude(id=row['keep_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('automation', '0006_scrapejob'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='hotpost',
+            name='unique_post_per_page',
+        ),
+        migrations.RunPython(drop_duplicate_post_urls, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='hotpost',
+            constraint=models.UniqueConstraint(fields=('post_url',), name='unique_post_url'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+from django.db import migrations, models
+from django.db.models.functions import TruncDate
+
+
+def backfill_posted_date(apps, schema_editor):
+    # Cùng phép tính với TruncDate('posted_at') mà api_get_posts dùng trước đây
+    HotPost = apps.get_model('automation', 'HotPost')
+    HotPost.objects.filter(posted_date__isnull=True).update(posted_date=TruncDate('posted_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('automation', '0007_hotpost_unique_post_url'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hotpost',
+            name='posted_date',
+            field=models.DateField(blank=True, editable=False, help_text='Ngày đăng (theo TIME_ZONE) – lưu sẵn để sort / nhóm theo ngày', null=True),
+        ),
+        migrations.RunPython(backfill_posted_date, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='hotpost',
+            index=models.Index(fields=['-posted_date', '-total_engagement'], name='hotpost_date_engagement_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='hotpost',
+            index=models.Index(fields=['-posted_date', '-posted_at'], name='hotpost_date_posted_at_idx'),
+        ),
+    ]
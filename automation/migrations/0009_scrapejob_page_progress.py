@@ -0,0 +1,40 @@
+# Generated by Django 5.2.11 on 2026-10-18 00:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('automation', '0008_hotpost_posted_date'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scrapejob',
+            name='batch_id',
+            field=models.UUIDField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='scrapejob',
+            name='page',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='scrape_jobs', to='automation.observedpage'),
+        ),
+        migrations.AddField(
+            model_name='scrapejob',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='scrape_jobs', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='scrapejob',
+            name='status',
+            field=models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('completed', 'Completed'), ('error', 'Error'), ('cancelled', 'Cancelled')], default='queued', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='scrapejob',
+            index=models.Index(fields=['user', '-created_at'], name='scrapejob_user_created_idx'),
+        ),
+    ]
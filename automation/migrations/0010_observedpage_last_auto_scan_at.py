@@ -0,0 +1,18 @@
+# Generated by Django 5.2.11 on 2026-10-18 00:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('automation', '0009_scrapejob_page_progress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='observedpage',
+            name='last_auto_scan_at',
+            field=models.DateTimeField(blank=True, editable=False, help_text='Lần gần nhất Auto Scan đưa page vào hàng đợi', null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.11 on 2026-10-18 00:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('automation', '0010_observedpage_last_auto_scan_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='observedpage',
+            name='scan_interval_minutes',
+            field=models.PositiveIntegerField(blank=True, editable=False, help_text='Khoảng cách Auto Scan tự điều chỉnh theo tần suất đăng bài', null=True),
+        ),
+    ]
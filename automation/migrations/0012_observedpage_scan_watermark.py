@@ -0,0 +1,23 @@
+# Generated by Django 5.2.11 on 2026-10-18 00:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('automation', '0011_observedpage_scan_interval_minutes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='observedpage',
+            name='watermark_post_ids',
+            field=models.JSONField(blank=True, default=list, editable=False, help_text='Id (canonical) các bài mới nhất đã quét'),
+        ),
+        migrations.AddField(
+            model_name='observedpage',
+            name='watermark_posted_at',
+            field=models.DateTimeField(blank=True, editable=False, help_text='Giờ đăng của bài mới nhất đã quét', null=True),
+        ),
+    ]
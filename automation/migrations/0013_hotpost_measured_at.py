@@ -0,0 +1,27 @@
+# Generated by Django 5.2.11 on 2026-10-18 00:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('automation', '0012_observedpage_scan_watermark'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hotpost',
+            name='engagement_velocity',
+            field=models.FloatField(default=0, help_text='Tương tác / giờ giữa 2 lần đo gần nhất'),
+        ),
+        migrations.AddField(
+            model_name='hotpost',
+            name='measured_at',
+            field=models.DateTimeField(blank=True, help_text='Lần đọc số liệu tương tác gần nhất (quét feed hoặc làm mới)', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='hotpost',
+            index=models.Index(fields=['posted_at'], name='hotpost_posted_at_idx'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.11 on 2026-10-18 00:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def seed_snapshots(apps, schema_editor):
+    # Mỗi bài đã có bắt đầu chuỗi số liệu từ giá trị hiện tại
+    HotPost = apps.get_model('automation', 'HotPost')
+    EngagementSnapshot = apps.get_model('automation', 'EngagementSnapshot')
+    rows = HotPost.objects.annotate(snapshot_at=Coalesce('measured_at', 'created_at')).values_list(
+        'id', 'page_id', 'snapshot_at', 'likes_count', 'comments_count', 'shares_count', 'total_engagement',
+    )
+    batch = []
+    for post_id, page_id, measured_at, likes, comments, shares, total in rows.iterator(chunk_size=1000):
+        batch.append(EngagementSnapshot(
+            post_id=post_id, page_id=page_id, measured_at=measured_at, likes_count=likes,
+            comments_count=comments, shares_count=shares, total_engagement=total,
+        ))
+        if len(batch) >= 1000:
+            EngagementSnapshot.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    EngagementSnapshot.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('automation', '0013_hotpost_measured_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EngagementSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('measured_at', models.DateTimeField()),
+                ('likes_count', models.IntegerField(default=0)),
+                ('comments_count', models.IntegerField(default=0)),
+                ('shares_count', models.IntegerField(default=0)),
+                ('total_engagement', models.IntegerField(default=0)),
+                ('page', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='engagement_snapshots', to='automation.observedpage')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='automation.hotpost')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['page', 'measured_at'], name='snapshot_page_measured_idx'), models.Index(fields=['measured_at'], name='snapshot_measured_at_idx')],
+                'constraints': [models.UniqueConstraint(fields=('post', 'measured_at'), name='unique_snapshot_post_measured_at')],
+            },
+        ),
+        migrations.RunPython(seed_snapshots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.11 on 2026-10-18 01:13
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_finished_at(apps, schema_editor):
+    # Job đã kết thúc trước migration: lần ghi cuối chính là lúc kết thúc
+    ScrapeJob = apps.get_model('automation', 'ScrapeJob')
+    ScrapeJob.objects.filter(status__in=('completed', 'error', 'cancelled')).update(finished_at=F('updated_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('automation', '0014_engagementsnapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scrapejob',
+            name='finished_at',
+            field=models.DateTimeField(blank=True, help_text='Lúc job chuyển sang trạng thái cuối', null=True),
+        ),
+        migrations.RunPython(backfill_finished_at, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,8 @@
+import uuid
+
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 
 class FacebookAccount(models.Model):
@@ -65,6 +68,16 @@ class ObservedPage(models.Model):
     auto_scan_time = models.TimeField(null=True, blank=True, help_text="Bỏ trống để chạy mặc định (00:00 & 12:00) hoặc đặt giờ quét cụ thể")
     scrape_status = models.CharField(max_length=20, default='idle', help_text="idle, running, completed, error")
     last_scraped_at = models.DateTimeField(null=True, blank=True)
+    last_auto_scan_at = models.DateTimeField(null=True, blank=True, editable=False,
+                                             help_text="Lần gần nhất Auto Scan đưa page vào hàng đợi")
+    scan_interval_minutes = models.PositiveIntegerField(null=True, blank=True, editable=False,
+                                                        help_text="Khoảng cách Auto Scan tự điều chỉnh theo tần suất đăng bài")
+    # Mốc quét (high-water mark) của lần quét thành công gần nhất: các lần quét sau
+    # dừng cuộn feed khi đã đi qua mốc này
+    watermark_post_ids = models.JSONField(default=list, blank=True, editable=False,
+                                          help_text="Id (canonical) các bài mới nhất đã quét")
+    watermark_posted_at = models.DateTimeField(null=True, blank=True, editable=False,
+                                               help_text="Giờ đăng của bài mới nhất đã quét")
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
@@ -75,11 +88,16 @@ class HotPost(models.Model):
     post_url = models.URLField(max_length=1000, help_text="Link bài viết")
     content_snippet = models.TextField(blank=True, null=True, help_text="Một đoạn nội dung bài viết")
     posted_at = models.DateTimeField(help_text="Thời gian đăng bài ước tính")
+    posted_date = models.DateField(null=True, blank=True, editable=False,
+                                   help_text="Ngày đăng (theo TIME_ZONE) – lưu sẵn để sort / nhóm theo ngày")
     
     likes_count = models.IntegerField(default=0)
     comments_count = models.IntegerField(default=0)
     shares_count = models.IntegerField(default=0)
     total_engagement = models.IntegerField(default=0, help_text="Tổng lượt tương tác (Like + Cmt + Share)")
+    measured_at = models.DateTimeField(null=True, blank=True,
+                                       help_text="Lần đọc số liệu tương tác gần nhất (quét feed hoặc làm mới)")
+    engagement_velocity = models.FloatField(default=0, help_text="Tương tác / giờ giữa 2 lần đo gần nhất")
     
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -87,11 +105,90 @@ class HotPost(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['post_url'], name='unique_post_url')
         ]
+        # Khớp 2 kiểu sort của api_get_posts (ngày mới nhất trước, rồi tương tác / giờ đăng)
+        indexes = [
+            models.Index(fields=['-posted_date', '-total_engagement'], name='hotpost_date_engagement_idx'),
+            models.Index(fields=['-posted_date', '-posted_at'], name='hotpost_date_posted_at_idx'),
+            # Chọn bài còn trẻ cho lần làm mới số liệu (automation/refresh.py)
+            models.Index(fields=['posted_at'], name='hotpost_posted_at_idx'),
+        ]
+
+    @staticmethod
+    def compute_engagement(likes, comments, shares):
+        """Điểm tương tác: comment x3, share x2, like x1 (dùng chung cho save() và bulk upsert)."""
+        return comments * 3 + shares * 2 + likes * 1
+
+    @staticmethod
+    def compute_posted_date(posted_at):
+        """Ngày đăng theo múi giờ hiện tại (cùng kết quả với TruncDate('posted_at'))."""
+        if posted_at is None:
+            return None
+        if timezone.is_naive(posted_at):
+            return posted_at.date()
+        return timezone.localdate(posted_at)
 
     def save(self, *args, **kwargs):
-        self.total_engagement = self.comments_count * 3 + self.shares_count * 2 + self.likes_count * 1
+        self.total_engagement = self.compute_engagement(self.likes_count, self.comments_count, self.shares_count)
+        self.posted_date = self.compute_posted_date(self.posted_at)
         super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.page.name} - {self.total_engagement} engagements"
 
+
+class EngagementSnapshot(models.Model):
+    """
+    Số liệu tương tác của 1 HotPost tại 1 lần đo (mỗi lần quét / làm mới ghi 1 dòng).
+    Được thưa dần và xoá theo tuổi bởi automation/snapshots.py > compact_snapshots().
+    """
+    post = models.ForeignKey(HotPost, on_delete=models.CASCADE, related_name='snapshots')
+    # Lặp lại page của post để truy vấn theo page không phải join HotPost
+    page = models.ForeignKey(ObservedPage, on_delete=models.CASCADE, related_name='engagement_snapshots')
+    measured_at = models.DateTimeField()
+
+    likes_count = models.IntegerField(default=0)
+    comments_count = models.IntegerField(default=0)
+    shares_count = models.IntegerField(default=0)
+    total_engagement = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'measured_at'], name='unique_snapshot_post_measured_at')
+        ]
+        indexes = [
+            models.Index(fields=['page', 'measured_at'], name='snapshot_page_measured_idx'),
+            models.Index(fields=['measured_at'], name='snapshot_measured_at_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.post_id} @ {self.measured_at:%Y-%m-%d %H:%M} - {self.total_engagement} engagements"
+
+
+class ScrapeJob(models.Model):
+    """1 lần quét 1 Fanpage. Các job tạo cùng 1 lần bấm "Quét" có chung batch_id."""
+    STATUS_CHOICES = (
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('error', 'Error'),
+        ('cancelled', 'Cancelled'),
+    )
+    job_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    batch_id = models.UUIDField(null=True, blank=True, db_index=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='scrape_jobs')
+    page = models.ForeignKey(ObservedPage, on_delete=models.CASCADE, null=True, blank=True, related_name='scrape_jobs')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    progress = models.IntegerField(default=0)
+    results_count = models.IntegerField(default=0)
+    error_message = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True, help_text="Lúc job chuyển sang trạng thái cuối")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='scrapejob_user_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.page} - {self.status} ({self.progress}%)"
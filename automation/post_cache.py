@@ -0,0 +1,63 @@
+"""
+Cache kết quả api_get_posts theo user. Mỗi user có 1 số version trong cache;
+worker scrape tăng version khi ghi HotPost mới nên mọi trang đã cache của user
+đó tự hết hiệu lực (không cần xoá từng key); sửa / xoá page và xoá bài cũng
+tăng version (automation/signals.py). Cần backend cache dùng chung giữa
+web và worker `process_tasks` (xem CACHES trong settings).
+"""
+import hashlib
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+
+def _cache():
+    return caches[getattr(settings, 'HOT_POSTS_CACHE_ALIAS', 'default')]
+
+
+def _version_key(user_id):
+    return f'hotposts:version:{user_id}'
+
+
+def get_user_version(user_id):
+    cache = _cache()
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        # Khởi tạo theo thời gian: version bị evict không quay về số cũ đã dùng
+        cache.add(_version_key(user_id), time.time_ns(), timeout=None)
+        version = cache.get(_version_key(user_id), 0)
+    return version
+
+
+def bump_user_version(user_id):
+    """Gọi sau khi ghi HotPost của user → các trang đã cache không còn được dùng."""
+    cache = _cache()
+    try:
+        cache.incr(_version_key(user_id))
+    except ValueError:
+        # Chưa có version (chưa cache trang nào hoặc đã bị evict)
+        cache.set(_version_key(user_id), time.time_ns(), timeout=None)
+
+
+def get_or_build_page(user_id, sort_by, cursor, build):
+    """
+    Trả về (body, etag) của 1 trang kết quả. build() → bytes JSON, chỉ được gọi
+    khi cache chưa có trang này cho version hiện tại của user.
+    """
+    cache = _cache()
+    version = get_user_version(user_id)
+    raw = f'{user_id}:{version}:{sort_by}:{cursor or ""}'
+    key = 'hotposts:page:' + hashlib.md5(raw.encode()).hexdigest()
+
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    body = build()
+    etag = '"' + hashlib.md5(body).hexdigest() + '"'
+    cache.set(key, (body, etag), timeout=getattr(settings, 'HOT_POSTS_CACHE_TIMEOUT', 300))
+    return body, etag
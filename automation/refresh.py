@@ -0,0 +1,102 @@
+"""
+Làm mới số liệu tương tác của các bài còn trẻ mà không quét lại feed. Mỗi lần
+chạy chọn các HotPost đăng chưa quá HOT_POST_REFRESH_MAX_AGE_HOURS giờ, xếp
+theo lượng tương tác ước tính đã thay đổi từ lần đo gần nhất (engagement_velocity
+x số giờ chưa đo lại) và chỉ đọc lại tối đa HOT_POST_REFRESH_BUDGET bài: bài
+đang lên nhanh được đo dày, bài đã chững lại chỉ được đo lại khi đủ lâu.
+Mỗi user có tài khoản FB Live được đưa vào hàng đợi 1 refresh_post_metrics_task.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from automation.models import FacebookAccount, HotPost
+from automation.tasks import refresh_post_metrics_task, ACTIVE_SCRAPE_STATUSES, REFRESH_TASK_NAME
+
+logger = logging.getLogger(__name__)
+
+
+# Tốc độ tối thiểu khi xếp hạng (tương tác / giờ): bài chưa có tương tác vẫn
+# được đo lại khi đã lâu chưa đo
+MIN_RANK_VELOCITY = 1.0
+
+
+def refresh_priority(post, now):
+    """Lượng tương tác ước tính đã thay đổi kể từ lần đo gần nhất của post."""
+    measured_at = post.measured_at or post.created_at
+    stale_hours = max((now - measured_at).total_seconds() / 3600, 0)
+    return max(post.engagement_velocity, MIN_RANK_VELOCITY) * stale_hours
+
+
+def refresh_candidates(now=None, budget=None):
+    """
+    list[HotPost] cần đọc lại số liệu, ưu tiên cao nhất trước, tối đa `budget` bài
+    (mặc định HOT_POST_REFRESH_BUDGET). Bỏ qua bài vừa được đo trong
+    HOT_POST_REFRESH_MIN_INTERVAL_MINUTES phút và bài của page đang được quét
+    (lần quét đó sẽ đo lại bài).
+    """
+    now = now or timezone.now()
+    budget = getattr(settings, 'HOT_POST_REFRESH_BUDGET', 30) if budget is None else budget
+    max_age = timedelta(hours=getattr(settings, 'HOT_POST_REFRESH_MAX_AGE_HOURS', 48))
+    min_interval = timedelta(minutes=getattr(settings, 'HOT_POST_REFRESH_MIN_INTERVAL_MINUTES', 30))
+    if budget <= 0:
+        return []
+
+    posts = (
+        HotPost.objects.filter(posted_at__gte=now - max_age, posted_at__lte=now, page__user__isnull=False)
+        .filter(Q(measured_at__lte=now - min_interval) | Q(measured_at__isnull=True, created_at__lte=now - min_interval))
+        .exclude(page__scrape_status__in=ACTIVE_SCRAPE_STATUSES)
+        .select_related('page')
+        .only('id', 'post_url', 'posted_at', 'created_at', 'measured_at', 'engagement_velocity',
+              'page__id', 'page__user_id', 'page__name')
+    )
+    return sorted(posts, key=lambda post: refresh_priority(post, now), reverse=True)[:budget]
+
+
+def _queued_refresh_user_ids():
+    from background_task.models import Task
+
+    user_ids = set()
+    for task in Task.objects.filter(task_name=REFRESH_TASK_NAME):
+        try:
+            args, _kwargs = task.params()
+            user_ids.add(args[0])
+        except (ValueError, TypeError, IndexError):
+            continue
+    return user_ids
+
+
+def enqueue_refresh(now=None, budget=None, dry_run=False):
+    """
+    Đưa các bài được chọn vào hàng đợi làm mới, 1 task cho mỗi user. User còn
+    task làm mới chưa chạy xong thì bỏ qua lần này. Trả về dict thống kê
+    {'selected', 'enqueued': list[(user_id, list[HotPost])], 'skipped': list[(user_id, lý do)]}.
+    """
+    candidates = refresh_candidates(now, budget)
+    stats = {'selected': len(candidates), 'enqueued': [], 'skipped': []}
+    if not candidates:
+        return stats
+
+    by_user = {}
+    for post in candidates:
+        by_user.setdefault(post.page.user_id, []).append(post)
+
+    queued_users = _queued_refresh_user_ids()
+    live_users = set(FacebookAccount.objects.filter(status='live').values_list('user_id', flat=True))
+    for user_id, posts in by_user.items():
+        if user_id in queued_users:
+            stats['skipped'].append((user_id, 'đang có task làm mới trong hàng đợi'))
+            continue
+        if user_id not in live_users:
+            stats['skipped'].append((user_id, 'user không có tài khoản FB Live'))
+            continue
+        stats['enqueued'].append((user_id, posts))
+        if dry_run:
+            continue
+        refresh_post_metrics_task(user_id, [post.id for post in posts])
+        logger.info(f"Engagement refresh: queued {len(posts)} posts for user {user_id}.")
+
+    return stats
@@ -0,0 +1,188 @@
+"""
+Lịch Auto Scan cho ObservedPage. Mỗi page bật is_auto_scan quét vào
+auto_scan_time (hoặc các giờ mặc định HOT_POST_AUTO_SCAN_SLOTS), lệch thêm 1
+khoảng cố định theo page trong cửa sổ HOT_POST_AUTO_SCAN_SPREAD_MINUTES để các
+page cùng giờ không dồn vào worker cùng lúc. `run_auto_scan` gọi
+enqueue_due_pages() vài phút 1 lần: chỉ page đã tới hạn mới được đưa vào hàng
+đợi, và hàng đợi scrape không giữ quá HOT_POST_AUTO_SCAN_MAX_QUEUED task.
+
+Với HOT_POST_ADAPTIVE_SCAN, page không đặt auto_scan_time được quét theo
+scan_interval_minutes học từ tần suất đăng bài / tốc độ tăng tương tác của
+chính page (compute_scan_interval): page ít đăng bài quét thưa, page đăng
+nhiều quét dày hơn.
+"""
+import logging
+import zlib
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from automation.models import ObservedPage, FacebookAccount, HotPost
+from automation.tasks import (
+    scrape_page_background_task, close_page_jobs, ACTIVE_SCRAPE_STATUSES, SCRAPE_TASK_NAME, _task_page_id,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def default_scan_slots():
+    slots = getattr(settings, 'HOT_POST_AUTO_SCAN_SLOTS', ['00:00', '12:00'])
+    return [time.fromisoformat(slot) for slot in slots]
+
+
+def _spread_window():
+    return int(getattr(settings, 'HOT_POST_AUTO_SCAN_SPREAD_MINUTES', 60) * 60)
+
+
+def _spread_offset(page):
+    """Độ lệch cố định của page trong cửa sổ spread (không đổi giữa các lần chạy)."""
+    window = _spread_window()
+    if window <= 0:
+        return timedelta(0)
+    return timedelta(seconds=zlib.crc32(f'page:{page.id}'.encode()) % window)
+
+
+def _align_to_offset(run_at, page):
+    """
+    Thời điểm đầu tiên từ run_at trở đi có pha (theo chu kỳ cửa sổ spread) bằng
+    độ lệch của page. Không cộng dồn qua các lần quét, và các page được đưa vào
+    hàng đợi cùng lúc (bù sau thời gian ngừng) lại tách ra ở lần kế tiếp.
+    """
+    window = _spread_window()
+    if window <= 0:
+        return run_at
+    return run_at + timedelta(seconds=(_spread_offset(page).total_seconds() - run_at.timestamp()) % window)
+
+
+def is_adaptive(page):
+    return getattr(settings, 'HOT_POST_ADAPTIVE_SCAN', True) and page.auto_scan_time is None
+
+
+def scan_interval(page):
+    """Khoảng cách giữa 2 lần Auto Scan của page (timedelta) theo chế độ thích ứng."""
+    minutes = page.scan_interval_minutes or getattr(settings, 'HOT_POST_SCAN_INTERVAL_DEFAULT_MINUTES', 720)
+    return timedelta(minutes=minutes)
+
+
+def next_auto_scan_at(page, after=None):
+    """
+    Thời điểm Auto Scan kế tiếp của page, sau `after` (mặc định: lần gần nhất
+    được đưa vào hàng đợi, hoặc lúc tạo page). Đổi auto_scan_time có hiệu lực
+    ngay vì lịch luôn được tính lại từ cấu hình hiện tại.
+    """
+    after = after or page.last_auto_scan_at or page.created_at
+    if is_adaptive(page):
+        return _align_to_offset(after + scan_interval(page), page)
+    tz = timezone.get_current_timezone()
+    day = timezone.localtime(after, tz).date()
+    slots = [page.auto_scan_time] if page.auto_scan_time else default_scan_slots()
+    offset = _spread_offset(page)
+    # Hôm trước: giờ quét cuối ngày + độ lệch có thể rơi sang ngày của `after`
+    return min(
+        run_at
+        for delta in (-1, 0, 1)
+        for slot in slots
+        if (run_at := timezone.make_aware(datetime.combine(day + timedelta(days=delta), slot), tz) + offset) > after
+    )
+
+
+def compute_scan_interval(page, now=None):
+    """
+    Khoảng cách Auto Scan (phút) từ lịch sử HotPost của page trong
+    HOT_POST_SCAN_RATE_WINDOW_DAYS ngày gần nhất:
+      - tần suất đăng bài → thời gian để có thêm HOT_POST_SCAN_TARGET_NEW_POSTS bài mới
+      - tốc độ tăng tương tác của bài trong 48 giờ gần nhất → rút ngắn tối đa 1 nửa
+    Kết quả giới hạn trong [HOT_POST_SCAN_INTERVAL_MIN_MINUTES, ..._MAX_MINUTES].
+    """
+    now = now or timezone.now()
+    min_minutes = getattr(settings, 'HOT_POST_SCAN_INTERVAL_MIN_MINUTES', 60)
+    max_minutes = getattr(settings, 'HOT_POST_SCAN_INTERVAL_MAX_MINUTES', 1440)
+    window = timedelta(days=getattr(settings, 'HOT_POST_SCAN_RATE_WINDOW_DAYS', 7))
+    # Page mới thêm chưa đủ lịch sử cho cả cửa sổ; tối thiểu tính trên 1 ngày
+    observed = max(min(window, now - page.created_at), timedelta(days=1))
+
+    posts = list(
+        HotPost.objects.filter(page=page, posted_at__gte=now - observed, posted_at__lte=now)
+        .values_list('posted_at', 'total_engagement')
+    )
+    if not posts:
+        return max_minutes
+
+    posts_per_minute = len(posts) / (observed.total_seconds() / 60)
+    minutes = getattr(settings, 'HOT_POST_SCAN_TARGET_NEW_POSTS', 5) / posts_per_minute
+
+    # Tương tác / giờ của mỗi bài trẻ (tính từ lúc đăng tới lần quét gần nhất)
+    fresh = [(now - posted_at, engagement) for posted_at, engagement in posts if now - posted_at <= timedelta(hours=48)]
+    if fresh:
+        velocity = sum(engagement / max(age.total_seconds() / 3600, 1) for age, engagement in fresh) / len(fresh)
+        minutes /= 1 + min(velocity / getattr(settings, 'HOT_POST_SCAN_VELOCITY_REF', 200), 1)
+
+    return int(min(max(minutes, min_minutes), max_minutes))
+
+
+def update_scan_interval(page, now=None):
+    """Tính lại và lưu scan_interval_minutes (gọi sau mỗi lần quét xong)."""
+    page.scan_interval_minutes = compute_scan_interval(page, now)
+    ObservedPage.objects.filter(id=page.id).update(scan_interval_minutes=page.scan_interval_minutes)
+    return page.scan_interval_minutes
+
+
+def _queued_scrape_page_ids():
+    from background_task.models import Task
+
+    return {_task_page_id(task) for task in Task.objects.filter(task_name=SCRAPE_TASK_NAME)}
+
+
+def due_pages(now=None):
+    """list[(due_at, page)] các page Auto Scan đã tới hạn, hạn sớm nhất trước."""
+    now = now or timezone.now()
+    pages = ObservedPage.objects.filter(is_auto_scan=True, user__isnull=False)
+    due = [(next_auto_scan_at(page), page) for page in pages]
+    return sorted(((due_at, page) for due_at, page in due if due_at <= now), key=lambda item: item[0])
+
+
+def enqueue_due_pages(now=None, dry_run=False):
+    """
+    Đưa các page đã tới hạn vào hàng đợi (tối đa tới khi hàng đợi scrape có
+    HOT_POST_AUTO_SCAN_MAX_QUEUED task); page còn lại đợi lần gọi sau. Trả về
+    dict thống kê {'due', 'enqueued', 'skipped', 'reset'}.
+    """
+    now = now or timezone.now()
+    queued_ids = _queued_scrape_page_ids()
+    stats = {'due': 0, 'enqueued': [], 'skipped': [], 'reset': 0}
+
+    # Page báo queued / running nhưng không còn task nào trong hàng đợi → bị kẹt;
+    # ScrapeJob còn mở của page đó không còn ai ghi trạng thái cuối → đóng luôn
+    stuck = ObservedPage.objects.filter(scrape_status__in=ACTIVE_SCRAPE_STATUSES).exclude(id__in=queued_ids)
+    if not dry_run:
+        cancelling_ids = set(stuck.filter(scrape_status='cancelling').values_list('id', flat=True))
+        stuck_ids = set(stuck.values_list('id', flat=True))
+        close_page_jobs(cancelling_ids, 'cancelled')
+        close_page_jobs(stuck_ids - cancelling_ids, 'error', error_message='Scrape task disappeared from the queue.')
+        stats['reset'] = ObservedPage.objects.filter(id__in=stuck_ids).update(scrape_status='idle')
+
+    budget = getattr(settings, 'HOT_POST_AUTO_SCAN_MAX_QUEUED', 5) - len(queued_ids)
+    live_users = set(FacebookAccount.objects.filter(status='live').values_list('user_id', flat=True))
+
+    due = due_pages(now)
+    stats['due'] = len(due)
+    for due_at, page in due:
+        if page.id in queued_ids:
+            stats['skipped'].append((page, 'đang trong hàng đợi'))
+            continue
+        if page.user_id not in live_users:
+            stats['skipped'].append((page, 'user không có tài khoản FB Live'))
+            continue
+        if budget <= 0:
+            stats['skipped'].append((page, 'hàng đợi đầy, đợi lần sau'))
+            continue
+        budget -= 1
+        stats['enqueued'].append((page, due_at))
+        if dry_run:
+            continue
+        scrape_page_background_task(page.id, page.user_id)
+        ObservedPage.objects.filter(id=page.id).update(scrape_status='queued', last_auto_scan_at=now)
+        logger.info(f"Auto scan: queued {page.name} (due {timezone.localtime(due_at):%Y-%m-%d %H:%M}).")
+
+    return stats
@@ -0,0 +1,32 @@
+"""
+Báo thay đổi trạng thái ScrapeJob cho luồng SSE (api_scrape_events). Mỗi user
+có 1 số revision trong cache dùng chung giữa web và worker; worker tăng số này
+mỗi lần ghi ScrapeJob, luồng SSE chỉ truy vấn DB khi revision đổi. Nhiều
+dashboard mở cùng lúc chỉ đọc cache, không tạo tải DB khi job đứng yên.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+def _cache():
+    return caches[getattr(settings, 'HOT_POSTS_CACHE_ALIAS', 'default')]
+
+
+def _revision_key(user_id):
+    return f'scrapejobs:revision:{user_id}'
+
+
+def bump_scrape_revision(user_id):
+    """Gọi sau khi ghi ScrapeJob / scrape_status của user."""
+    cache = _cache()
+    try:
+        cache.incr(_revision_key(user_id))
+    except ValueError:
+        cache.set(_revision_key(user_id), time.time_ns(), timeout=None)
+
+
+async def aget_scrape_revision(user_id):
+    """Revision hiện tại (None nếu chưa có / đã bị evict)."""
+    return await _cache().aget(_revision_key(user_id))
@@ -0,0 +1,26 @@
+"""
+Làm mới cache api_get_posts (automation/post_cache.py) khi dữ liệu hiển thị
+thay đổi ngoài luồng scrape: sửa / xoá ObservedPage (tên page, xoá kèm
+HotPost) và xoá HotPost (admin, shell).
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from automation.models import HotPost, ObservedPage
+from automation.post_cache import bump_user_version
+
+
+@receiver(post_save, sender=ObservedPage)
+@receiver(post_delete, sender=ObservedPage)
+def _page_changed(sender, instance, **kwargs):
+    bump_user_version(instance.user_id)
+
+
+@receiver(post_delete, sender=HotPost)
+def _post_deleted(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, ObservedPage):
+        # Xoá kèm page → _page_changed đã tăng version
+        return
+    user_id = ObservedPage.objects.filter(pk=instance.page_id).values_list('user_id', flat=True).first()
+    if user_id is not None:
+        bump_user_version(user_id)
@@ -0,0 +1,184 @@
+"""
+Chuỗi số liệu tương tác theo thời gian của HotPost (EngagementSnapshot).
+upsert_hot_posts() ghi 1 snapshot cho mỗi bài ở mỗi lần quét / làm mới, trong
+cùng transaction với HotPost. Dung lượng được giới hạn bởi compact_snapshots():
+  - bài đăng chưa quá HOT_POST_SNAPSHOT_DENSE_HOURS giờ: giữ mọi điểm đo
+  - bài cũ hơn: mỗi khung HOT_POST_SNAPSHOT_SPARSE_BUCKET_HOURS giờ (tính từ lúc
+    đăng) chỉ giữ điểm đo cuối, cộng điểm đo đầu tiên của bài
+  - điểm đo cũ hơn HOT_POST_SNAPSHOT_RETENTION_DAYS ngày: xoá (HotPost vẫn giữ
+    số liệu mới nhất)
+Các hàm truy vấn chỉ đọc theo index (post, measured_at) / (page, measured_at),
+không quét cả bảng.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from automation.models import EngagementSnapshot, HotPost
+
+logger = logging.getLogger(__name__)
+
+
+# Số bài xử lý mỗi lượt khi thưa điểm đo / số id mỗi câu DELETE
+COMPACT_CHUNK_SIZE = 500
+
+# Thời điểm compact_snapshots_if_due() chạy lần gần nhất
+_COMPACTED_AT_KEY = 'snapshots:compacted_at'
+
+SNAPSHOT_FIELDS = ('measured_at', 'likes_count', 'comments_count', 'shares_count', 'total_engagement')
+
+
+def _cache():
+    return caches[getattr(settings, 'HOT_POSTS_CACHE_ALIAS', 'default')]
+
+
+def build_snapshots(posts):
+    """EngagementSnapshot cho các HotPost (đã có pk) vừa ghi, tại post.measured_at."""
+    return [
+        EngagementSnapshot(
+            post_id=post.pk, page_id=post.page_id, measured_at=post.measured_at,
+            likes_count=post.likes_count, comments_count=post.comments_count,
+            shares_count=post.shares_count, total_engagement=post.total_engagement,
+        )
+        for post in posts
+        if post.pk and post.measured_at
+    ]
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Truy vấn
+# ──────────────────────────────────────────────────────────────────────────────
+def post_series(post_id, since=None, until=None):
+    """Chuỗi điểm đo của 1 bài (cũ → mới): QuerySet dict các field SNAPSHOT_FIELDS."""
+    qs = EngagementSnapshot.objects.filter(post_id=post_id)
+    if since is not None:
+        qs = qs.filter(measured_at__gte=since)
+    if until is not None:
+        qs = qs.filter(measured_at__lte=until)
+    return qs.order_by('measured_at').values(*SNAPSHOT_FIELDS)
+
+
+def page_velocities(page_ids, hours=24, now=None):
+    """
+    Tốc độ tăng tương tác của từng page trong `hours` giờ gần nhất:
+    {page_id: {'posts', 'growth', 'velocity'}}. growth = tổng mức tăng
+    total_engagement của các bài có ít nhất 2 điểm đo trong cửa sổ,
+    velocity = growth / giờ. Page không có điểm đo nào trong cửa sổ không có mặt.
+    """
+    now = now or timezone.now()
+    rows = (
+        EngagementSnapshot.objects.filter(page_id__in=list(page_ids), measured_at__gte=now - timedelta(hours=hours),
+                                          measured_at__lte=now)
+        .values('page_id', 'post_id')
+        .annotate(low=Min('total_engagement'), high=Max('total_engagement'),
+                  first_at=Min('measured_at'), last_at=Max('measured_at'))
+    )
+    result = {}
+    for row in rows:
+        stats = result.setdefault(row['page_id'], {'posts': 0, 'growth': 0, 'velocity': 0.0})
+        if row['last_at'] > row['first_at']:
+            stats['posts'] += 1
+            stats['growth'] += row['high'] - row['low']
+    for stats in result.values():
+        stats['velocity'] = stats['growth'] / hours
+    return result
+
+
+def page_velocity(page_id, hours=24, now=None):
+    """Như page_velocities() cho 1 page (page chưa có điểm đo → tốc độ 0)."""
+    return page_velocities([page_id], hours, now).get(page_id, {'posts': 0, 'growth': 0, 'velocity': 0.0})
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Thưa điểm đo / xoá theo tuổi
+# ──────────────────────────────────────────────────────────────────────────────
+def _sparse_ids(snapshots, posted_at, bucket):
+    """Id các điểm đo thừa của 1 bài: mỗi khung `bucket` chỉ giữ điểm cuối, luôn giữ điểm đầu."""
+    keep = {snapshots[0][0]}
+    last_in_bucket = {}
+    for snapshot_id, measured_at in snapshots:
+        last_in_bucket[(measured_at - posted_at) // bucket] = snapshot_id
+    keep.update(last_in_bucket.values())
+    return [snapshot_id for snapshot_id, _ in snapshots if snapshot_id not in keep]
+
+
+def _delete_ids(ids):
+    deleted = 0
+    for start in range(0, len(ids), COMPACT_CHUNK_SIZE):
+        deleted += EngagementSnapshot.objects.filter(id__in=ids[start:start + COMPACT_CHUNK_SIZE]).delete()[0]
+    return deleted
+
+
+def _posts_to_compact(now, since, dense_cutoff, retention_cutoff):
+    """
+    Id các bài cần thưa điểm đo. since=None → mọi bài đã qua giai đoạn dày; ngược
+    lại chỉ bài vừa qua giai đoạn dày kể từ `since` và bài cũ có điểm đo mới
+    từ `since` (vd. quét `?refresh=1`).
+    """
+    old_posts = HotPost.objects.filter(posted_at__lt=dense_cutoff, posted_at__gte=retention_cutoff)
+    if since is None:
+        return set(old_posts.values_list('id', flat=True))
+    crossed = old_posts.filter(posted_at__gte=since - (now - dense_cutoff)).values_list('id', flat=True)
+    remeasured = (
+        EngagementSnapshot.objects.filter(measured_at__gte=since, post__posted_at__lt=dense_cutoff)
+        .values_list('post_id', flat=True).distinct()
+    )
+    return set(crossed) | set(remeasured)
+
+
+def compact_snapshots(now=None, since=None):
+    """
+    Áp dụng chính sách giữ điểm đo (xem đầu module). `since`: lần thưa trước;
+    None → duyệt lại mọi bài còn trong thời hạn giữ. Trả về dict
+    {'expired', 'downsampled', 'posts'}.
+    """
+    now = now or timezone.now()
+    dense_cutoff = now - timedelta(hours=getattr(settings, 'HOT_POST_SNAPSHOT_DENSE_HOURS', 48))
+    retention_cutoff = now - timedelta(days=getattr(settings, 'HOT_POST_SNAPSHOT_RETENTION_DAYS', 90))
+    bucket = timedelta(hours=getattr(settings, 'HOT_POST_SNAPSHOT_SPARSE_BUCKET_HOURS', 6))
+
+    expired = EngagementSnapshot.objects.filter(measured_at__lt=retention_cutoff).delete()[0]
+
+    post_ids = sorted(_posts_to_compact(now, since, dense_cutoff, retention_cutoff))
+    downsampled = 0
+    for start in range(0, len(post_ids), COMPACT_CHUNK_SIZE):
+        chunk = post_ids[start:start + COMPACT_CHUNK_SIZE]
+        posted = dict(HotPost.objects.filter(id__in=chunk).values_list('id', 'posted_at'))
+        by_post = {}
+        for snapshot_id, post_id, measured_at in (
+            EngagementSnapshot.objects.filter(post_id__in=chunk)
+            .order_by('post_id', 'measured_at').values_list('id', 'post_id', 'measured_at')
+        ):
+            by_post.setdefault(post_id, []).append((snapshot_id, measured_at))
+
+        extra = []
+        for post_id, snapshots in by_post.items():
+            extra.extend(_sparse_ids(snapshots, posted[post_id], bucket))
+        with transaction.atomic():
+            downsampled += _delete_ids(extra)
+
+    logger.info(
+        f"Snapshot compaction: {expired} expired, {downsampled} downsampled across {len(post_ids)} posts."
+    )
+    return {'expired': expired, 'downsampled': downsampled, 'posts': len(post_ids)}
+
+
+def compact_snapshots_if_due(now=None):
+    """
+    Gọi compact_snapshots() tối đa 1 lần / HOT_POST_SNAPSHOT_COMPACT_INTERVAL_HOURS
+    giờ (dùng trong `run_auto_scan`). Lần thưa trước lưu trong cache; mất mốc đó
+    thì duyệt lại toàn bộ. Trả về thống kê, hoặc None nếu chưa tới hạn.
+    """
+    now = now or timezone.now()
+    interval = timedelta(hours=getattr(settings, 'HOT_POST_SNAPSHOT_COMPACT_INTERVAL_HOURS', 24))
+    last = _cache().get(_COMPACTED_AT_KEY)
+    if last is not None and now - last < interval:
+        return None
+    stats = compact_snapshots(now, since=last)
+    _cache().set(_COMPACTED_AT_KEY, now, timeout=None)
+    return stats
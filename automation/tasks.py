@@ -1,10 +1,21 @@
 from background_task import background
-from automation.models import ObservedPage, FacebookAccount, HotPost
-from automation.core.hot_post_scraper import HotPostScraper
+from automation.models import ObservedPage, FacebookAccount, HotPost, ScrapeJob
+from automation.ingest import upsert_hot_posts
+from automation.post_cache import bump_user_version
+from automation.scrape_events import bump_scrape_revision
+from automation.core.hot_post_scraper import FALLBACK_TIME_RAW, HotPostScraper, canonical_post_id
+from automation.core.async_hot_post_scraper import AsyncHotPostScraper
+from automation.core.browser_pool import get_browser_pool
+from automation.core.request_policy import RequestBlockPolicy
+from automation.core.scrape_executor import iter_scrape_process, kill_process_tree, is_scrape_job_process
+from django.conf import settings
+from django.db import connection
 from django.utils import timezone
+import json
 import logging
+import os
 import threading
-import signal
+import time
 
 logger = logging.getLogger(__name__)
 
@@ -12,106 +23,494 @@ logger = logging.getLogger(__name__)
 SCRAPE_TIMEOUT_SECONDS = 600  # 10 phút
 
 
-class _TimeoutError(Exception):
-    pass
+# Số bài ghi xuống DB mỗi lần trong lúc scrape vẫn đang chạy
+SAVE_BATCH_SIZE = 5
 
+# Số id bài mới nhất giữ trong mốc quét (ObservedPage.watermark_post_ids)
+WATERMARK_SIZE = 20
 
-def _run_with_timeout(fn, timeout):
-    """Chạy fn() trong thread riêng với timeout. Raise _TimeoutError nếu quá hạn."""
-    result = [None]
-    exc = [None]
+# Khoảng cách tối thiểu giữa 2 lần đọc cờ huỷ của page từ DB (giây)
+CANCEL_POLL_SECONDS = 2
 
-    def target():
+# scrape_status còn đang xử lý (chưa được bắt đầu quét lại). 'cancelling': đã
+# yêu cầu huỷ, job đang dừng ở lần cuộn / bài kế tiếp và lưu các bài đã có.
+ACTIVE_SCRAPE_STATUSES = ('queued', 'running', 'cancelling')
+
+SCRAPE_TASK_NAME = 'automation.tasks.scrape_page_background_task'
+REFRESH_TASK_NAME = 'automation.tasks.refresh_post_metrics_task'
+
+# Ghi tiến độ ScrapeJob tối đa 1 lần / PROGRESS_WRITE_SECONDS giây, trừ khi
+# tiến độ đã tăng thêm ít nhất PROGRESS_WRITE_STEP %
+PROGRESS_WRITE_SECONDS = 2
+PROGRESS_WRITE_STEP = 10
+
+
+def _save_posts(page, posts):
+    """Lưu 1 lô kết quả scrape (bulk upsert theo post_url). Trả về số bài đã lưu."""
+    try:
+        counts = upsert_hot_posts(page, posts)
+    except Exception as e:
+        logger.error(f"Error saving hotposts to DB: {e}")
+        return 0
+    logger.info(f"Saved batch for {page.name}: {counts['inserted']} inserted, {counts['updated']} updated.")
+    if counts['inserted'] or counts['updated']:
+        # Trang kết quả đã cache của user không còn đúng
+        bump_user_version(page.user_id)
+    return counts['inserted'] + counts['updated']
+
+
+def _make_scraper(pooled=True, sync=False):
+    """
+    HOT_POST_SCRAPE_CONCURRENCY > 1 → engine async mở nhiều tab chi tiết song song
+    nhưng tự khởi chạy Chromium cho từng lần scrape (không có pool ấm, bỏ qua
+    HOT_POST_DUAL_TAB); ngược lại dùng engine sync với Chromium pool ấm
+    (pooled=False → engine sync tự khởi chạy Chromium cho từng lần scrape).
+    sync=True: luôn dùng engine sync (refresh_posts() chỉ có ở engine sync).
+    """
+    concurrency = getattr(settings, 'HOT_POST_SCRAPE_CONCURRENCY', 1)
+    options = dict(
+        headless=True,
+        block_policy=RequestBlockPolicy.from_settings(),
+        intercept_feed=getattr(settings, 'HOT_POST_INTERCEPT_FEED', False),
+        use_feed_cards=getattr(settings, 'HOT_POST_USE_FEED_CARDS', True),
+    )
+    if concurrency > 1 and not sync:
+        return AsyncHotPostScraper(concurrency=concurrency, **options)
+    return HotPostScraper(
+        pool=get_browser_pool() if pooled else None, dual_tab=getattr(settings, 'HOT_POST_DUAL_TAB', True), **options
+    )
+
+
+def page_cancel_check(page_id):
+    """
+    Trả về should_stop() cho scraper: True khi page đã được đánh dấu 'cancelling'
+    (hoặc 'cancelled' khi huỷ force).
+    Đọc DB tối đa 1 lần / CANCEL_POLL_SECONDS; có thể gọi từ thread scrape.
+    """
+    state = {'checked_at': None, 'cancelled': False}
+
+    def should_stop():
+        now = time.monotonic()
+        if state['cancelled'] or (state['checked_at'] is not None and now - state['checked_at'] < CANCEL_POLL_SECONDS):
+            return state['cancelled']
+        state['checked_at'] = now
         try:
-            result[0] = fn()
+            # 'cancelled' trong lúc job đang chạy: huỷ force (executor 'thread' không kill được)
+            state['cancelled'] = ObservedPage.objects.filter(
+                id=page_id, scrape_status__in=('cancelling', 'cancelled'),
+            ).exists()
         except Exception as e:
-            exc[0] = e
+            logger.debug(f"Cancel check failed for page_id={page_id}: {e}")
+        finally:
+            _close_thread_connection()
+        return state['cancelled']
+
+    return should_stop
+
+
+def _close_thread_connection():
+    # Thread scrape không được Django dọn connection khi kết thúc
+    if threading.current_thread() is not threading.main_thread():
+        connection.close()
+
+
+class JobProgress:
+    """
+    Ghi progress / results_count của 1 ScrapeJob có điều tiết (xem
+    PROGRESS_WRITE_SECONDS / PROGRESS_WRITE_STEP). update() có thể được gọi
+    liên tục từ progress_callback của scraper, kể cả trên thread scrape.
+    """
+
+    def __init__(self, job_id, user_id=None):
+        self.job_id = job_id
+        self.user_id = user_id
+        self.progress = 0
+        self.results_count = 0
+        self._written = (0, 0)
+        self._written_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def update(self, progress=None, results_count=None):
+        with self._lock:
+            if progress is not None:
+                self.progress = max(self.progress, min(100, int(progress)))
+            if results_count is not None:
+                self.results_count = results_count
+            if (self.progress, self.results_count) == self._written:
+                return
+            if (time.monotonic() - self._written_at < PROGRESS_WRITE_SECONDS
+                    and self.progress - self._written[0] < PROGRESS_WRITE_STEP):
+                return
+            try:
+                self._write()
+            except Exception as e:
+                logger.debug(f"Progress write failed for job {self.job_id}: {e}")
+            finally:
+                _close_thread_connection()
+
+    def finish(self, status, error_message=None):
+        with self._lock:
+            if status == 'completed':
+                self.progress = 100
+            self._write(status=status, error_message=error_message, finished_at=timezone.now())
+
+    def _write(self, **fields):
+        # update() không tự cập nhật auto_now
+        ScrapeJob.objects.filter(job_id=self.job_id).update(
+            progress=self.progress, results_count=self.results_count, updated_at=timezone.now(), **fields
+        )
+        self._written = (self.progress, self.results_count)
+        self._written_at = time.monotonic()
+        if self.user_id is not None:
+            bump_scrape_revision(self.user_id)
+
+
+def close_page_jobs(page_ids, status, error_message=None, statuses=('queued', 'running')):
+    """
+    Đóng các ScrapeJob còn ở `statuses` của page_ids khi không còn task nào tự
+    ghi trạng thái cuối cho chúng (task bị xoá, worker chết): status + finished_at.
+    Trả về số job đã đóng.
+    """
+    now = timezone.now()
+    jobs = ScrapeJob.objects.filter(page_id__in=list(page_ids), status__in=statuses)
+    user_ids = set(jobs.values_list('user_id', flat=True))
+    closed = jobs.update(status=status, error_message=error_message, finished_at=now, updated_at=now)
+    for user_id in user_ids - {None}:
+        bump_scrape_revision(user_id)
+    return closed
+
+
+def _start_job(page, user_id, job_id=None):
+    """
+    ScrapeJob cho lần chạy này: job đã tạo lúc đưa vào hàng đợi (api_start_scrape),
+    hoặc job mới nếu task được đưa vào từ nơi khác (auto scan, admin, task lặp lại).
+    """
+    now = timezone.now()
+    if job_id and ScrapeJob.objects.filter(job_id=job_id, status='queued').update(status='running', updated_at=now):
+        job = JobProgress(job_id, user_id)
+    else:
+        job = JobProgress(ScrapeJob.objects.create(user_id=user_id, page=page, status='running').job_id, user_id)
+    bump_scrape_revision(user_id)
+    return job
+
+
+def scrape_pid_file(page_id):
+    """File chứa pid process con đang scrape page_id (executor 'subprocess')."""
+    run_dir = getattr(settings, 'HOT_POST_RUN_DIR', os.path.join(settings.BASE_DIR, 'run'))
+    return os.path.join(run_dir, f'scrape-page-{page_id}.pid')
+
+
+def _scan_watermark(page):
+    """
+    (stop_ids, stop_before) cho lần quét nối tiếp: mốc của lần quét thành công
+    gần nhất. Page chưa có mốc (dữ liệu cũ) → lấy từ các HotPost mới nhất đã lưu.
+    """
+    if page.watermark_post_ids:
+        return list(page.watermark_post_ids), page.watermark_posted_at
+    rows = list(
+        HotPost.objects.filter(page=page).order_by('-posted_at')
+        .values_list('post_url', 'posted_at')[:WATERMARK_SIZE]
+    )
+    if not rows:
+        return None, None
+    return [canonical_post_id(url) for url, _ in rows], rows[0][1]
+
+
+def _advance_watermark(page, scraped):
+    """
+    Sau lần quét thành công: đưa id các bài vừa quét (list[(post_url, posted_at)])
+    lên đầu mốc quét, giữ WATERMARK_SIZE id mới nhất và giờ đăng mới nhất.
+    """
+    if not scraped:
+        return
+    newest_first = sorted(scraped, key=lambda item: item[1] or timezone.now(), reverse=True)
+    post_ids = []
+    for post_id in [canonical_post_id(url) for url, _ in newest_first] + list(page.watermark_post_ids or []):
+        if post_id and post_id not in post_ids:
+            post_ids.append(post_id)
+    times = [posted_at for _, posted_at in scraped if posted_at] + [page.watermark_posted_at]
+    posted_at = max((t for t in times if t), default=None)
 
-    t = threading.Thread(target=target, daemon=True)
-    t.start()
-    t.join(timeout)
-    if t.is_alive():
-        raise _TimeoutError(f"Scrape timed out after {timeout}s")
-    if exc[0]:
-        raise exc[0]
-    return result[0]
+    page.watermark_post_ids = post_ids[:WATERMARK_SIZE]
+    page.watermark_posted_at = posted_at
+    ObservedPage.objects.filter(id=page.id).update(
+        watermark_post_ids=page.watermark_post_ids, watermark_posted_at=posted_at,
+    )
+
+
+def _iter_scraped_posts(page, account_cookies, stop_urls, progress_callback=None, stop_before=None, outcome=None):
+    """
+    Yield từng bài của 1 lần scrape theo HOT_POST_SCRAPE_EXECUTOR:
+    'thread' (mặc định) – chạy trong worker (thread) với Chromium pool ấm, quá hạn chỉ bỏ thread lại;
+    'subprocess' – process con riêng (Chromium mới mỗi job), quá hạn / huỷ thì kill cả cây process.
+    outcome (dict, tuỳ chọn): sau bài cuối được ghi 'scan_complete' (scraper.last_scan_complete).
+    """
+    outcome = {} if outcome is None else outcome
+    job = dict(
+        page_id=page.id, account_cookies=account_cookies, page_url=page.url,
+        stop_urls=stop_urls, stop_before=stop_before, max_days=1.5, max_posts=50,
+    )
+    if getattr(settings, 'HOT_POST_SCRAPE_EXECUTOR', 'thread') == 'subprocess':
+        job['stop_before'] = stop_before.isoformat() if stop_before else None
+        return iter_scrape_process(
+            job, os.path.join(settings.BASE_DIR, 'manage.py'),
+            timeout=SCRAPE_TIMEOUT_SECONDS, pid_file=scrape_pid_file(page.id),
+            progress_callback=progress_callback,
+            on_done=lambda stats: outcome.update(scan_complete=bool(stats.get('scan_complete'))),
+        )
+    scraper = _make_scraper()
+    posts = scraper.scrape_page_iter(
+        job.pop('account_cookies'), job.pop('page_url'), timeout=SCRAPE_TIMEOUT_SECONDS,
+        progress_callback=progress_callback, should_stop=page_cancel_check(job.pop('page_id')), **job
+    )
+    return _record_outcome(posts, lambda: outcome.update(scan_complete=scraper.last_scan_complete))
+
+
+def _record_outcome(posts, record):
+    """Yield từ posts rồi gọi record() khi đã hết bài (scrape đã kết thúc)."""
+    yield from posts
+    record()
+
+
+def _iter_refreshed_posts(user_id, account_cookies, posts):
+    """
+    Yield từng bài đã đọc lại số liệu (posts: list[(post_url, posted_at)]),
+    cùng executor với _iter_scraped_posts() nhưng chỉ mở trang chi tiết bài.
+    """
+    if getattr(settings, 'HOT_POST_SCRAPE_EXECUTOR', 'thread') == 'subprocess':
+        job = dict(
+            account_cookies=account_cookies,
+            refresh_posts=[[url, posted_at.isoformat() if posted_at else None] for url, posted_at in posts],
+        )
+        return iter_scrape_process(
+            job, os.path.join(settings.BASE_DIR, 'manage.py'),
+            timeout=SCRAPE_TIMEOUT_SECONDS, pid_file=refresh_pid_file(user_id),
+        )
+    return _make_scraper(sync=True).refresh_posts_iter(account_cookies, posts, timeout=SCRAPE_TIMEOUT_SECONDS)
+
+
+def refresh_pid_file(user_id):
+    run_dir = getattr(settings, 'HOT_POST_RUN_DIR', os.path.join(settings.BASE_DIR, 'run'))
+    return os.path.join(run_dir, f'refresh-user-{user_id}.pid')
+
+
+def _task_page_id(task):
+    try:
+        args, _kwargs = json.loads(task.task_params)
+        return args[0]
+    except (ValueError, TypeError, IndexError):
+        return None
+
+
+def cancel_page_scrapes(page_ids, force=False):
+    """
+    Huỷ scrape của các page mà không ảnh hưởng worker, Chromium pool hay job
+    của page khác:
+      - task còn chờ (chưa bị worker khoá, hoặc worker khoá nó đã chết) → xoá
+        khỏi hàng đợi, page và ScrapeJob → 'cancelled'
+      - task đang chạy → page → 'cancelling'; job tự dừng ở lần cuộn / bài kế
+        tiếp (page_cancel_check), lưu các bài đã có rồi chuyển 'cancelled'
+        (ScrapeJob còn 'queued' của page đó được đóng ngay)
+    force=True: kill luôn cây process của job đang chạy (executor 'subprocess');
+    executor 'thread' không kill được nên job dừng ở lần cuộn / bài kế tiếp.
+    Trả về (số task đã xoá, số job đang chạy được yêu cầu dừng).
+    """
+    from background_task.models import Task
+
+    page_ids = set(page_ids)
+    removed = 0
+    running_ids = set()
+    for task in Task.objects.filter(task_name=SCRAPE_TASK_NAME):
+        page_id = _task_page_id(task)
+        if page_id not in page_ids:
+            continue
+        if task.locked_by and task.locked_by_pid_running():
+            running_ids.add(page_id)
+        else:
+            task.delete()
+            removed += 1
+
+    active = ObservedPage.objects.filter(id__in=page_ids, scrape_status__in=ACTIVE_SCRAPE_STATUSES)
+    user_ids = set(active.values_list('user_id', flat=True))
+    stopped_ids = page_ids if force else page_ids - running_ids
+    close_page_jobs(stopped_ids, 'cancelled')
+    # Job đang chạy tự ghi 'cancelled' khi dừng; job khác của page còn chờ thì không
+    close_page_jobs(page_ids - stopped_ids, 'cancelled', statuses=('queued',))
+    if force:
+        active.update(scrape_status='cancelled')
+    else:
+        active.filter(id__in=running_ids).update(scrape_status='cancelling')
+        # Không còn task nào đang chạy cho page (vd. worker đã chết) → không có ai để chờ
+        active.exclude(id__in=running_ids).update(scrape_status='cancelled')
+    for user_id in user_ids:
+        bump_scrape_revision(user_id)
+    if not force:
+        return removed, len(running_ids)
+
+    for page_id in page_ids:
+        try:
+            with open(scrape_pid_file(page_id)) as fh:
+                pid = int(fh.read().strip())
+        except (OSError, ValueError):
+            continue
+        if is_scrape_job_process(pid):
+            logger.info(f"Killing scrape job process tree {pid} (page_id={page_id}).")
+            kill_process_tree(pid)
+    return removed, len(running_ids)
+
+
+def _finish_page(page, status, job=None, error_message=None):
+    """Ghi trạng thái cuối của job; page đã bị yêu cầu huỷ thì luôn là 'cancelled'."""
+    current = ObservedPage.objects.filter(id=page.id).values_list('scrape_status', flat=True).first()
+    if current in ('cancelling', 'cancelled'):
+        status = 'cancelled'
+    page.scrape_status = status
+    fields = ['scrape_status']
+    if status == 'completed':
+        page.last_scraped_at = timezone.now()
+        fields.append('last_scraped_at')
+    page.save(update_fields=fields)
+    if job is not None:
+        job.finish(status, error_message=error_message if status == 'error' else None)
+    return status
 
 
 @background(schedule=0)
-def scrape_page_background_task(page_id, user_id):
+def scrape_page_background_task(page_id, user_id, job_id=None, refresh=False):
     """
     Background Task chạy bằng `python manage.py process_tasks`
     Tự động abort nếu quét quá SCRAPE_TIMEOUT_SECONDS giây.
+    job_id: ScrapeJob (status 'queued') tạo sẵn lúc đưa vào hàng đợi, nếu có.
+
+    Mặc định quét nối tiếp: dừng cuộn khi đi qua mốc quét lần trước nên chỉ lấy
+    bài mới. refresh=True: bỏ qua mốc, đi lại cả cửa sổ max_days để cập nhật số
+    liệu tương tác của các bài gần đây.
     """
     page = None
+    job = None
     try:
         page = ObservedPage.objects.get(id=page_id)
         account = FacebookAccount.objects.filter(user_id=user_id, status='live').first()
+        job = _start_job(page, user_id, job_id)
 
         if not account:
             logger.error(f"Cannot run job for Page {page.name}: User {user_id} has no live FB account.")
-            page.scrape_status = 'error'
-            page.save()
+            _finish_page(page, 'error', job, error_message='No live Facebook account.')
             return
 
-        page.scrape_status = 'running'
-        page.save()
+        # Page bị huỷ trong lúc task đã được worker nhận nhưng chưa chạy
+        if not ObservedPage.objects.filter(id=page.id).exclude(scrape_status='cancelling').update(scrape_status='running'):
+            _finish_page(page, 'cancelled', job)
+            logger.info(f"Scrape of {page.name} was cancelled before it started.")
+            return
 
         account_cookies = account.cookies
-        scraper = HotPostScraper(headless=True)
-
-        from datetime import timedelta
-        twenty_four_hours_ago = timezone.now() - timedelta(hours=24)
-        existing_urls = list(
-            HotPost.objects.filter(page=page, posted_at__lt=twenty_four_hours_ago)
-            .order_by('-posted_at')
-            .values_list('post_url', flat=True)[:100]
-        )
 
-        def do_scrape():
-            return scraper.scrape_page(
-                account_cookies, page.url,
-                stop_urls=existing_urls,
-                max_days=1.5,
-                max_posts=50
-            )
+        stop_ids, stop_before = (None, None) if refresh else _scan_watermark(page)
+        logger.info(
+            f"Scanning {page.name} ({'refresh' if refresh else 'incremental'}): "
+            f"{len(stop_ids or [])} known post ids, newest posted_at={stop_before}."
+        )
 
-        # ── Chạy với timeout tổng thể ────────────────────────────────────────
-        results = _run_with_timeout(do_scrape, SCRAPE_TIMEOUT_SECONDS)
+        # ── Lưu theo từng lô ngay khi có bài, với timeout tổng thể ───────────
+        # Quá hạn / bị huỷ / lỗi giữa chừng thì các lô đã lưu vẫn giữ lại
+        pending = []
+        scraped = []
+        saved = 0
+        outcome = {}
+        try:
+            for post in _iter_scraped_posts(
+                page, account_cookies, stop_ids, progress_callback=job.update, stop_before=stop_before,
+                outcome=outcome,
+            ):
+                # Giờ đăng "fallback" (= lúc scrape) không phải giờ thật → không dùng làm mốc
+                posted_at = None if post.get('time_raw') == FALLBACK_TIME_RAW else post.get('posted_at')
+                scraped.append((post.get('post_url'), posted_at))
+                pending.append(post)
+                if len(pending) >= SAVE_BATCH_SIZE:
+                    saved += _save_posts(page, pending)
+                    pending = []
+                    job.update(results_count=saved)
+        finally:
+            if pending:
+                saved += _save_posts(page, pending)
+            job.results_count = saved
+            logger.info(f"Saved {saved} posts for {page.name}.")
 
-        # Save results using update_or_create
-        for p in results:
+        status = _finish_page(page, 'completed', job)
+        logger.info(f"Background Task for {page.name} finished: {status}.")
+        if status == 'completed':
+            if outcome.get('scan_complete'):
+                # Chỉ dời mốc khi đã đi hết phần feed mới: lần quét bị huỷ, lỗi giữa
+                # chừng hay bị cắt bởi max_posts / MAX_SCROLLS có thể bỏ sót bài
+                _advance_watermark(page, scraped)
+            else:
+                logger.info(f"Scan of {page.name} did not cover the whole new feed, keeping the watermark.")
+            from automation.scheduler import update_scan_interval
             try:
-                HotPost.objects.update_or_create(
-                    post_url=p['post_url'],
-                    defaults={
-                        'page': page,
-                        'content_snippet': p.get('caption', ''),
-                        'posted_at': p['posted_at'],
-                        'likes_count': p['likes'],
-                        'comments_count': p['comments'],
-                        'shares_count': p['shares']
-                    }
-                )
+                minutes = update_scan_interval(page)
+                logger.info(f"Next auto scan interval for {page.name}: {minutes} min.")
             except Exception as e:
-                logger.error(f"Error saving hotpost to DB: {e}")
-
-        page.scrape_status = 'completed'
-        page.last_scraped_at = timezone.now()
-        page.save()
-        logger.info(f"Background Task for {page.name} completed successfully.")
+                logger.warning(f"Could not update scan interval for {page.name}: {e}")
 
-    except _TimeoutError as e:
+    except TimeoutError:
         logger.error(f"TIMEOUT: Task for page_id={page_id} exceeded {SCRAPE_TIMEOUT_SECONDS}s. Aborting.")
         if page:
-            page.scrape_status = 'error'
-            page.save()
+            _finish_page(page, 'error', job, error_message=f"Timed out after {SCRAPE_TIMEOUT_SECONDS}s.")
 
     except Exception as e:
         logger.error(f"Task Failed for page_id={page_id}: {e}")
         if page:
             try:
-                page.scrape_status = 'error'
-                page.save()
+                _finish_page(page, 'error', job, error_message=str(e))
             except Exception:
                 pass
+
+
+@background(schedule=0)
+def refresh_post_metrics_task(user_id, post_ids):
+    """
+    Đọc lại likes / comments / shares của các HotPost đã chọn (automation/refresh.py)
+    bằng cách mở thẳng link từng bài, không cuộn feed của page. Kết quả ghi qua
+    upsert_hot_posts() như lần quét thường (cập nhật measured_at / engagement_velocity).
+    """
+    account = FacebookAccount.objects.filter(user_id=user_id, status='live').first()
+    if not account:
+        logger.error(f"Cannot refresh posts: User {user_id} has no live FB account.")
+        return
+
+    posts = {
+        post.post_url: post
+        for post in HotPost.objects.filter(id__in=post_ids, page__user_id=user_id).select_related('page')
+    }
+    if not posts:
+        return
+    logger.info(f"Refreshing engagement of {len(posts)} posts for user {user_id}.")
+
+    pending = {}
+    saved = 0
+
+    def flush(page_id):
+        nonlocal saved
+        batch = pending.pop(page_id)
+        saved += _save_posts(batch[0], batch[1])
+
+    try:
+        for post in _iter_refreshed_posts(user_id, account.cookies, [(url, p.posted_at) for url, p in posts.items()]):
+            known = posts.get(post.get('post_url'))
+            if known is None:
+                continue
+            # Giờ đăng đã biết chính xác hơn giờ parse lại từ trang chi tiết
+            post['posted_at'] = known.posted_at
+            batch = pending.setdefault(known.page_id, (known.page, []))[1]
+            batch.append(post)
+            if len(batch) >= SAVE_BATCH_SIZE:
+                flush(known.page_id)
+    except TimeoutError:
+        logger.error(f"TIMEOUT: Refresh for user {user_id} exceeded {SCRAPE_TIMEOUT_SECONDS}s. Aborting.")
+    except Exception as e:
+        logger.error(f"Refresh Failed for user {user_id}: {e}")
+    finally:
+        for page_id in list(pending):
+            flush(page_id)
+        logger.info(f"Refreshed {saved}/{len(posts)} posts for user {user_id}.")
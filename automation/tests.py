@@ -1,3 +1,1176 @@
-from django.test import TestCase
+import asyncio
+import contextlib
+import io
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from unittest import mock
+from datetime import datetime, time as dt_time, timedelta, timezone as dt_timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connections
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from automation import tasks as automation_tasks
+from automation.core.async_hot_post_scraper import _report_progress
+from automation.core.browser_pool import ProfileDirLock, fcntl
+from automation.core.feed_payloads import FeedCapture, extract_posts, parse_payload_text
+from automation.core.hot_post_scraper import FALLBACK_TIME_RAW, HotPostScraper, _LinkCollector
+from automation.core.scrape_executor import iter_scrape_process
+from automation.core.request_policy import RequestStats
+from automation.ingest import _build_hot_post, upsert_hot_posts
+from automation.models import EngagementSnapshot, FacebookAccount, HotPost, ObservedPage, ScrapeJob
+from automation.post_cache import get_user_version
+from automation.scheduler import (
+    _spread_offset, compute_scan_interval, due_pages, enqueue_due_pages, next_auto_scan_at, update_scan_interval,
+)
+from automation.snapshots import _sparse_ids, compact_snapshots, page_velocities, page_velocity
+from automation.tasks import (
+    CANCEL_POLL_SECONDS, JobProgress, cancel_page_scrapes, page_cancel_check, scrape_page_background_task,
+)
+from automation.views import _build_posts_page
+
+
+class PopupSnapshotParseTests(SimpleTestCase):
+    """_parse_snapshot() trên dict snapshot (dạng trả về của POPUP_SNAPSHOT_JS), không cần trình duyệt."""
+
+    def setUp(self):
+        self.scraper = HotPostScraper()
+
+    def test_count_formats(self):
+        cases = {
+            '64': 64,
+            '1.200': 1200,
+            '1,2K': 1200,
+            '1.5M': 1_500_000,
+            '3 N': 3000,
+            '1,2 N': 1200,
+            '2 nghìn': 2000,
+            '1 triệu': 1_000_000,
+            '1,5 triệu': 1_500_000,
+            # Chữ cái đầu của từ thường không phải đơn vị
+            '3 người': 3,
+            '12 bình luận': 12,
+            '': 0,
+        }
+        for text, expected in cases.items():
+            with self.subTest(text=text):
+                self.assertEqual(self.scraper._parse_number(text), expected)
+
+    def test_full_snapshot(self):
+        post = self.scraper._parse_snapshot({
+            'utime': '1700000000',
+            'message': '  Nội dung bài viết  ',
+            'reactions': [{'text': '1,2K', 'label': ''}],
+            'full_text': 'Trang A\n1,2K   3 N bình luận   1 triệu lượt chia sẻ',
+        })
+        self.assertEqual(post['posted_at'], datetime.fromtimestamp(1700000000, tz=dt_timezone.utc))
+        self.assertEqual(post['time_raw'], '1700000000')
+        self.assertEqual(post['caption'], 'Nội dung bài viết')
+        self.assertEqual((post['likes'], post['comments'], post['shares']), (1200, 3000, 1_000_000))
+
+    def test_reaction_aria_label_fallback(self):
+        post = self.scraper._parse_snapshot({
+            'reactions': [
+                {'text': '', 'label': '2,3K người bày tỏ cảm xúc'},
+                {'text': '', 'label': ''},
+            ],
+        })
+        self.assertEqual(post['likes'], 2300)
+
+    def test_reaction_text_preferred_over_label(self):
+        post = self.scraper._parse_snapshot({
+            'reactions': [{'text': '15', 'label': '2,3K người bày tỏ cảm xúc'}],
+        })
+        self.assertEqual(post['likes'], 15)
+
+    def test_likes_from_full_text_without_reaction_nodes(self):
+        post = self.scraper._parse_snapshot({
+            'full_text': '😍❤️ 1,2K    64 bình luận   130 lượt chia sẻ',
+        })
+        self.assertEqual((post['likes'], post['comments'], post['shares']), (1200, 64, 130))
+
+    def test_missing_fields(self):
+        before = timezone.now()
+        for snapshot in ({}, None, {'reactions': None, 'time_texts': None, 'auto_texts': None}):
+            with self.subTest(snapshot=snapshot):
+                post = self.scraper._parse_snapshot(snapshot)
+                self.assertEqual((post['likes'], post['comments'], post['shares']), (0, 0, 0))
+                self.assertEqual(post['caption'], '')
+                # Không có thời gian → lấy giờ hiện tại
+                self.assertGreaterEqual(post['posted_at'], before)
+                self.assertTrue(post['time_raw'].startswith('Unknown'))
+
+    def test_invalid_utime_falls_back_to_time_texts(self):
+        before = timezone.now()
+        post = self.scraper._parse_snapshot({'utime': 'abc', 'time_texts': ['Thích', '3 giờ']})
+        self.assertEqual(post['time_raw'], '3 giờ')
+        self.assertAlmostEqual(post['posted_at'], before - timedelta(hours=3), delta=timedelta(minutes=1))
+
+    def test_known_posted_at_wins(self):
+        known = timezone.now() - timedelta(days=1)
+        post = self.scraper._parse_snapshot({'utime': '1700000000'}, known_posted_at=known)
+        self.assertEqual(post['posted_at'], known)
+
+    def test_caption_falls_back_to_longest_auto_text(self):
+        post = self.scraper._parse_snapshot({
+            'auto_texts': ['Viết bình luận công khai...', 'Bài viết ngắn', 'Đây là nội dung dài nhất'],
+        })
+        self.assertEqual(post['caption'], 'Đây là nội dung dài nhất')
+
+
+class _FakeResponse:
+    def __init__(self, resource_type, size):
+        self.headers = {'content-length': str(size)} if size is not None else {}
+        self.request = type('Request', (), {'resource_type': resource_type})()
+
+
+class RequestStatsTests(SimpleTestCase):
+    """RequestStats: đếm theo loại tài nguyên và ước tính byte tiết kiệm."""
+
+    def test_counts_by_type(self):
+        stats = RequestStats()
+        for resource_type, blocked in (('image', True), ('image', True), ('xhr', False), ('document', False)):
+            stats.on_route(resource_type, blocked)
+        summary = stats.summary()
+        self.assertEqual((summary['allowed'], summary['blocked']), (2, 2))
+        self.assertEqual(summary['blocked_by_type'], {'image': 2})
+        self.assertEqual(summary['allowed_by_type'], {'xhr': 1, 'document': 1})
+
+    def test_estimate_prefers_measured_average(self):
+        stats = RequestStats(bytes_estimate={'image': 30_000})
+        stats.on_route('image', False)
+        stats.on_route('image', False)
+        stats.on_response(_FakeResponse('image', 1000))
+        stats.on_response(_FakeResponse('image', 3000))
+        for _ in range(3):
+            stats.on_route('image', True)
+        summary = stats.summary()
+        self.assertEqual(summary['allowed_bytes'], 4000)
+        self.assertEqual(summary['blocked_bytes_estimate'], 3 * 2000)
+        self.assertEqual(summary['blocked_unestimated'], 0)
+
+    def test_estimate_falls_back_to_defaults(self):
+        stats = RequestStats(bytes_estimate={'media': 100_000})
+        stats.on_route('media', True)
+        stats.on_route('other', True)
+        # Response thiếu content-length không làm sai trung bình
+        stats.on_response(_FakeResponse('media', None))
+        summary = stats.summary()
+        self.assertEqual(summary['blocked_bytes_estimate'], 100_000)
+        self.assertEqual(summary['blocked_unestimated'], 1)
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Payload feed ghi sẵn (automation/test_data/feed_payloads)
+# ──────────────────────────────────────────────────────────────────────────────
+FEED_PAYLOAD_DIR = os.path.join(os.path.dirname(__file__), 'test_data', 'feed_payloads')
+
+
+def _read_payload(name):
+    with open(os.path.join(FEED_PAYLOAD_DIR, name), encoding='utf-8') as f:
+        return f.read()
+
+
+def _ts(seconds):
+    return datetime.fromtimestamp(seconds, tz=dt_timezone.utc)
+
+
+class FeedPayloadParseTests(SimpleTestCase):
+    """parse_payload_text() / extract_posts() trên body response đã ghi."""
+
+    def setUp(self):
+        self.parse_number = HotPostScraper()._parse_number
+
+    def _posts(self, text):
+        posts = {}
+        for obj in parse_payload_text(text):
+            for post in extract_posts(obj, self.parse_number):
+                posts.setdefault(post['post_id'], []).append(post)
+        return posts
+
+    def test_stream_prefix_and_multiple_objects(self):
+        objects = parse_payload_text(_read_payload('timeline_stream.txt'))
+        self.assertEqual(len(objects), 2)
+        self.assertEqual(objects[1]['label'], 'CometFeedStoryUFI$defer')
+
+    def test_multipart_body(self):
+        objects = parse_payload_text(_read_payload('multipart.txt'))
+        self.assertEqual(len(objects), 2)
+        posts = self._posts(_read_payload('multipart.txt'))
+        self.assertEqual(list(posts), ['3003'])
+        post = posts['3003'][0]
+        self.assertEqual(post['url'], 'https://www.facebook.com/permalink.php?story_fbid=3003&id=77')
+        self.assertEqual(post['posted_at'], _ts(1700003600))
+        self.assertEqual((post['caption'], post['likes'], post['comments'], post['shares']),
+                         ('Bài thứ hai', 7, 2, 1))
+
+    def test_garbage_and_empty(self):
+        self.assertEqual(parse_payload_text(''), [])
+        self.assertEqual(parse_payload_text(None), [])
+        self.assertEqual(parse_payload_text('<html>\n{"a": 1} rác\n42\n{"b": 2}'), [{'a': 1}, {'b': 2}])
+
+    def test_attached_story_not_merged_into_outer_post(self):
+        first = self._posts(_read_payload('timeline_stream.txt'))
+        outer = first['1001'][0]
+        self.assertEqual(outer['url'], 'https://www.facebook.com/pageA/posts/1001')
+        self.assertEqual(outer['posted_at'], _ts(1700000000))
+        self.assertEqual(outer['caption'], 'Bài viết chính của trang')
+        self.assertEqual(outer['likes'], 1200)
+        # Bình luận / share chỉ có ở bài được share → không được gán cho bài chính
+        self.assertIsNone(outer['shares'])
+        self.assertIsNone(outer['comments'])
+
+        shared = first['2002'][0]
+        self.assertEqual(shared['url'], 'https://www.facebook.com/pageB/posts/2002')
+        self.assertEqual((shared['likes'], shared['comments'], shared['shares']), (50000, 4000, 900))
+        self.assertEqual(shared['posted_at'], _ts(1690000000))
+
+    def test_deferred_part_fills_comments(self):
+        deferred = self._posts(_read_payload('timeline_stream.txt'))['1001'][1]
+        self.assertEqual(deferred['comments'], 64)
+        self.assertIsNone(deferred['likes'])
+
+
+class _PayloadHandler(BaseHTTPRequestHandler):
+    """Trả các file trong FEED_PAYLOAD_DIR: /api/graphql/<tên file>; / là trang gọi fetch() tới chúng."""
+
+    def do_GET(self):
+        if self.path == '/':
+            body = (
+                '<script>window.done = Promise.all(['
+                "fetch('/api/graphql/timeline_stream.txt'), fetch('/api/graphql/multipart.txt'),"
+                "fetch('/static/other.txt')]).then(() => true);</script>"
+            ).encode()
+            content_type = 'text/html'
+        elif self.path.startswith('/api/graphql/'):
+            body = _read_payload(os.path.basename(self.path)).encode('utf-8')
+            content_type = 'text/plain; charset=utf-8'
+        else:
+            body = b'{"post_id": "9999"}'
+            content_type = 'application/json'
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _UrllibResponse:
+    """Bọc response urllib theo giao diện FeedCapture dùng (url, request.resource_type, text())."""
+
+    def __init__(self, url):
+        self.url = url
+        self.request = type('Request', (), {'resource_type': 'fetch'})()
+        with urllib.request.urlopen(url, timeout=5) as resp:
+            self._body = resp.read().decode('utf-8')
+
+    def text(self):
+        return self._body
+
+
+class FeedCaptureTests(SimpleTestCase):
+    """FeedCapture nhận response thật từ HTTP server cục bộ."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), _PayloadHandler)
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+        cls.base_url = f'http://127.0.0.1:{cls.server.server_address[1]}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.scraper = HotPostScraper()
+
+    def _assert_captured(self, capture):
+        main = capture.lookup('https://www.facebook.com/pageA/posts/1001')
+        self.assertEqual((main['likes'], main['comments'], main['shares']), (1200, 64, None))
+        self.assertEqual(main['posted_at'], _ts(1700000000))
+        self.assertEqual(capture.lookup('https://www.facebook.com/pageB/posts/2002')['shares'], 900)
+        self.assertEqual(capture.lookup('https://www.facebook.com/permalink.php?story_fbid=3003&id=77')['likes'], 7)
+        # Response ngoài FEED_RESPONSE_PATTERN không được đọc
+        self.assertIsNone(capture.lookup('https://www.facebook.com/pageC/posts/9999'))
+        self.assertEqual(len(capture), 3)
+
+    def test_drain_from_local_server(self):
+        capture = FeedCapture(self.scraper)
+        for path in ('/api/graphql/timeline_stream.txt', '/api/graphql/multipart.txt', '/static/other.txt'):
+            capture.on_response(_UrllibResponse(self.base_url + path))
+        self.assertEqual(len(capture.pending), 2)
+        capture.drain()
+        self.assertEqual(capture.pending, [])
+        self.assertEqual(capture.responses_parsed, 2)
+        self._assert_captured(capture)
+
+    def test_playwright_page_responses(self):
+        try:
+            from playwright.sync_api import sync_playwright
+        except ImportError:
+            self.skipTest('playwright is not installed')
+        with sync_playwright() as p:
+            try:
+                browser = p.chromium.launch(headless=True)
+            except Exception as e:
+                self.skipTest(f'chromium is not available: {e}')
+            try:
+                page = browser.new_page()
+                capture = FeedCapture(self.scraper)
+                page.on('response', capture.on_response)
+                page.goto(self.base_url + '/')
+                page.evaluate('window.done')
+                capture.drain()
+            finally:
+                browser.close()
+        self._assert_captured(capture)
+
+
+class FeedCardTests(SimpleTestCase):
+    """Đọc số liệu từ thẻ feed: số đếm vắng mặt để None, thẻ chưa đủ được đọc lại khi chụp lại."""
+
+    URL = 'https://www.facebook.com/pageA/posts/1001'
+
+    def setUp(self):
+        self.scraper = HotPostScraper()
+
+    def _card(self, full_text='', reactions=None, has_actions=True, pending=False):
+        return {
+            'utime': '1700000000', 'has_actions': has_actions, 'message': 'Nội dung',
+            'reactions': reactions or [], 'full_text': full_text, 'pending': pending,
+        }
+
+    def test_absent_counts_stay_none(self):
+        post = self.scraper._parse_card(self._card(reactions=[{'text': '15', 'label': ''}]), self.URL)
+        self.assertEqual((post['likes'], post['comments'], post['shares']), (15, None, None))
+        post = self.scraper._parse_card(
+            self._card('15   3 bình luận   2 lượt chia sẻ', [{'text': '15', 'label': ''}]), self.URL,
+        )
+        self.assertEqual((post['likes'], post['comments'], post['shares']), (15, 3, 2))
+
+    def test_incomplete_card_is_none(self):
+        self.assertIsNone(self.scraper._parse_card(self._card(has_actions=False), self.URL))
+        self.assertIsNone(self.scraper._parse_card(self._card(), self.URL))
+
+    def test_dedupe_and_sort_tolerates_none(self):
+        results = [
+            {'post_url': 'a', 'caption': 'a', 'likes': 10, 'comments': None, 'shares': None},
+            {'post_url': 'b', 'caption': 'b', 'likes': 1, 'comments': 5, 'shares': 0},
+        ]
+        self.assertEqual([r['post_url'] for r in self.scraper._dedupe_and_sort(results)], ['b', 'a'])
+
+    def test_recheck_fills_incomplete_card(self):
+        collector = _LinkCollector(self.scraper)
+        collector.feed({
+            'links': [{'href': '/pageA/posts/1001?__cft__=x', 'text': '', 'card': 0}],
+            'cards': [self._card(has_actions=False, pending=True)],
+        })
+        self.assertIsNone(collector.card_posts[self.URL])
+        self.assertIn(self.URL, collector.pending_cards)
+
+        collector.feed({
+            'links': [{'href': '/pageA/posts/1001', 'text': '', 'card': 0, 'recheck': True}],
+            'cards': [self._card('1,2K   64 bình luận', [{'text': '1,2K', 'label': ''}])],
+        })
+        post = collector.card_posts[self.URL]
+        self.assertEqual((post['likes'], post['comments'], post['shares']), (1200, 64, None))
+        self.assertNotIn(self.URL, collector.pending_cards)
+        self.assertEqual(collector.links(10), [(self.URL, None, post)])
+
+    def test_recheck_ignores_unknown_and_complete_cards(self):
+        collector = _LinkCollector(self.scraper)
+        complete = self._card(reactions=[{'text': '15', 'label': ''}])
+        collector.feed({'links': [{'href': '/pageA/posts/1001', 'text': '', 'card': 0}], 'cards': [complete]})
+        first = collector.card_posts[self.URL]
+        collector.feed({
+            'links': [
+                {'href': '/pageA/posts/1001', 'text': '', 'card': 0, 'recheck': True},
+                {'href': '/pageB/posts/2002', 'text': '', 'card': 0, 'recheck': True},
+            ],
+            'cards': [self._card(reactions=[{'text': '99', 'label': ''}])],
+        })
+        self.assertIs(collector.card_posts[self.URL], first)
+        self.assertEqual(list(collector.post_links), [self.URL])
+
+    def test_upsert_keeps_stored_counts_for_none(self):
+        p = {'post_url': self.URL, 'posted_at': timezone.now(), 'likes': 20, 'comments': None, 'shares': None}
+        post = _build_hot_post(None, p, known_counts=(10, 7, 3))
+        self.assertEqual((post.likes_count, post.comments_count, post.shares_count), (20, 7, 3))
+        post = _build_hot_post(None, p)
+        self.assertEqual((post.likes_count, post.comments_count, post.shares_count), (20, 0, 0))
+
+
+class UpsertHotPostsTests(TestCase):
+    """upsert_hot_posts(): 1 lô INSERT ... ON CONFLICT, đếm bài mới / cập nhật, giữ số đã lưu khi thiếu."""
+
+    def setUp(self):
+        user = User.objects.create(username='ingest')
+        self.page = ObservedPage.objects.create(user=user, name='Trang A', url='https://www.facebook.com/a')
+        self.posted_at = timezone.now() - timedelta(hours=5)
+
+    def _post(self, post_id, likes=0, comments=0, shares=0, **fields):
+        return {'post_url': f'https://www.facebook.com/a/posts/{post_id}', 'caption': f'Bài {post_id}',
+                'posted_at': self.posted_at, 'likes': likes, 'comments': comments, 'shares': shares, **fields}
+
+    def _counts(self, post_id):
+        return HotPost.objects.values_list('likes_count', 'comments_count', 'shares_count', 'total_engagement').get(
+            post_url=f'https://www.facebook.com/a/posts/{post_id}'
+        )
+
+    def test_inserted_then_updated(self):
+        stats = upsert_hot_posts(self.page, [self._post(1, likes=10), self._post(2), self._post(3, posted_at=None)])
+        self.assertEqual(stats, {'inserted': 2, 'updated': 0, 'skipped': 1})
+        created_at = HotPost.objects.get(post_url__endswith='/1').created_at
+
+        # Trùng post_url trong cùng lô → chỉ tính (và ghi) bản sau cùng
+        stats = upsert_hot_posts(self.page, [self._post(1, likes=15), self._post(1, likes=20), self._post(4)])
+        self.assertEqual(stats, {'inserted': 1, 'updated': 1, 'skipped': 0})
+        self.assertEqual(HotPost.objects.count(), 3)
+        self.assertEqual(self._counts(1), (20, 0, 0, 20))
+        self.assertEqual(HotPost.objects.get(post_url__endswith='/1').created_at, created_at)
+        self.assertEqual(EngagementSnapshot.objects.filter(post__post_url__endswith='/1').count(), 2)
+
+    def test_none_counts_keep_stored_values(self):
+        upsert_hot_posts(self.page, [self._post(1, likes=10, comments=7, shares=3)])
+        self.assertEqual(self._counts(1), (10, 7, 3, 10 + 7 * 3 + 3 * 2))
+
+        upsert_hot_posts(self.page, [self._post(1, likes=20, comments=None, shares=None)])
+        self.assertEqual(self._counts(1), (20, 7, 3, 20 + 7 * 3 + 3 * 2))
+        # Bài mới chưa có số đã lưu → 0
+        upsert_hot_posts(self.page, [self._post(2, likes=5, comments=None, shares=None)])
+        self.assertEqual(self._counts(2), (5, 0, 0, 5))
+
+
+class RefreshPostsTests(SimpleTestCase):
+    """refresh_posts() bỏ qua bài không render được thay vì ghi đè số liệu bằng 0."""
+
+    URL = 'https://www.facebook.com/a/posts/1'
+
+    def _refresh(self, snapshot):
+        page = mock.MagicMock()
+        page.evaluate.return_value = snapshot
+        on_post = mock.Mock()
+        posted_at = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+        with mock.patch('automation.core.hot_post_scraper.PageWaiter'):
+            posts = HotPostScraper()._refresh_in_page(page, [(self.URL, posted_at)], on_post=on_post)
+        self.assertEqual(on_post.call_count, len(posts))
+        return posts
+
+    def test_empty_snapshot_skipped(self):
+        self.assertEqual(self._refresh({}), [])
+        # Tường đăng nhập: có text nhưng không có thanh hành động
+        self.assertEqual(self._refresh({'full_text': 'Đăng nhập để tiếp tục', 'has_actions': False}), [])
+
+    def test_rendered_post_refreshed(self):
+        posts = self._refresh({'has_actions': True, 'full_text': '1,2K 64 bình luận 130 lượt chia sẻ'})
+        self.assertEqual([(p['post_url'], p['likes'], p['comments'], p['shares']) for p in posts],
+                         [(self.URL, 1200, 64, 130)])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class PostCacheInvalidationTests(TestCase):
+    """Sửa / xoá page và xoá bài làm mới cache api_get_posts của user."""
+
+    def setUp(self):
+        self.user = User.objects.create(username='owner')
+        self.page = ObservedPage.objects.create(user=self.user, name='Trang A', url='https://www.facebook.com/a')
+        self.post = HotPost.objects.create(page=self.page, post_url='https://www.facebook.com/a/posts/1',
+                                           posted_at=timezone.now())
+
+    def _assert_bumped(self, action):
+        before = get_user_version(self.user.pk)
+        action()
+        self.assertGreater(get_user_version(self.user.pk), before)
+
+    def test_page_save_bumps_version(self):
+        self.page.name = 'Trang B'
+        self._assert_bumped(self.page.save)
+
+    def test_post_delete_bumps_version(self):
+        self._assert_bumped(self.post.delete)
+
+    def test_page_delete_bumps_version(self):
+        self._assert_bumped(self.page.delete)
+        self.assertFalse(HotPost.objects.exists())
+
+
+class ProfileDirLockTests(SimpleTestCase):
+    """Mỗi Chromium chạy song song được 1 thư mục profile riêng."""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.base = os.path.join(tmp.name, 'fb_browser_profile')
+
+    def test_concurrent_leases_get_distinct_dirs(self):
+        with ProfileDirLock(self.base) as first, ProfileDirLock(self.base) as second:
+            self.assertEqual(first, self.base)
+            self.assertEqual(second, self.base + '-1')
+        # Đã nhả → profile gốc được dùng lại
+        with ProfileDirLock(self.base) as again:
+            self.assertEqual(again, self.base)
+
+    def test_release_is_idempotent(self):
+        lock = ProfileDirLock(self.base)
+        lock.acquire()
+        lock.release()
+        lock.release()
+        self.assertIsNone(lock.path)
+
+    def test_lock_held_by_other_process(self):
+        if fcntl is None:
+            self.skipTest('fcntl is not available')
+        holder = subprocess.Popen(
+            [sys.executable, '-c',
+             'import fcntl, os, sys; fd = os.open(sys.argv[1] + ".lock", os.O_RDWR | os.O_CREAT); '
+             'fcntl.flock(fd, fcntl.LOCK_EX); print("locked", flush=True); sys.stdin.read()',
+             self.base],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True,
+        )
+        self.addCleanup(holder.wait)
+        self.addCleanup(holder.stdin.close)
+        self.assertEqual(holder.stdout.readline().strip(), 'locked')
+        with ProfileDirLock(self.base) as path:
+            self.assertEqual(path, self.base + '-1')
+
+
+class PostsPaginationTests(TestCase):
+    """Phân trang keyset của api_get_posts: đủ mọi bài, dòng posted_date NULL ở cuối."""
+
+    def setUp(self):
+        self.user = User.objects.create(username='reader')
+        page = ObservedPage.objects.create(user=self.user, name='Trang A', url='https://www.facebook.com/a')
+        now = timezone.now()
+        for i in range(30):
+            HotPost.objects.create(page=page, post_url=f'https://www.facebook.com/a/posts/{i}',
+                                   posted_at=now - timedelta(hours=i * 5), likes_count=i % 7)
+        self.null_urls = {f'https://www.facebook.com/a/posts/{i}' for i in (3, 17, 29)}
+        HotPost.objects.filter(post_url__in=self.null_urls).update(posted_date=None)
+
+    def _walk(self, sort_key):
+        urls, cursor = [], None
+        while True:
+            page = _build_posts_page(self.user, sort_key, cursor)
+            urls += [r['post_url'] for r in page['results']]
+            if not page['has_next']:
+                return urls
+            cursor = page['next_cursor']
+
+    def test_every_post_once_with_nulls_last(self):
+        for sort_key in ('total_engagement', 'posted_at'):
+            with self.subTest(sort_key=sort_key):
+                urls = self._walk(sort_key)
+                self.assertEqual(len(urls), 30)
+                self.assertEqual(len(set(urls)), 30)
+                self.assertEqual(set(urls[-3:]), self.null_urls)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ScrapeJobLifecycleTests(TestCase):
+    """ScrapeJob luôn được đóng (trạng thái cuối + finished_at) khi page bị huỷ / reset."""
+
+    def setUp(self):
+        from background_task.models import Task
+
+        self.Task = Task
+        self.user = User.objects.create(username='scraper')
+        self.page = ObservedPage.objects.create(user=self.user, name='Trang A', url='https://www.facebook.com/a',
+                                                scrape_status='running')
+
+    def _task(self, locked_by=None):
+        scrape_page_background_task(self.page.id, self.user.id)
+        task = self.Task.objects.latest('id')
+        if locked_by:
+            self.Task.objects.filter(id=task.id).update(locked_by=locked_by, locked_at=timezone.now())
+        return task
+
+    def _job(self, status):
+        return ScrapeJob.objects.create(user=self.user, page=self.page, status=status)
+
+    def _assert_closed(self, job, status):
+        job.refresh_from_db()
+        self.assertEqual(job.status, status)
+        self.assertIsNotNone(job.finished_at)
+
+    def test_finish_records_finished_at(self):
+        job = self._job('running')
+        JobProgress(job.job_id, self.user.id).finish('completed')
+        self._assert_closed(job, 'completed')
+        self.assertEqual(job.progress, 100)
+
+    def test_cancel_queued_task(self):
+        self.page.scrape_status = 'queued'
+        self.page.save()
+        self._task()
+        job = self._job('queued')
+        self.assertEqual(cancel_page_scrapes([self.page.id]), (1, 0))
+        self._assert_closed(job, 'cancelled')
+        self.assertFalse(self.Task.objects.exists())
+
+    def test_cancel_task_locked_by_dead_worker(self):
+        self._task(locked_by='999999999')
+        job = self._job('running')
+        self.assertEqual(cancel_page_scrapes([self.page.id]), (1, 0))
+        self._assert_closed(job, 'cancelled')
+        self.page.refresh_from_db()
+        self.assertEqual(self.page.scrape_status, 'cancelled')
+
+    def test_cancel_running_task_closes_only_queued_jobs(self):
+        self._task(locked_by=str(os.getpid()))
+        running = self._job('running')
+        queued = self._job('queued')
+        self.assertEqual(cancel_page_scrapes([self.page.id]), (0, 1))
+        running.refresh_from_db()
+        self.assertEqual(running.status, 'running')
+        self._assert_closed(queued, 'cancelled')
+        self.page.refresh_from_db()
+        self.assertEqual(self.page.scrape_status, 'cancelling')
+
+    def test_stuck_reset_closes_jobs(self):
+        running = self._job('running')
+        other = ObservedPage.objects.create(user=self.user, name='Trang B', url='https://www.facebook.com/b',
+                                            scrape_status='cancelling')
+        cancelling = ScrapeJob.objects.create(user=self.user, page=other, status='running')
+        stats = enqueue_due_pages()
+        self.assertEqual(stats['reset'], 2)
+        self._assert_closed(running, 'error')
+        self._assert_closed(cancelling, 'cancelled')
+        self.assertEqual(
+            set(ObservedPage.objects.values_list('scrape_status', flat=True)), {'idle'},
+        )
+
+
+@override_settings(HOT_POST_ADAPTIVE_SCAN=True, HOT_POST_AUTO_SCAN_SPREAD_MINUTES=60, TIME_ZONE='UTC',
+                   HOT_POST_AUTO_SCAN_SLOTS=['00:00', '12:00'])
+class AutoScanScheduleTests(SimpleTestCase):
+    """next_auto_scan_at(): giờ quét cố định / thích ứng, luôn lệch theo page."""
+
+    AFTER = datetime(2024, 1, 1, 3, 0, tzinfo=dt_timezone.utc)
+
+    def _page(self, page_id, **fields):
+        return ObservedPage(id=page_id, created_at=self.AFTER, **fields)
+
+    def _at(self, day, hour, minute=0):
+        return datetime(2024, 1, day, hour, minute, tzinfo=dt_timezone.utc)
+
+    def test_fixed_slot(self):
+        page = self._page(1, auto_scan_time=dt_time(8, 0))
+        offset = _spread_offset(page)
+        self.assertLess(offset, timedelta(hours=1))
+        self.assertEqual(next_auto_scan_at(page, self.AFTER), self._at(1, 8) + offset)
+        self.assertEqual(next_auto_scan_at(page, self._at(1, 8) + offset), self._at(2, 8) + offset)
+
+    def test_default_slots(self):
+        page = self._page(2)
+        offset = _spread_offset(page)
+        with self.settings(HOT_POST_ADAPTIVE_SCAN=False):
+            self.assertEqual(next_auto_scan_at(page, self.AFTER), self._at(1, 12) + offset)
+            self.assertEqual(next_auto_scan_at(page, self._at(1, 12) + offset), self._at(2, 0) + offset)
+
+    @override_settings(HOT_POST_AUTO_SCAN_SLOTS=['23:30'], HOT_POST_ADAPTIVE_SCAN=False)
+    def test_previous_day_slot_spills_over_midnight(self):
+        for page_id in range(1, 21):
+            page = self._page(page_id)
+            offset = _spread_offset(page)
+            # 23:30 hôm trước + độ lệch > 30 phút rơi sang sau 00:00 của ngày `after`
+            expected = self._at(1, 23, 30) + offset
+            if expected <= self._at(2, 0):
+                expected += timedelta(days=1)
+            with self.subTest(page_id=page_id):
+                self.assertEqual(next_auto_scan_at(page, self._at(2, 0)), expected)
+
+    def test_adaptive_spread_offset(self):
+        run_ats = set()
+        for page_id in (1, 2, 3):
+            page = self._page(page_id, scan_interval_minutes=120)
+            run_at = next_auto_scan_at(page, self.AFTER)
+            run_ats.add(run_at)
+            self.assertGreaterEqual(run_at, self.AFTER + timedelta(minutes=120))
+            self.assertLess(run_at, self.AFTER + timedelta(minutes=180))
+            self.assertEqual(run_at.timestamp() % 3600, _spread_offset(page).total_seconds())
+            # Quét đúng hẹn → lần sau đúng 1 chu kỳ sau, độ lệch không cộng dồn
+            self.assertEqual(next_auto_scan_at(page, run_at), run_at + timedelta(minutes=120))
+        # Các page quét cùng lúc (vd. bù sau thời gian ngừng) tách ra ở lần kế tiếp
+        self.assertEqual(len(run_ats), 3)
+
+
+@override_settings(HOT_POST_ADAPTIVE_SCAN=True, HOT_POST_SCAN_INTERVAL_DEFAULT_MINUTES=720,
+                   HOT_POST_AUTO_SCAN_MAX_QUEUED=2)
+class AutoScanEnqueueTests(TestCase):
+    """enqueue_due_pages(): bù 1 lần sau thời gian ngừng và giới hạn hàng đợi mỗi lượt."""
+
+    def setUp(self):
+        from background_task.models import Task
+
+        self.Task = Task
+        self.user = User.objects.create(username='scheduler')
+        FacebookAccount.objects.create(user=self.user, name='acc', cookies='[]', status='live')
+        self.now = timezone.now()
+
+    def _page(self, name, days_since_scan, **fields):
+        return ObservedPage.objects.create(
+            user=self.user, name=name, url=f'https://www.facebook.com/{name}', is_auto_scan=True,
+            last_auto_scan_at=self.now - timedelta(days=days_since_scan), **fields,
+        )
+
+    def test_catch_up_after_downtime(self):
+        # Ngừng 3 ngày: bỏ lỡ 3 giờ quét nhưng chỉ được đưa vào hàng đợi 1 lần
+        page = self._page('a', 3, auto_scan_time=dt_time(8, 0))
+        stats = enqueue_due_pages(self.now)
+        self.assertEqual([p.id for p, _ in stats['enqueued']], [page.id])
+        self.assertEqual(self.Task.objects.count(), 1)
+        page.refresh_from_db()
+        self.assertEqual(page.scrape_status, 'queued')
+        self.assertEqual(page.last_auto_scan_at, self.now)
+        self.assertGreater(next_auto_scan_at(page), self.now)
+        self.assertEqual(due_pages(self.now), [])
+        self.assertEqual(enqueue_due_pages(self.now)['enqueued'], [])
+
+    def test_queue_budget(self):
+        busy = ObservedPage.objects.create(user=self.user, name='busy', url='https://www.facebook.com/busy',
+                                           scrape_status='queued')
+        scrape_page_background_task(busy.id, self.user.id)
+        pages = [self._page(f'p{i}', 2 + i) for i in range(4)]
+
+        stats = enqueue_due_pages(self.now)
+        self.assertEqual(stats['due'], 4)
+        # Hàng đợi còn 1 chỗ → page quá hạn lâu nhất được ưu tiên
+        self.assertEqual([p.id for p, _ in stats['enqueued']], [pages[-1].id])
+        self.assertEqual([reason for _, reason in stats['skipped']], ['hàng đợi đầy, đợi lần sau'] * 3)
+        self.assertEqual(self.Task.objects.count(), 2)
+
+        # Lượt sau: hàng đợi vẫn đầy
+        stats = enqueue_due_pages(self.now)
+        self.assertEqual(stats['enqueued'], [])
+        self.assertEqual(self.Task.objects.count(), 2)
+
+
+@override_settings(HOT_POST_SCAN_INTERVAL_MIN_MINUTES=60, HOT_POST_SCAN_INTERVAL_MAX_MINUTES=1440,
+                   HOT_POST_SCAN_TARGET_NEW_POSTS=5, HOT_POST_SCAN_RATE_WINDOW_DAYS=7, HOT_POST_SCAN_VELOCITY_REF=200)
+class ScanIntervalTests(TestCase):
+    """compute_scan_interval(): khoảng quét theo tần suất đăng / tốc độ tương tác, kẹp trong [MIN, MAX]."""
+
+    def setUp(self):
+        self.now = timezone.now()
+        user = User.objects.create(username='interval')
+        self.page = ObservedPage.objects.create(user=user, name='Trang A', url='https://www.facebook.com/a')
+        ObservedPage.objects.filter(id=self.page.id).update(created_at=self.now - timedelta(days=30))
+        self.page.refresh_from_db()
+
+    def _posts(self, count, age=timedelta(days=3), engagement=0):
+        HotPost.objects.bulk_create(
+            HotPost(page=self.page, post_url=f'https://www.facebook.com/a/posts/{age.total_seconds()}-{i}',
+                    posted_at=self.now - age, total_engagement=engagement)
+            for i in range(count)
+        )
+
+    def test_no_posts_uses_max(self):
+        self.assertEqual(compute_scan_interval(self.page, self.now), 1440)
+
+    def test_posting_rate(self):
+        # 100 bài / 7 ngày → 5 bài mới sau 7 * 24 * 60 * 5 / 100 = 504 phút
+        self._posts(100)
+        self.assertEqual(compute_scan_interval(self.page, self.now), 504)
+
+    def test_fresh_engagement_halves_interval_at_most(self):
+        self._posts(50)
+        self._posts(50, age=timedelta(hours=2), engagement=100_000)
+        self.assertEqual(compute_scan_interval(self.page, self.now), 252)
+
+    def test_clamped_to_min_and_max(self):
+        self._posts(1)
+        self.assertEqual(compute_scan_interval(self.page, self.now), 1440)
+        self._posts(1000, age=timedelta(days=4))
+        self.assertEqual(compute_scan_interval(self.page, self.now), 60)
+
+    def test_update_persists(self):
+        self._posts(100)
+        self.assertEqual(update_scan_interval(self.page, self.now), 504)
+        self.assertEqual(ObservedPage.objects.get(id=self.page.id).scan_interval_minutes, 504)
+
+
+@override_settings(HOT_POST_SNAPSHOT_DENSE_HOURS=48, HOT_POST_SNAPSHOT_RETENTION_DAYS=90,
+                   HOT_POST_SNAPSHOT_SPARSE_BUCKET_HOURS=6)
+class EngagementSnapshotTests(TestCase):
+    """Thưa / xoá điểm đo theo tuổi (compact_snapshots) và tốc độ tương tác theo page."""
+
+    def setUp(self):
+        self.now = timezone.now().replace(microsecond=0)
+        user = User.objects.create(username='snapshots')
+        self.page = ObservedPage.objects.create(user=user, name='Trang A', url='https://www.facebook.com/a')
+
+    def _post(self, name, posted_ago, page=None):
+        return HotPost.objects.create(page=page or self.page, post_url=f'https://www.facebook.com/a/posts/{name}',
+                                      posted_at=self.now - posted_ago)
+
+    def _measure(self, post, *hours_after_post, engagement=0):
+        for hours in hours_after_post:
+            EngagementSnapshot.objects.create(post=post, page_id=post.page_id,
+                                              measured_at=post.posted_at + timedelta(hours=hours),
+                                              total_engagement=engagement)
+
+    def _hours_kept(self, post):
+        return [
+            (measured_at - post.posted_at) / timedelta(hours=1)
+            for measured_at in post.snapshots.order_by('measured_at').values_list('measured_at', flat=True)
+        ]
+
+    def test_sparse_ids_keeps_first_and_last_per_bucket(self):
+        posted_at = self.now
+        snapshots = [(i, posted_at + timedelta(hours=h)) for i, h in enumerate([1, 2, 5, 7, 11, 13], start=1)]
+        # Khung 0-6h: giữ điểm đầu (1) và điểm cuối (3); 6-12h: 5; 12-18h: 6
+        self.assertEqual(_sparse_ids(snapshots, posted_at, timedelta(hours=6)), [2, 4])
+
+    def test_compact_downsamples_old_posts_only(self):
+        old = self._post('old', timedelta(days=5))
+        self._measure(old, *range(0, 24, 2))
+        fresh = self._post('fresh', timedelta(hours=10))
+        self._measure(fresh, 1, 2, 3)
+
+        stats = compact_snapshots(self.now)
+        self.assertEqual(stats, {'expired': 0, 'downsampled': 7, 'posts': 1})
+        self.assertEqual(self._hours_kept(old), [0, 4, 10, 16, 22])
+        self.assertEqual(self._hours_kept(fresh), [1, 2, 3])
+
+    def test_compact_expires_past_retention(self):
+        post = self._post('ancient', timedelta(days=100))
+        self._measure(post, 0, 24 * 9, 24 * 20)
+
+        stats = compact_snapshots(self.now)
+        self.assertEqual(stats['expired'], 2)
+        self.assertEqual(self._hours_kept(post), [24 * 20])
+        # HotPost vẫn giữ số liệu mới nhất
+        self.assertTrue(HotPost.objects.filter(id=post.id).exists())
+
+    def test_compact_since_selects_changed_posts(self):
+        since = self.now - timedelta(hours=24)
+        untouched = self._post('untouched', timedelta(days=5))
+        self._measure(untouched, 1, 2, 3)
+        crossed = self._post('crossed', timedelta(hours=60))
+        self._measure(crossed, 1, 2, 3)
+        remeasured = self._post('remeasured', timedelta(days=5))
+        self._measure(remeasured, 1, 2, 3, 24 * 5 - 1)
+
+        stats = compact_snapshots(self.now, since=since)
+        self.assertEqual(stats['posts'], 2)
+        self.assertEqual(self._hours_kept(untouched), [1, 2, 3])
+        self.assertEqual(self._hours_kept(crossed), [1, 3])
+        self.assertEqual(self._hours_kept(remeasured), [1, 3, 24 * 5 - 1])
+
+    def test_page_velocities(self):
+        growing = self._post('growing', timedelta(hours=30))
+        self._measure(growing, 10, engagement=100)
+        self._measure(growing, 20, engagement=340)
+        single = self._post('single', timedelta(hours=30))
+        self._measure(single, 20, engagement=1000)
+        # Điểm đo ngoài cửa sổ 24 giờ không được tính
+        stale = self._post('stale', timedelta(hours=30))
+        self._measure(stale, 1, engagement=0)
+        self._measure(stale, 20, engagement=500)
+        other = ObservedPage.objects.create(user=self.page.user, name='Trang B', url='https://www.facebook.com/b')
+
+        velocities = page_velocities([self.page.id, other.id], hours=24, now=self.now)
+        self.assertEqual(velocities, {self.page.id: {'posts': 1, 'growth': 240, 'velocity': 10.0}})
+        self.assertEqual(page_velocity(other.id, now=self.now), {'posts': 0, 'growth': 0, 'velocity': 0.0})
+
+
+@contextlib.contextmanager
+def _file_sqlite(path):
+    """Trỏ alias 'default' (mọi thread) sang file SQLite `path` đã migrate, dùng đúng OPTIONS của settings."""
+    original = connections['default']
+    with mock.patch.dict(connections.settings['default'], NAME=path):
+        connections['default'] = connections.create_connection('default')
+        try:
+            call_command('migrate', verbosity=0, interactive=False)
+            yield
+        finally:
+            connections['default'].close()
+            connections['default'] = original
+
+
+class SqliteStressTests(TransactionTestCase):
+    """sqlite_stress: đọc / ghi song song trên SQLite file (WAL + busy timeout) không bị "database is locked"."""
+
+    def test_no_locked_errors(self):
+        if connections['default'].vendor != 'sqlite':
+            self.skipTest('SQLite only')
+        with tempfile.TemporaryDirectory() as tmp, _file_sqlite(os.path.join(tmp, 'stress.sqlite3')):
+            out = io.StringIO()
+            call_command('sqlite_stress', readers=3, writers=2, seconds=1, batch=20, stdout=out)
+        output = out.getvalue()
+        self.assertIn('journal_mode=wal', output)
+        counts = re.findall(r'^(\w+): (\d+) ok, (\d+) locked, (\d+) errors', output, re.MULTILINE)
+        self.assertEqual([kind for kind, *_ in counts], ['read', 'write'], output)
+        for kind, ok, locked, errors in counts:
+            self.assertGreater(int(ok), 0, output)
+            self.assertEqual((int(locked), int(errors)), (0, 0), output)
+
+
+class PageCancelCheckTests(TestCase):
+    """page_cancel_check(): đọc cờ huỷ tối đa 1 lần / CANCEL_POLL_SECONDS, dừng với 'cancelling' và 'cancelled'."""
+
+    def setUp(self):
+        user = User.objects.create(username='canceller')
+        self.page = ObservedPage.objects.create(user=user, name='Trang A', url='https://www.facebook.com/a',
+                                                scrape_status='running')
+
+    def test_polls_db_at_most_once_per_interval(self):
+        for status in ('cancelling', 'cancelled'):
+            with self.subTest(status=status), mock.patch('automation.tasks.time') as clock:
+                ObservedPage.objects.filter(id=self.page.id).update(scrape_status='running')
+                should_stop = page_cancel_check(self.page.id)
+                clock.monotonic.return_value = 100
+                with self.assertNumQueries(1):
+                    self.assertFalse(should_stop())
+
+                ObservedPage.objects.filter(id=self.page.id).update(scrape_status=status)
+                clock.monotonic.return_value = 100 + CANCEL_POLL_SECONDS - 0.1
+                with self.assertNumQueries(0):
+                    self.assertFalse(should_stop())
+
+                clock.monotonic.return_value = 100 + CANCEL_POLL_SECONDS
+                with self.assertNumQueries(1):
+                    self.assertTrue(should_stop())
+                # Đã huỷ → không đọc DB nữa
+                clock.monotonic.return_value = 1000
+                with self.assertNumQueries(0):
+                    self.assertTrue(should_stop())
+
+    def test_other_statuses_do_not_stop(self):
+        should_stop = page_cancel_check(self.page.id)
+        for i, status in enumerate(('queued', 'running', 'completed', 'idle'), start=1):
+            ObservedPage.objects.filter(id=self.page.id).update(scrape_status=status)
+            with self.subTest(status=status), mock.patch('automation.tasks.time') as clock:
+                clock.monotonic.return_value = i * 1000
+                with self.assertNumQueries(1):
+                    self.assertFalse(should_stop())
+
+
+class AsyncProgressTests(TransactionTestCase):
+    """Engine async báo tiến độ qua JobProgress mà không ghi DB trên event loop."""
+
+    def test_update_from_running_loop(self):
+        user = User.objects.create(username='async')
+        page = ObservedPage.objects.create(user=user, name='Trang A', url='https://www.facebook.com/a')
+        job = ScrapeJob.objects.create(user=user, page=page, status='running')
+        progress = JobProgress(job.job_id, user.id)
+
+        async def scrape():
+            await _report_progress(progress.update, 48)
+            await _report_progress(None, 60)
+
+        asyncio.run(scrape())
+        job.refresh_from_db()
+        self.assertEqual(job.progress, 48)
+
+
+class ScanCompletenessTests(SimpleTestCase):
+    """_LinkCollector.complete(): mốc quét chỉ được dời khi đã đi hết phần feed mới."""
+
+    def setUp(self):
+        self.scraper = HotPostScraper()
+
+    def _links(self, *ids):
+        return {'links': [{'href': f'/pageA/posts/{i}', 'text': '', 'card': None} for i in ids], 'cards': []}
+
+    def test_watermark_reached(self):
+        collector = _LinkCollector(self.scraper, stop_urls=['90', '91'])
+        collector.feed(self._links(1, 2, 90, 91))
+        self.assertTrue(collector.done_scrolling(0, max_posts=50))
+        self.assertEqual(collector.stop_reason, 'watermark')
+        self.assertTrue(collector.complete(50))
+        # Link vượt max_posts bị cắt → có bài chưa quét
+        self.assertFalse(collector.complete(1))
+
+    def test_feed_exhausted(self):
+        collector = _LinkCollector(self.scraper)
+        collector.feed(self._links(1, 2))
+        for i in range(4):
+            stop = collector.done_scrolling(i, max_posts=50)
+        self.assertTrue(stop)
+        self.assertEqual(collector.stop_reason, 'exhausted')
+        self.assertTrue(collector.complete(50))
+
+    def test_max_posts_cap(self):
+        collector = _LinkCollector(self.scraper)
+        collector.feed(self._links(1, 2, 3))
+        self.assertTrue(collector.done_scrolling(0, max_posts=3))
+        self.assertEqual(collector.stop_reason, 'max_posts')
+        self.assertFalse(collector.complete(3))
+
+    def test_scroll_limit(self):
+        collector = _LinkCollector(self.scraper)
+        collector.feed(self._links(1))
+        self.assertFalse(collector.done_scrolling(0, max_posts=50))
+        # Hết MAX_SCROLLS mà chưa có lý do dừng
+        self.assertFalse(collector.complete(50))
+
+
+class ScrapeProcessOutcomeTests(SimpleTestCase):
+    """iter_scrape_process() chuyển thống kê của sự kiện 'done' cho on_done."""
+
+    def test_on_done_receives_stats(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.py', delete=False) as fh:
+            fh.write(
+                'import json, sys\n'
+                'sys.stdin.read()\n'
+                'print(json.dumps({"event": "post", "post": {"post_url": "u", "posted_at": None}}), flush=True)\n'
+                'print(json.dumps({"event": "done", "stats": {"scan_complete": True}}), flush=True)\n'
+            )
+        self.addCleanup(os.remove, fh.name)
+        stats = []
+        posts = list(iter_scrape_process({}, fh.name, timeout=30, on_done=stats.append))
+        self.assertEqual(posts, [{'post_url': 'u', 'posted_at': None}])
+        self.assertEqual(stats, [{'scan_complete': True}])
+
+
+class ScrapeIterTests(SimpleTestCase):
+    """scrape_page_iter() stream bài từ thread scrape và dừng hẳn thread khi quá hạn."""
+
+    def test_timeout_stops_scrape_thread(self):
+        exited = threading.Event()
+
+        def scrape_page(account_cookies, page_url, on_post=None, should_stop=None, **kwargs):
+            # Bỏ qua deadline, chỉ dừng khi should_stop() báo
+            on_post({'post_url': 'a'})
+            while not should_stop():
+                time.sleep(0.01)
+            exited.set()
+
+        scraper = HotPostScraper()
+        with mock.patch.object(scraper, 'scrape_page', side_effect=scrape_page):
+            posts = scraper.scrape_page_iter([], 'https://www.facebook.com/a', timeout=0.2)
+            self.assertEqual(next(posts), {'post_url': 'a'})
+            with self.assertRaises(TimeoutError):
+                next(posts)
+        self.assertTrue(exited.is_set())
+
+    def test_streams_in_order(self):
+        consumed = threading.Event()
+
+        def scrape_page(account_cookies, page_url, on_post=None, should_stop=None, **kwargs):
+            on_post({'post_url': 'a'})
+            # Bài 2 chỉ được đưa ra sau khi consumer đã nhận bài 1 (không chờ hết scrape)
+            if not consumed.wait(5):
+                raise AssertionError('first post was not streamed')
+            on_post({'post_url': 'b'})
+            on_post({'post_url': 'c'})
+
+        scraper = HotPostScraper()
+        with mock.patch.object(scraper, 'scrape_page', side_effect=scrape_page):
+            posts = scraper.scrape_page_iter([], 'https://www.facebook.com/a', timeout=10)
+            first = next(posts)
+            consumed.set()
+            self.assertEqual([first['post_url']] + [p['post_url'] for p in posts], ['a', 'b', 'c'])
+
+    def test_worker_exception_propagates(self):
+        def scrape_page(account_cookies, page_url, on_post=None, should_stop=None, **kwargs):
+            on_post({'post_url': 'a'})
+            raise ValueError('boom')
+
+        scraper = HotPostScraper()
+        with mock.patch.object(scraper, 'scrape_page', side_effect=scrape_page):
+            posts = scraper.scrape_page_iter([], 'https://www.facebook.com/a', timeout=10)
+            # Bài đã parse trước khi lỗi vẫn được yield, lỗi raise lại sau bài cuối
+            self.assertEqual(next(posts), {'post_url': 'a'})
+            with self.assertRaisesRegex(ValueError, 'boom'):
+                next(posts)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class IncrementalSaveTests(TestCase):
+    """scrape_page_background_task lưu bài theo lô SAVE_BATCH_SIZE trong lúc scrape vẫn chạy."""
+
+    def setUp(self):
+        self.user = User.objects.create(username='streamer')
+        FacebookAccount.objects.create(user=self.user, name='acc', cookies='[]', status='live')
+        self.page = ObservedPage.objects.create(user=self.user, name='Trang A', url='https://www.facebook.com/a')
+
+    def test_saves_in_batches_while_streaming(self):
+        now = timezone.now()
+        stored_mid_scrape = []
+
+        def fake_iter(page, account_cookies, stop_urls, progress_callback=None, stop_before=None, outcome=None):
+            for i in range(12):
+                if i == 6:
+                    stored_mid_scrape.append(HotPost.objects.filter(page=page).count())
+                yield {'post_url': f'https://www.facebook.com/a/posts/{i}', 'caption': str(i),
+                       'posted_at': now - timedelta(hours=i), 'time_raw': f'{i} giờ',
+                       'likes': i, 'comments': 0, 'shares': 0}
+            outcome['scan_complete'] = True
+
+        batches = []
+
+        def save_posts(page, posts):
+            batches.append([p['caption'] for p in posts])
+            return save(page, posts)
+
+        save = automation_tasks._save_posts
+        with mock.patch('automation.tasks._iter_scraped_posts', fake_iter), \
+                mock.patch('automation.tasks._save_posts', side_effect=save_posts):
+            scrape_page_background_task.now(self.page.id, self.user.id)
+
+        self.assertEqual(stored_mid_scrape, [5])
+        self.assertEqual(batches, [[str(i) for i in range(0, 5)], [str(i) for i in range(5, 10)], ['10', '11']])
+        job = ScrapeJob.objects.get(page=self.page)
+        self.assertEqual((job.status, job.results_count), ('completed', 12))
+        self.assertEqual(HotPost.objects.filter(page=self.page).count(), 12)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class WatermarkAdvanceTests(TestCase):
+    """scrape_page_background_task chỉ dời mốc sau lần quét đi hết phần feed mới."""
+
+    def setUp(self):
+        self.user = User.objects.create(username='watcher')
+        FacebookAccount.objects.create(user=self.user, name='acc', cookies='[]', status='live')
+        self.page = ObservedPage.objects.create(user=self.user, name='Trang A', url='https://www.facebook.com/a')
+        self.now = timezone.now()
+
+    def _run(self, posts, scan_complete):
+        def fake_iter(page, account_cookies, stop_urls, progress_callback=None, stop_before=None, outcome=None):
+            yield from posts
+            outcome['scan_complete'] = scan_complete
+
+        with mock.patch('automation.tasks._iter_scraped_posts', fake_iter):
+            scrape_page_background_task.now(self.page.id, self.user.id)
+        self.page.refresh_from_db()
+
+    def _post(self, post_id, hours_ago, time_raw='3 giờ'):
+        return {
+            'post_url': f'https://www.facebook.com/a/posts/{post_id}', 'caption': str(post_id),
+            'posted_at': self.now - timedelta(hours=hours_ago), 'time_raw': time_raw,
+            'likes': 1, 'comments': 0, 'shares': 0,
+        }
+
+    def test_complete_scan_advances(self):
+        self._run([self._post(1, 3), self._post(2, 5)], scan_complete=True)
+        self.assertEqual(self.page.watermark_post_ids[:2], ['1', '2'])
+        self.assertEqual(self.page.watermark_posted_at, self.now - timedelta(hours=3))
+
+    def test_truncated_scan_keeps_watermark(self):
+        self._run([self._post(1, 3)], scan_complete=False)
+        self.assertEqual(self.page.scrape_status, 'completed')
+        self.assertFalse(self.page.watermark_post_ids)
+        self.assertIsNone(self.page.watermark_posted_at)
+
+    def test_fallback_time_not_used_as_watermark(self):
+        self._run([self._post(1, 0, time_raw=FALLBACK_TIME_RAW), self._post(2, 5)], scan_complete=True)
+        self.assertIn('1', self.page.watermark_post_ids)
+        self.assertEqual(self.page.watermark_posted_at, self.now - timedelta(hours=5))
@@ -1,20 +1,29 @@
+import asyncio
+import base64
+import json
 import threading
+import time
+from datetime import date, datetime
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.utils import timezone
 from django.contrib.auth.decorators import login_required
-from .models import FacebookAccount, FacebookGroup, ShareCampaign, ShareLog, ObservedPage, HotPost
+from .models import FacebookAccount, FacebookGroup, ShareCampaign, ShareLog, ObservedPage, HotPost, ScrapeJob
 from .core.fb_bot import FacebookBot
 from .core.hot_post_scraper import HotPostScraper
 import uuid
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from asgiref.sync import sync_to_async
+from django.utils.http import parse_etags
 import logging
-from automation.tasks import scrape_page_background_task
+from automation.tasks import scrape_page_background_task, cancel_page_scrapes, ACTIVE_SCRAPE_STATUSES
+from automation.post_cache import get_or_build_page
+from automation.scrape_events import aget_scrape_revision, bump_scrape_revision
 from background_task.models import Task, CompletedTask
 from django.core.management import call_command
 from background_task import background
-from django.db.models.functions import TruncDate
-from django.db.models import F
+from django.db.models import Case, Count, F, Q, Sum, When
 
 logger = logging.getLogger(__name__)
 
@@ -202,63 +211,144 @@ def api_start_scrape(request):
             return JsonResponse({'status': 'error', 'message': 'Không có tài khoản Facebook Live nào để quét.'})
 
         # Nếu đang có bất kỳ page nào đang xử lý, từ chối yêu cầu mới
-        if pages.filter(scrape_status__in=['queued', 'running']).exists():
-            return JsonResponse({'status': 'already_running', 'message': 'Đang có tiến trình quét diễn ra. Vui lòng chờ hoặc hủy trước khi chạy lại.', 'job_id': 'global'})
+        if pages.filter(scrape_status__in=ACTIVE_SCRAPE_STATUSES).exists():
+            return JsonResponse({'status': 'already_running', 'message': 'Đang có tiến trình quét diễn ra. Vui lòng chờ hoặc hủy trước khi chạy lại.', 'job_id': _latest_batch_id(request.user)})
 
-        # Đưa TẤT CẢ page vào hàng đợi
-        for p in pages:
+        # Đưa TẤT CẢ page vào hàng đợi, mỗi page 1 ScrapeJob chung batch_id.
+        # ?refresh=1 → bỏ qua mốc quét lần trước, cập nhật lại số liệu các bài gần đây
+        refresh = request.GET.get('refresh') == '1'
+        batch_id = uuid.uuid4()
+        page_list = list(pages)
+        jobs = ScrapeJob.objects.bulk_create([
+            ScrapeJob(batch_id=batch_id, user=request.user, page=p) for p in page_list
+        ])
+        for p, job in zip(page_list, jobs):
             p.scrape_status = 'queued'
             p.save()
-            scrape_page_background_task(p.id, request.user.id)
+            scrape_page_background_task(p.id, request.user.id, str(job.job_id), refresh=refresh)
+        bump_scrape_revision(request.user.id)
 
-        return JsonResponse({'status': 'success', 'job_id': 'global'})
+        return JsonResponse({'status': 'success', 'job_id': str(batch_id)})
 
     except Exception as e:
         return JsonResponse({'status': 'error', 'message': str(e)})
 
+def _scrape_status_payload(user, job_id):
+    """
+    Trạng thái gộp của job_id: 1 ScrapeJob (1 page) hoặc batch_id của 1 lần quét
+    nhiều page; 'global' = batch gần nhất của user. 1 truy vấn gộp trên ScrapeJob.
+    """
+    if job_id == 'global':
+        job_id = _latest_batch_id(user)
+    try:
+        job_id = uuid.UUID(str(job_id))
+    except ValueError:
+        return {'status': 'completed', 'progress': 100}
+
+    active = Q(status__in=['queued', 'running'])
+    stats = ScrapeJob.objects.filter(Q(job_id=job_id) | Q(batch_id=job_id), user=user).aggregate(
+        total_pages=Count('pk'),
+        in_progress=Count('pk', filter=active),
+        # Job đã kết thúc (kể cả lỗi / huỷ) tính là 100%
+        progress_sum=Sum(Case(When(active, then=F('progress')), default=100)),
+        results_count=Sum('results_count'),
+    )
+    total_pages = stats['total_pages']
+    if total_pages == 0:
+        return {'status': 'completed', 'progress': 100}
+
+    in_progress = stats['in_progress']
+    return {
+        'status': 'running' if in_progress > 0 else 'completed',
+        'progress': int(stats['progress_sum'] / total_pages),
+        'total_pages': total_pages,
+        'pages_done': total_pages - in_progress,
+        'results_count': stats['results_count'] or 0,
+    }
+
 @login_required
 def api_scrape_status(request, job_id):
-    # Tính % tiến độ dựa trên scrape_status trong Database
+    # Fallback polling cho client không dùng được api_scrape_events
     try:
-        pages = ObservedPage.objects.filter(user=request.user)
-        total_pages = pages.count()
-        if total_pages == 0:
-            return JsonResponse({'status': 'completed', 'progress': 100})
-        
-        # In progress = queued + running
-        in_progress = pages.filter(scrape_status__in=['queued', 'running']).count()
-        pages_done = total_pages - in_progress
-        progress = int((pages_done / total_pages) * 100)
-        
-        status = 'running' if in_progress > 0 else 'completed'
-            
-        return JsonResponse({
-            'status': status,
-            'progress': progress,
-            'total_pages': total_pages,
-            'pages_done': pages_done
-        })
+        return JsonResponse(_scrape_status_payload(request.user, job_id))
     except Exception as e:
         return JsonResponse({'status': 'error', 'error': str(e)})
 
+# Luồng SSE: đọc revision trong cache mỗi SSE_POLL_SECONDS, gửi comment giữ kết
+# nối sau SSE_HEARTBEAT_SECONDS im lặng, đóng sau SSE_MAX_SECONDS (EventSource tự nối lại)
+SSE_POLL_SECONDS = 1
+SSE_HEARTBEAT_SECONDS = 15
+SSE_MAX_SECONDS = 300
+SSE_RETRY_MS = 3000
+
+@login_required
+async def api_scrape_events(request, job_id):
+    """
+    Server-Sent Events cho tiến độ quét (cần chạy bằng ASGI – fb_tool/asgi.py).
+    Mỗi event `data:` có cùng nội dung với api_scrape_status và chỉ được gửi khi
+    trạng thái đổi; luồng kết thúc khi job không còn 'running'. Chạy dưới WSGI
+    trả về 204 → EventSource dừng và client quay lại poll api_scrape_status.
+    """
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+
+    user = await request.auser()
+    if job_id == 'global':
+        job_id = await sync_to_async(_latest_batch_id)(user) or job_id
+
+    async def stream():
+        yield f'retry: {SSE_RETRY_MS}\n\n'
+        revision = last_payload = None
+        first = True
+        started = last_sent = time.monotonic()
+        while time.monotonic() - started < SSE_MAX_SECONDS:
+            current = await aget_scrape_revision(user.id)
+            if first or current != revision:
+                first = False
+                revision = current
+                payload = await sync_to_async(_scrape_status_payload)(user, job_id)
+                if payload != last_payload:
+                    last_payload = payload
+                    last_sent = time.monotonic()
+                    yield f'data: {json.dumps(payload)}\n\n'
+                if payload['status'] != 'running':
+                    return
+            elif time.monotonic() - last_sent >= SSE_HEARTBEAT_SECONDS:
+                last_sent = time.monotonic()
+                yield ': ping\n\n'
+            await asyncio.sleep(SSE_POLL_SECONDS)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Không để reverse proxy (nginx) gom buffer luồng event
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+def _latest_batch_id(user):
+    """batch_id (str) của lần quét gần nhất của user, hoặc None."""
+    row = ScrapeJob.objects.filter(user=user).order_by('-created_at').values_list('batch_id', 'job_id').first()
+    if row is None:
+        return None
+    batch_id, job_id = row
+    # Job tạo ngoài api_start_scrape (auto scan, admin) không có batch
+    return str(batch_id or job_id)
+
 @login_required
 def api_cancel_scrape(request):
     """
-    Hủy khẩn cấp toàn bộ các tiến trình quét đang chạy cho User hiện tại từ Dashboard.
+    Hủy các tiến trình quét đang chạy cho User hiện tại từ Dashboard.
     """
     if request.method == 'POST':
         try:
-            import subprocess
-            user_pages = ObservedPage.objects.filter(user=request.user, scrape_status__in=['queued', 'running'])
+            user_pages = ObservedPage.objects.filter(user=request.user, scrape_status__in=ACTIVE_SCRAPE_STATUSES)
             if user_pages.exists():
-                user_pages.update(scrape_status='error')
+                page_ids = list(user_pages.values_list('id', flat=True))
                 
-                # Dọn dẹp background tasks queue
-                Task.objects.all().delete()
-                
-                # Ép đóng worker giống như ở Task Manager
-                cmd = "pkill -9 -f 'manage.py process_tasks'; pkill -9 -f 'chrome-headless'; pkill -9 -f 'playwright'; sleep 1; nohup /root/app/share_fb/venv/bin/python /root/app/share_fb/manage.py process_tasks > /var/log/process_tasks.log 2>&1 &"
-                subprocess.Popen(cmd, shell=True, executable='/bin/bash')
+                # Chỉ xoá task đang chờ & báo dừng job đang chạy của chính các page này;
+                # job tự dừng sau vài giây và lưu các bài đã lấy được. Worker, Chromium
+                # pool và job của user khác vẫn chạy tiếp
+                removed, stopping = cancel_page_scrapes(page_ids)
+                logger.info(f"Cancel scrape for user {request.user.id}: {removed} queued tasks removed, {stopping} jobs stopping.")
                 
             return JsonResponse({'status': 'success', 'message': 'Đã hủy thành công tiến trình quét.'})
         except Exception as e:
@@ -277,67 +367,144 @@ def scrape_all_pages_view(request):
 @login_required
 def hot_post_list(request):
     latest_page = ObservedPage.objects.order_by('-last_scraped_at').first()
-    is_scraping_active = ObservedPage.objects.filter(user=request.user, scrape_status__in=['queued', 'running']).exists()
+    is_scraping_active = ObservedPage.objects.filter(user=request.user, scrape_status__in=ACTIVE_SCRAPE_STATUSES).exists()
     context = {
         'latest_scraped_at': latest_page.last_scraped_at if latest_page else None,
-        'is_scraping_active': is_scraping_active
+        'is_scraping_active': is_scraping_active,
+        'active_job_id': _latest_batch_id(request.user) if is_scraping_active else None,
     }
     return render(request, 'automation/hot_post_list.html', context)
 
-@login_required
-def api_get_posts(request):
+# Cột sort thứ 2 theo kiểu sort của api_get_posts (cột 1 luôn là posted_date, cuối cùng là id)
+POST_SORT_KEYS = {
+    'time': 'posted_at',
+    'engagement': 'total_engagement',
+}
+
+
+def _encode_post_cursor(row, sort_key):
+    """Cursor mờ (base64 JSON) trỏ tới dòng cuối của trang vừa trả về."""
+    key = row[sort_key]
+    values = [
+        row['posted_date'].isoformat() if row['posted_date'] else None,
+        key.isoformat() if hasattr(key, 'isoformat') else key,
+        row['id'],
+    ]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def _decode_post_cursor(cursor, sort_key):
+    """Trả về (posted_date, sort_value, id) hoặc None nếu cursor không hợp lệ."""
     try:
-        page = int(request.GET.get('page', 1))
-    except ValueError:
-        page = 1
-    
-    sort_by = request.GET.get('sort', 'engagement')
-    
+        posted_date, key, last_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if posted_date is not None:
+            posted_date = date.fromisoformat(posted_date)
+        if sort_key == 'posted_at':
+            key = datetime.fromisoformat(key)
+        return posted_date, key, int(last_id)
+    except (ValueError, TypeError):
+        return None
+
+
+def _after_post_cursor(posted_date, key, last_id, sort_key):
+    """
+    Điều kiện keyset: các dòng đứng SAU (posted_date, key, id) theo thứ tự
+    DESC của cả 3 cột. Điều kiện posted_date <= ... đứng đầu để SQLite quét
+    index (posted_date, key) từ vị trí cursor thay vì OR nhiều index rồi sort.
+    posted_date luôn được ghi khi lưu (save / bulk upsert / migration 0008);
+    dòng posted_date NULL (xếp cuối) không nằm trong điều kiện này mà được
+    _build_posts_page đọc tiếp bằng query riêng.
+    """
+    tie = Q(**{sort_key + '__lt': key}) | Q(**{sort_key: key, 'id__lt': last_id})
+    if posted_date is None:
+        return Q(posted_date__isnull=True) & tie
+    return Q(posted_date__lte=posted_date) & (
+        Q(posted_date__lt=posted_date) | (Q(posted_date=posted_date) & tie)
+    )
+
+
+def _build_posts_page(user, sort_key, cursor):
+    """1 trang kết quả của api_get_posts (dict sẵn sàng để serialize JSON)."""
     limit = 12
-    offset = (page - 1) * limit
     
-    posts_qs = HotPost.objects.filter(page__user=request.user)
+    # Lọc theo list page_id (thay vì JOIN page__user) để SQLite đi theo index
+    # (posted_date, ...) đúng thứ tự sort và dừng sớm khi đủ 1 trang
+    page_ids = list(ObservedPage.objects.filter(user=user).values_list('id', flat=True))
+    user_posts = HotPost.objects.filter(page_id__in=page_ids)
+    posts_qs = user_posts
     
-    # Annotate with post_date for grouping
-    posts_qs = posts_qs.annotate(
-        post_date=TruncDate('posted_at')
-    )
+    # Phân trang theo cursor (keyset): trang 500 tốn như trang 1, không OFFSET
+    position = _decode_post_cursor(cursor, sort_key) if cursor else None
+    if position:
+        posts_qs = posts_qs.filter(_after_post_cursor(*position, sort_key))
     
-    if sort_by == 'time':
-        # Sort by newest day first, then newest post
-        posts_qs = posts_qs.order_by(F('post_date').desc(nulls_last=True), '-posted_at')
-    else: 
-        # Default: Sort by newest day first, then highest engagement
-        posts_qs = posts_qs.order_by(F('post_date').desc(nulls_last=True), '-total_engagement')
-        
-    total_posts = posts_qs.count()
-    posts_slice = posts_qs[offset:offset+limit]
+    # posted_date lưu sẵn trong bảng → sort đi theo index thay vì TruncDate từng dòng.
+    # sort=time: ngày mới nhất trước, rồi bài mới nhất; mặc định: rồi tương tác cao nhất.
+    # NULL xếp cuối trên mọi backend (Postgres mặc định để NULL đầu khi DESC)
+    ordering = (F('posted_date').desc(nulls_last=True), F(sort_key).desc(nulls_last=True), '-id')
+    
+    # Chỉ lấy cột cần dùng, tên page JOIN trong cùng query; lấy dư 1 dòng để biết has_next
+    def fetch(qs, count):
+        return list(qs.order_by(*ordering).values(
+            'id', 'post_url', 'content_snippet', 'posted_at', 'posted_date',
+            'likes_count', 'comments_count', 'shares_count', 'total_engagement',
+            page_name=F('page__name'),
+        )[:count])
+
+    rows = fetch(posts_qs, limit + 1)
+    if position and position[0] is not None and len(rows) <= limit:
+        # Hết dòng có posted_date sau cursor → nối các dòng posted_date NULL (xếp cuối)
+        rows += fetch(user_posts.filter(posted_date__isnull=True), limit + 1 - len(rows))
+    has_next = len(rows) > limit
+    rows = rows[:limit]
     
     results = []
-    for p in posts_slice:
+    for p in rows:
         date_str = None
-        if hasattr(p, 'post_date') and p.post_date:
-            date_str = p.post_date.isoformat()
-        elif p.posted_at:
-            date_str = p.posted_at.date().isoformat()
+        if p['posted_date']:
+            date_str = p['posted_date'].isoformat()
+        elif p['posted_at']:
+            date_str = p['posted_at'].date().isoformat()
             
         results.append({
-            'page_name': p.page.name,
-            'content_snippet': p.content_snippet,
-            'post_url': p.post_url,
-            'posted_at': p.posted_at.isoformat() if p.posted_at else None,
+            'page_name': p['page_name'],
+            'content_snippet': p['content_snippet'],
+            'post_url': p['post_url'],
+            'posted_at': p['posted_at'].isoformat() if p['posted_at'] else None,
             'post_date': date_str, # Ngày đã rút gọn để Frontend nhóm
-            'likes': p.likes_count,
-            'comments': p.comments_count,
-            'shares': p.shares_count,
-            'total_engagement': p.total_engagement
+            'likes': p['likes_count'],
+            'comments': p['comments_count'],
+            'shares': p['shares_count'],
+            'total_engagement': p['total_engagement']
         })
         
-    return JsonResponse({
+    return {
         'status': 'ok',
         'results': results,
-        'has_next': (offset + limit) < total_posts
-    })
+        'has_next': has_next,
+        'next_cursor': _encode_post_cursor(rows[-1], sort_key) if has_next else None,
+    }
+
+@login_required
+def api_get_posts(request):
+    sort_by = request.GET.get('sort', 'engagement')
+    sort_key = POST_SORT_KEYS.get(sort_by, POST_SORT_KEYS['engagement'])
+    cursor = request.GET.get('cursor')
+    
+    # Trang đã cache theo (user, version, sort, cursor); version tăng khi scrape ghi bài mới
+    body, etag = get_or_build_page(
+        request.user.id, sort_key, cursor,
+        lambda: json.dumps(_build_posts_page(request.user, sort_key, cursor)).encode(),
+    )
+    
+    # Trình duyệt gửi lại ETag (If-None-Match) → trang không đổi thì chỉ trả 304
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
 
 @login_required
 def task_manager(request):
@@ -404,16 +571,15 @@ def task_manager(request):
                     
         elif action == 'cancel_all_active':
             try:
-                import subprocess
-                # 1. Đưa các page đang treo về trạng thái lỗi/hủy
-                ObservedPage.objects.filter(scrape_status__in=['queued', 'running']).update(scrape_status='error')
+                # 1. Hủy các page đang treo và kill ngay cây process (Python + Chromium)
+                # của các job scrape đang chạy (executor 'subprocess'; executor 'thread'
+                # thì job tự dừng ở lần cuộn / bài kế tiếp); worker vẫn sống
+                active_pages = ObservedPage.objects.filter(scrape_status__in=ACTIVE_SCRAPE_STATUSES)
+                page_ids = list(active_pages.values_list('id', flat=True))
+                cancel_page_scrapes(page_ids, force=True)
                 
                 # 2. Xóa trắng hàng đợi Background Tasks
-                Task.objects.all().delete()
-                
-                # 3. Ép đóng (Kill) worker đang bị kẹt cùng với các tab Chrome ngầm, sau đó khởi động lại worker
-                cmd = "pkill -9 -f 'manage.py process_tasks'; pkill -9 -f 'chrome-headless'; pkill -9 -f 'playwright'; sleep 1; nohup /root/app/share_fb/venv/bin/python /root/app/share_fb/manage.py process_tasks > /var/log/process_tasks.log 2>&1 &"
-                subprocess.Popen(cmd, shell=True, executable='/bin/bash')
+                Task.objects.filter(locked_by__isnull=True).delete()
                 
                 messages.success(request, "Đã DỪNG KHẨN CẤP toàn bộ tiến trình quét đang chạy và làm mới hàng đợi!")
             except Exception as e:
@@ -430,6 +596,7 @@ def task_manager(request):
     
     repeat_choices = [
         (0, 'Không lặp lại (Chạy 1 lần)'),
+        (300, 'Mỗi 5 Phút'),
         (1800, 'Mỗi 30 Phút'),
         (3600, 'Mỗi 1 Giờ'),
         (7200, 'Mỗi 2 Giờ'),
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -81,13 +82,58 @@ WSGI_APPLICATION = 'fb_tool.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Web và worker `process_tasks` dùng chung db.sqlite3:
+# - WAL: đọc không bị chặn trong lúc worker đang ghi (và ngược lại)
+# - synchronous=NORMAL: đủ an toàn với WAL, bớt fsync mỗi lần commit
+# - timeout (busy timeout, giây): chờ lock thay vì lỗi "database is locked" ngay
+# - IMMEDIATE: transaction ghi lấy lock ngay từ đầu, tránh lỗi khi nâng lock giữa chừng
+SQLITE_BUSY_TIMEOUT_SECONDS = 20
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.environ.get('FB_TOOL_SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+        'OPTIONS': {
+            'timeout': SQLITE_BUSY_TIMEOUT_SECONDS,
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                'PRAGMA synchronous=NORMAL;'
+                'PRAGMA temp_store=MEMORY;'
+                'PRAGMA cache_size=-20000;'
+            ),
+        },
     }
 }
 
+# PostgreSQL (chạy nhiều worker `process_tasks` song song): đặt FB_TOOL_DB_ENGINE=postgres
+# cùng các biến POSTGRES_*. Cần `psycopg[binary,pool]`.
+# POSTGRES_POOL=1 (mặc định) dùng connection pool có sẵn của Django 5.2 (bắt buộc
+# CONN_MAX_AGE=0); POSTGRES_POOL=0 → giữ kết nối lâu dài theo CONN_MAX_AGE.
+DB_ENGINE = os.environ.get('FB_TOOL_DB_ENGINE', 'sqlite').lower()
+
+if DB_ENGINE in ('postgres', 'postgresql'):
+    _pg_pool = os.environ.get('POSTGRES_POOL', '1') not in ('0', 'false', 'no')
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'fb_tool'),
+            'USER': os.environ.get('POSTGRES_USER', 'fb_tool'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            'CONN_MAX_AGE': 0 if _pg_pool else int(os.environ.get('POSTGRES_CONN_MAX_AGE', '60')),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'pool': {
+                    'min_size': int(os.environ.get('POSTGRES_POOL_MIN', '1')),
+                    'max_size': int(os.environ.get('POSTGRES_POOL_MAX', '8')),
+                    'timeout': int(os.environ.get('POSTGRES_POOL_TIMEOUT', '10')),
+                },
+            } if _pg_pool else {},
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -130,3 +176,101 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Hot Post scraper – Chromium pool dùng chung trong worker `process_tasks`
+# Tái tạo browser sau N job hoặc khi RSS (driver + Chromium) vượt ngưỡng MB,
+# đóng hẳn nếu không có job trong IDLE_SECONDS giây.
+HOT_POST_POOL_MAX_JOBS = 20
+HOT_POST_POOL_MAX_MEMORY_MB = 900
+HOT_POST_POOL_IDLE_SECONDS = 300
+
+# Số tab chi tiết mở song song khi parse bài viết. > 1 dùng engine async
+# (AsyncHotPostScraper): không dùng pool ở trên (cùng profile Chromium) và bỏ
+# qua HOT_POST_DUAL_TAB, nên mỗi lần scrape đều khởi chạy Chromium mới.
+HOT_POST_SCRAPE_CONCURRENCY = 1
+
+# Chặn request không cần thiết khi scrape (page.route). Các giá trị mặc định nằm
+# trong automation/core/request_policy.py; ALLOW ưu tiên hơn mọi luật chặn.
+HOT_POST_BLOCK_REQUESTS = True
+HOT_POST_BLOCK_RESOURCE_TYPES = ['image', 'media', 'font', 'ping']
+HOT_POST_ALLOW_URL_PATTERNS = []
+
+# Đọc số liệu bài viết từ response GraphQL khi cuộn feed; chỉ mở trang chi tiết
+# cho bài thiếu field (thời gian, caption, like, comment, share).
+HOT_POST_INTERCEPT_FEED = False
+
+# Đọc like / comment / share ngay trên thẻ bài của feed trong lúc cuộn; chỉ mở
+# trang chi tiết cho bài mà thẻ chưa render đủ số liệu.
+HOT_POST_USE_FEED_CARDS = True
+
+# Engine sync: giữ feed ở 1 tab và mở bài chi tiết ở tab thứ 2 (dùng lại), xen kẽ
+# với việc cuộn feed. False → chế độ cũ goto bài rồi go_back về feed.
+HOT_POST_DUAL_TAB = True
+
+# Cache trang kết quả của api_get_posts (automation/post_cache.py). Backend phải
+# dùng chung giữa web và worker `process_tasks` để worker xoá được cache khi
+# ghi bài mới → không dùng LocMemCache (chỉ sống trong 1 process).
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'django_cache',
+    }
+}
+HOT_POSTS_CACHE_ALIAS = 'default'
+HOT_POSTS_CACHE_TIMEOUT = 300  # giây
+
+# Cách chạy 1 lần scrape trong worker:
+#   'thread' (mặc định): trong process worker, dùng Chromium pool ấm (không tốn
+#     vài giây khởi chạy Chromium mỗi job). Quá hạn / huỷ thì báo thread dừng
+#     ở lần cuộn / bài kế tiếp và chờ nó thoát; Chromium treo được pool dựng
+#     lại theo HOT_POST_POOL_MAX_JOBS / MAX_MEMORY_MB.
+#   'subprocess': process con riêng cho mỗi job, quá hạn / huỷ (force) thì kill
+#     đúng cây process của job đó và trả lại bộ nhớ ngay, nhưng mỗi job khởi
+#     chạy Chromium mới (không có pool ấm). Pid ghi trong HOT_POST_RUN_DIR.
+HOT_POST_SCRAPE_EXECUTOR = 'thread'
+HOT_POST_RUN_DIR = BASE_DIR / 'run'
+
+# Lịch Auto Scan (automation/scheduler.py, chạy bởi `run_auto_scan` định kỳ vài
+# phút 1 lần). Page bật is_auto_scan quét theo auto_scan_time, bỏ trống thì theo
+# HOT_POST_AUTO_SCAN_SLOTS. Mỗi page lệch 1 khoảng cố định trong cửa sổ
+# SPREAD_MINUTES sau giờ quét để các page không dồn vào cùng 1 thời điểm; hàng
+# đợi scrape không bao giờ giữ quá MAX_QUEUED task.
+HOT_POST_AUTO_SCAN_SLOTS = ['00:00', '12:00']
+HOT_POST_AUTO_SCAN_SPREAD_MINUTES = 60
+HOT_POST_AUTO_SCAN_MAX_QUEUED = 5
+
+# Auto Scan thích ứng: page không đặt auto_scan_time được quét mỗi
+# scan_interval_minutes (tính lại sau mỗi lần quét xong từ lịch sử HotPost
+# trong RATE_WINDOW_DAYS ngày) thay vì theo HOT_POST_AUTO_SCAN_SLOTS. Khoảng
+# cách ≈ thời gian để page đăng thêm TARGET_NEW_POSTS bài, rút ngắn tối đa một
+# nửa khi bài mới tăng tương tác nhanh (VELOCITY_REF lượt / giờ), giới hạn trong
+# [MIN, MAX] phút (MAX phải ngắn hơn cửa sổ max_days=1.5 ngày của mỗi lần quét
+# để không sót bài). False → mọi page quét theo giờ cố định như trước.
+HOT_POST_ADAPTIVE_SCAN = True
+HOT_POST_SCAN_INTERVAL_MIN_MINUTES = 60
+HOT_POST_SCAN_INTERVAL_MAX_MINUTES = 1440
+HOT_POST_SCAN_INTERVAL_DEFAULT_MINUTES = 720
+HOT_POST_SCAN_TARGET_NEW_POSTS = 5
+HOT_POST_SCAN_VELOCITY_REF = 200
+HOT_POST_SCAN_RATE_WINDOW_DAYS = 7
+
+# Làm mới số liệu bài còn trẻ (automation/refresh.py, chạy cùng `run_auto_scan`
+# hoặc riêng bằng `refresh_hot_posts`): mở thẳng link các bài đăng chưa quá
+# MAX_AGE_HOURS giờ để đọc lại likes / comments / shares, không cuộn feed. Mỗi
+# lần chạy đọc tối đa BUDGET bài (ưu tiên bài tăng nhanh và lâu chưa đo), mỗi
+# bài cách lần đo trước ít nhất MIN_INTERVAL_MINUTES phút. False → tắt.
+HOT_POST_REFRESH_ENABLED = True
+HOT_POST_REFRESH_MAX_AGE_HOURS = 48
+HOT_POST_REFRESH_BUDGET = 30
+HOT_POST_REFRESH_MIN_INTERVAL_MINUTES = 30
+
+# Chuỗi số liệu tương tác (EngagementSnapshot, automation/snapshots.py): mỗi lần
+# quét / làm mới ghi 1 điểm đo cho mỗi bài. `run_auto_scan` thưa điểm đo tối đa
+# 1 lần / COMPACT_INTERVAL_HOURS giờ (hoặc chạy `compact_snapshots`): bài đăng
+# chưa quá DENSE_HOURS giờ giữ mọi điểm, bài cũ hơn giữ 1 điểm mỗi
+# SPARSE_BUCKET_HOURS giờ, điểm đo cũ hơn RETENTION_DAYS ngày bị xoá.
+HOT_POST_SNAPSHOT_DENSE_HOURS = 48
+HOT_POST_SNAPSHOT_SPARSE_BUCKET_HOURS = 6
+HOT_POST_SNAPSHOT_RETENTION_DAYS = 90
+HOT_POST_SNAPSHOT_COMPACT_INTERVAL_HOURS = 24